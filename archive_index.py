@@ -0,0 +1,264 @@
+import os
+import gzip
+import json
+import lzma
+import tarfile
+import zipfile
+import fnmatch
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from archivers import BUFFER_SIZE, ArchiveError, zstandard
+
+# Written next to every archive: <archive><INDEX_SUFFIX>
+INDEX_SUFFIX = ".index.json.gz"
+INDEX_VERSION = 1
+
+
+class ArchiveIndex:
+    """Where each member of one archive is stored.
+
+    members holds one [name, offset, size, frame, checksum] per regular
+    file. For tar, offset is the member's header in the uncompressed tar
+    stream and frame the compressed frame it starts in; frames holds each
+    frame's [compressed offset, uncompressed offset], so a reader seeks to
+    the frame and decompresses about archivers.INDEX_FRAME_SIZE bytes at most to reach the
+    member. For zip, offset is the local header and frame is None. RAR
+    archives are written by WinRAR, so only names, sizes and checksums are
+    known.
+    """
+
+    def __init__(self, algorithm=None):
+        self.format = None
+        self.codec = None
+        self.algorithm = algorithm
+        self.frames = []
+        self.members = []
+        self._lock = threading.Lock()
+
+    def add(self, name, offset, size, frame=None, checksum=None):
+        with self._lock:
+            self.members.append([name, offset, size, frame, checksum])
+
+    @staticmethod
+    def path_for(archive_path):
+        return f"{archive_path}{INDEX_SUFFIX}"
+
+    def save(self, archive_path):
+        path = self.path_for(archive_path)
+        tmp_path = f"{path}.tmp"
+        data = {
+            "version": INDEX_VERSION,
+            "archive": os.path.basename(archive_path),
+            "format": self.format,
+            "codec": self.codec,
+            "algorithm": self.algorithm,
+            "frames": self.frames,
+            "members": self.members,
+        }
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, archive_path):
+        """The index of archive_path, or None if it has none"""
+        path = cls.path_for(archive_path)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            return None
+        index = cls(data["algorithm"])
+        index.format = data["format"]
+        index.codec = data["codec"]
+        index.frames = data["frames"]
+        index.members = data["members"]
+        return index
+
+    def match(self, patterns):
+        """Members whose name matches a pattern: an exact name, a glob, or a directory ending in "/" """
+        matched = []
+        for member in self.members:
+            name = member[0]
+            for pattern in patterns:
+                if pattern.endswith("/"):
+                    if name.startswith(pattern):
+                        break
+                elif name == pattern or fnmatch.fnmatchcase(name, pattern):
+                    break
+            else:
+                continue
+            matched.append(member)
+        return matched
+
+
+def _open_frame(archive_path, codec, compressed_offset):
+    """Decompressed stream of a tar archive starting at one of its frames"""
+    raw = open(archive_path, "rb", buffering=BUFFER_SIZE)
+    raw.seek(compressed_offset)
+    if codec == "gz":
+        return gzip.GzipFile(fileobj=raw, mode="rb"), raw
+    if codec == "xz":
+        return lzma.LZMAFile(raw, "rb"), raw
+    if codec == "zst":
+        if zstandard is None:
+            raise ArchiveError("zstd codec needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True), raw
+    return raw, raw
+
+
+def _skip(stream, count):
+    while count > 0:
+        block = stream.read(min(count, BUFFER_SIZE))
+        if not block:
+            raise ArchiveError("Archive ends before an indexed member")
+        count -= len(block)
+
+
+def _check(path, algorithm, expected):
+    """Problem text if the restored file does not match its indexed checksum"""
+    if not (algorithm and expected):
+        return None
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+            digest.update(block)
+    return None if digest.hexdigest() == expected else "checksum mismatch"
+
+
+def _target_path(target_dir, name):
+    return os.path.join(target_dir, *name.split("/"))
+
+
+def _record(target_dir, index, member, restored, problems):
+    """Count an extracted member as restored once its checksum matches"""
+    problem = _check(_target_path(target_dir, member[0]), index.algorithm, member[4])
+    if problem:
+        problems.append(f"{member[0]}: {problem}")
+    else:
+        restored.append(member[0])
+
+
+def _restore_tar_frame(archive_path, index, members, target_dir):
+    """Extract members that start in one frame, in one sequential pass from the frame start"""
+    frame = members[0][3]
+    compressed_offset, uncompressed_offset = index.frames[frame] if index.frames else (0, 0)
+    wanted = {member[0]: member for member in members}
+    restored = []
+    problems = []
+    stream, raw = _open_frame(archive_path, index.codec, compressed_offset)
+    try:
+        _skip(stream, members[0][1] - uncompressed_offset)
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for info in tar:
+                member = wanted.pop(info.name, None)
+                if member is None:
+                    continue
+                try:
+                    tar.extract(info, target_dir, filter="data")
+                except OSError as e:
+                    problems.append(f"{info.name}: {str(e)}")
+                else:
+                    _record(target_dir, index, member, restored, problems)
+                if not wanted:
+                    break
+    finally:
+        stream.close()
+        raw.close()
+    problems.extend(f"{name}: not found at its indexed offset" for name in wanted)
+    return restored, problems
+
+
+def _restore_zip_members(archive_path, index, members, target_dir):
+    restored = []
+    problems = []
+    with zipfile.ZipFile(archive_path) as zf:
+        for member in members:
+            zinfo = zf.getinfo(member[0])
+            if zinfo.header_offset != member[1]:
+                problems.append(f"{member[0]}: not found at its indexed offset")
+                continue
+            # ZipFile seeks straight to the member's local header
+            try:
+                zf.extract(zinfo, target_dir)
+            except OSError as e:
+                problems.append(f"{member[0]}: {str(e)}")
+            else:
+                _record(target_dir, index, member, restored, problems)
+    return restored, problems
+
+
+def _restore_rar_members(archive_path, index, members, target_dir, winrar_path):
+    """WinRAR finds the members itself; the index only says which archive holds them"""
+    if not winrar_path or not os.path.exists(winrar_path):
+        raise OSError(f"WinRAR is needed to extract from {os.path.basename(archive_path)}")
+    list_file = os.path.join(target_dir, f".{os.path.basename(archive_path)}.restore.lst")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for member in members:
+            f.write(member[0].replace("/", os.sep) + "\n")
+    try:
+        result = subprocess.run(
+            [winrar_path, "x", "-y", "-o+", archive_path, f"@{list_file}", target_dir + os.sep],
+            stdout=subprocess.DEVNULL
+        )
+    finally:
+        os.remove(list_file)
+    if result.returncode != 0:
+        return [], [f"{os.path.basename(archive_path)}: WinRAR failed (Error code: {result.returncode})"]
+    restored = []
+    problems = []
+    for member in members:
+        _record(target_dir, index, member, restored, problems)
+    return restored, problems
+
+
+def restore_members(backup_dir, archive_names, patterns, target_dir, winrar_path=None, max_workers=None):
+    """Extract the members matching patterns from the indexed archives into target_dir.
+
+    Tar members are read from their frame, zip members through the central
+    directory, both without reading the rest of the archive. The work is
+    split per tar frame, slice of zip members or RAR archive and done in parallel.
+    Returns (names restored intact, problems).
+    """
+    max_workers = max_workers or min(32, os.cpu_count() or 1)
+    tasks = []
+    directories = {target_dir}
+    for archive_name in archive_names:
+        archive_path = os.path.join(backup_dir, archive_name)
+        index = ArchiveIndex.load(archive_path)
+        if index is None:
+            raise FileNotFoundError(f"{archive_name} has no member index")
+        members = index.match(patterns)
+        if not members:
+            continue
+        directories.update(os.path.dirname(_target_path(target_dir, member[0])) for member in members)
+        if index.format == "tar":
+            frames = {}
+            for member in sorted(members, key=lambda member: member[1]):
+                frames.setdefault(member[3], []).append(member)
+            tasks.extend((_restore_tar_frame, archive_path, index, group, target_dir) for group in frames.values())
+        elif index.format == "zip":
+            # Interleaved slices, one ZipFile (one central directory read) each
+            tasks.extend(
+                (_restore_zip_members, archive_path, index, members[start::max_workers], target_dir)
+                for start in range(min(max_workers, len(members)))
+            )
+        else:
+            tasks.append((_restore_rar_members, archive_path, index, members, target_dir, winrar_path))
+
+    # tarfile and zipfile create missing parents without exist_ok, which
+    # races when tasks extract into the same directory
+    for directory in sorted(directories):
+        os.makedirs(directory, exist_ok=True)
+    restored = []
+    problems = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for task_restored, task_problems in pool.map(lambda task: task[0](*task[1:]), tasks):
+            restored.extend(task_restored)
+            problems.extend(task_problems)
+    return restored, problems
+
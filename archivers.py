@@ -0,0 +1,840 @@
+import os
+import re
+import stat
+import codecs
+import time
+import zlib
+import gzip
+import lzma
+import threading
+import shutil
+import tarfile
+import zipfile
+import subprocess
+from compression_policy import STORE, TEXT, DEFAULT
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional
+    zstandard = None
+
+# Read/write block size of the streaming engines. Large blocks keep the
+# syscall count low so throughput stays close to the disk's.
+BUFFER_SIZE = 1024 * 1024
+
+# Tar codecs: name -> (file extension, default level)
+TAR_CODECS = {
+    "none": (".tar", None),
+    "gz": (".tar.gz", 6),
+    "xz": (".tar.xz", 1),
+    "zst": (".tar.zst", 3),
+}
+
+# zstd when the optional package is installed, gzip otherwise
+DEFAULT_TAR_CODEC = "zst" if zstandard is not None else "gz"
+
+# Levels per compression policy class: codec -> (store, text, default).
+# The default class uses the configured level instead when one is set.
+# xz has no store preset (even 0 runs the match finder), so its store
+# class is written uncompressed, as stored LZMA2 chunks (XZ_STORE).
+XZ_STORE = None
+TAR_POLICY_LEVELS = {
+    "gz": (0, 9, 1),
+    "xz": (XZ_STORE, 3, 1),
+    "zst": (1, 12, 3),
+}
+ZIP_POLICY_LEVELS = {
+    "deflate": (9, 1),   # (text, default); the store class is ZIP_STORED
+    "bz2": (9, 1),
+}
+WINRAR_TEXT_LEVEL = 5
+
+# Tar members smaller than this never switch a frame to the store level;
+# a compressible member leaves a store frame whatever its size
+POLICY_FRAME_MIN_SIZE = 64 * 1024
+
+# With a member index, the tar engine starts a new frame at the next member
+# once this many uncompressed bytes went into the current one, so a restore
+# decompresses at most about this much to reach any member
+INDEX_FRAME_SIZE = 4 * 1024 * 1024
+
+# Zip codecs: name -> zipfile compression method
+ZIP_CODECS = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bz2": zipfile.ZIP_BZIP2,
+    "xz": zipfile.ZIP_LZMA,
+}
+
+
+class ArchiveError(Exception):
+    """Raised when an archiver backend is misconfigured or unavailable"""
+
+
+class Archiver:
+    """Base class for archiver backends.
+
+    A backend turns one source folder into one archive file. create() returns
+    a process-style exit code (0 for success) and calls
+    progress(done_bytes, files_done, current_file) from the calling thread
+    while it works; done_bytes counts source bytes read, not archive bytes. When files is given, only those
+    paths (relative to folder_path, "/"-separated) are archived. policy is
+    an optional CompressionPolicy that picks the compression per file,
+    checksums an optional FileChecksums that receives the hash of every
+    file as it is read, governor an optional ResourceGovernor that paces
+    the I/O and pauses outside the backup window, and index an optional
+    ArchiveIndex that receives where every file is stored.
+    """
+
+    name = None
+    extension = ""
+
+    def archive_name(self, folder):
+        return f"{folder}{self.extension}"
+
+    def check(self):
+        """Raise ArchiveError if the backend cannot run on this machine"""
+
+    def create(self, folder_path, archive_path, progress=None, files=None, policy=None,
+               checksums=None, governor=None, index=None):
+        raise NotImplementedError
+
+
+class WinRarArchiver(Archiver):
+    """Runs WinRAR (or the console rar) as a low-priority subprocess"""
+
+    name = "winrar"
+    extension = ".rar"
+
+    def __init__(self, executable, level=1):
+        self.executable = executable
+        self.level = 1 if level is None else int(level)
+
+    def check(self):
+        if not self.executable or not os.path.exists(self.executable):
+            raise ArchiveError("Invalid WinRAR path!")
+
+    def build_command(self, folder_path, archive_path, list_file=None, level=None, store_extensions=None,
+                      sleep_ms=0, executable=None):
+        # Build WinRAR command with more performance-friendly settings
+        cmd = [
+            executable or self.executable,
+            "a",                    # Add to archive
+        ]
+        if list_file is None:
+            cmd += [
+                "-r",               # Recurse subdirectories
+                "-ep1",             # Exclude base directory
+            ]
+        if os.name == "nt" and executable is None:
+            cmd.append("-ibck")     # Run in background (WinRAR only)
+        if store_extensions:
+            # Store these file types without compressing them
+            cmd.append("-ms" + ";".join(sorted(ext.lstrip(".") for ext in store_extensions)))
+        if sleep_ms:
+            cmd.append(f"-ri0:{sleep_ms}")  # Sleep between I/O operations (default priority)
+        cmd += [
+            "-y",                   # Assume yes on all queries
+            f"-m{self.level if level is None else level}",  # Compression level (-m1 is fastest, less CPU intensive)
+            "-dh",                  # Disable hard links processing
+            "-oi",                  # Disable "save NTFS security info"
+            "-ol",                  # Store symbolic links as links
+            "-os",                  # Save NTFS alternate streams
+            archive_path,
+        ]
+        if list_file is None:
+            cmd.append(folder_path)
+        else:
+            # Names in the list are relative to the folder's parent, so
+            # they keep the same layout as a full -ep1 archive
+            cmd.append(f"@{list_file}")
+        return cmd
+
+    def _policy_settings(self, folder_path, files, policy):
+        """Archive-wide level and -ms list; RAR has no per-file levels.
+
+        Files are classified by name only, since WinRAR reads them itself.
+        Folders that are mostly text by size get WINRAR_TEXT_LEVEL.
+        """
+        if files is None:
+            entries = _walk(folder_path)
+        else:
+            entries = _walk_files(folder_path, files)
+        class_bytes = {STORE: 0, TEXT: 0, DEFAULT: 0}
+        file_count = 0
+        for path, _ in entries:
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                compression_class = policy.classify_name(path) or DEFAULT
+                policy.record(compression_class, st.st_size)
+                class_bytes[compression_class] += st.st_size
+                file_count += 1
+        level = None
+        if class_bytes[TEXT] > class_bytes[DEFAULT]:
+            level = max(self.level, WINRAR_TEXT_LEVEL)
+        return level, policy.store_extensions, (file_count, sum(class_bytes.values()))
+
+    def console_executable(self):
+        """Console rar for progress output: the executable itself, or the Rar.exe installed next to WinRAR.exe"""
+        directory, name = os.path.split(self.executable)
+        if os.path.splitext(name)[0].lower() == "rar":
+            return self.executable
+        for candidate in ("Rar.exe", "rar"):
+            path = os.path.join(directory, candidate)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _process_options(self):
+        if os.name == "nt":
+            # Configure process for minimal impact
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            return {
+                "startupinfo": startupinfo,
+                "creationflags": subprocess.CREATE_NO_WINDOW | subprocess.BELOW_NORMAL_PRIORITY_CLASS,
+            }
+        return {"stdout": subprocess.DEVNULL}
+
+    def test(self, archive_path):
+        """Test an existing archive with WinRAR; returns its exit code"""
+        cmd = [self.executable, "t", "-y"]
+        if os.name == "nt":
+            cmd.append("-ibck")
+        cmd.append(archive_path)
+        return subprocess.run(cmd, **self._process_options()).returncode
+
+    def create(self, folder_path, archive_path, progress=None, files=None, policy=None,
+               checksums=None, governor=None, index=None):
+        level, store_extensions, totals = None, None, None
+        if policy is not None:
+            level, store_extensions, totals = self._policy_settings(folder_path, files, policy)
+
+        # Console rar reports the overall percentage; WinRAR.exe shows it only in its window
+        console = self.console_executable() if progress else None
+        if console is not None and totals is None:
+            totals = _count_files(_walk(folder_path) if files is None else _walk_files(folder_path, files))
+
+        list_file = None
+        kwargs = {}
+        if files is not None:
+            base = os.path.basename(os.path.normpath(folder_path))
+            list_file = f"{archive_path}.lst"
+            with open(list_file, "w", encoding="utf-8") as f:
+                for rel_path in files:
+                    if rel_path.endswith("/"):
+                        continue  # WinRAR would add everything below a listed directory
+                    f.write(os.path.join(base, *rel_path.split("/")) + "\n")
+            kwargs["cwd"] = os.path.dirname(os.path.normpath(folder_path))
+        kwargs.update(self._process_options())
+
+        hasher = None
+        if checksums is not None:
+            # WinRAR reads the files itself; hash them alongside it while
+            # they are in the page cache
+            entries = _walk(folder_path) if files is None else _walk_files(folder_path, files)
+            hasher = threading.Thread(target=_hash_files, args=(entries, checksums), daemon=True)
+            hasher.start()
+
+        try:
+            sleep_ms = governor.winrar_sleep_ms if governor is not None else 0
+            if console is not None:
+                kwargs["stdout"] = subprocess.PIPE
+            process = subprocess.Popen(
+                self.build_command(
+                    folder_path, archive_path, list_file, level, store_extensions, sleep_ms, executable=console
+                ),
+                **kwargs
+            )
+            output = _RarOutput(process.stdout) if console is not None else None
+
+            # Monitor progress without blocking
+            while process.poll() is None:
+                time.sleep(0.5)  # Longer sleep to reduce CPU usage
+                if governor is not None:
+                    governor.hold(process)
+                if output is not None:
+                    file_count, total_bytes = totals
+                    fraction = output.fraction(file_count)
+                    progress(int(total_bytes * fraction), min(output.files_done, file_count), output.current)
+                elif progress and os.path.exists(archive_path):
+                    # Fallback: archive bytes written, off by the compression ratio
+                    try:
+                        progress(os.path.getsize(archive_path))
+                    except OSError:
+                        pass
+            if output is not None:
+                output.join()
+        finally:
+            if hasher is not None:
+                hasher.join()
+            if list_file:
+                os.remove(list_file)
+        if index is not None and process.returncode in (0, 1):
+            # WinRAR lays out the archive itself, so only names are indexed
+            index.format = "rar"
+            entries = _walk(folder_path) if files is None else _walk_files(folder_path, files)
+            for path, arcname in entries:
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    index.add(arcname, None, st.st_size, checksum=checksums.files.get(arcname) if checksums is not None else None)
+        return process.returncode
+
+
+def _count_files(entries):
+    """(file count, bytes) of the regular files among (path, arcname) entries"""
+    count, size = 0, 0
+    for path, _ in entries:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            count += 1
+            size += st.st_size
+    return count, size
+
+
+# "Adding    <name>   <progress>" lines of console rar; the name is padded with spaces
+_RAR_ADDING = re.compile(r"^\s*(?:Adding|Updating)\s+(.*?)\s*(?:\d{1,3}%)?\s*(?:OK)?\s*$")
+_RAR_PERCENT = re.compile(r"(\d{1,3})%")
+
+
+class _RarOutput:
+    """Follows console rar's output on a reader thread.
+
+    rar prints one "Adding" line per file, ending in OK once the file is
+    stored, and rewrites the overall percentage in place with backspaces.
+    """
+
+    def __init__(self, stream):
+        self.files_done = 0
+        self.current = None
+        self.percent = None
+        self._thread = threading.Thread(target=self._read, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def fraction(self, file_count):
+        """Share of the job done: the percentage, or finished files when rar prints none"""
+        if self.percent is not None:
+            return min(self.percent / 100, 1.0)
+        return min(self.files_done / file_count, 1.0) if file_count else 0.0
+
+    def join(self):
+        self._thread.join()
+
+    def _read(self, stream):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            data = stream.read1(BUFFER_SIZE)
+            if not data:
+                break
+            pending += decoder.decode(data).replace("\r", "\n")
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                self._parse(line, complete=True)
+            self._parse(pending, complete=False)
+        stream.close()
+
+    def _parse(self, text, complete):
+        head, _, rest = text.partition("\b")
+        match = _RAR_ADDING.match(head)
+        if match is None:
+            return
+        self.current = match.group(1)
+        percents = _RAR_PERCENT.findall(head[match.end(1):] + rest)
+        if percents:
+            self.percent = int(percents[-1])
+        if complete and text.rstrip().endswith("OK"):
+            self.files_done += 1
+
+
+class _ProgressReader:
+    """Wraps a source file and reports the bytes read through it.
+
+    When digest is given, everything read is also fed into it.
+    """
+
+    def __init__(self, fileobj, on_read, digest=None):
+        self._fileobj = fileobj
+        self._on_read = on_read
+        self._digest = digest
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        if data:
+            if self._digest is not None:
+                self._digest.update(data)
+            self._on_read(len(data))
+        return data
+
+
+def _hash_files(entries, checksums):
+    """Hash the regular files among (path, arcname) entries into checksums"""
+    for path, arcname in entries:
+        try:
+            if not stat.S_ISREG(os.lstat(path).st_mode):
+                continue
+            digest = checksums.new()
+            with open(path, "rb", buffering=0) as f:
+                for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                    digest.update(block)
+        except OSError:
+            continue
+        checksums.add(arcname, digest)
+
+
+def _xz_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+class _XzStoreCompressor:
+    """compressobj-like writer of one xz stream holding the data uncompressed.
+
+    The data goes into a single block as stored LZMA2 chunks, so any xz
+    reader decodes it without a match finder ever running on the writer.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    # CRC32 check; LZMA2 filter with a 64 KiB dictionary, padded to 12 bytes
+    STREAM_FLAGS = b"\x00\x01"
+    BLOCK_HEADER = b"\x02\x00\x21\x01\x08\x00\x00\x00"
+
+    def __init__(self):
+        self._crc = 0
+        self._size = 0
+        self._chunks = 0  # bytes of LZMA2 chunks written so far
+
+    def compress(self, data):
+        out = []
+        if not self._size and data:
+            header = self.BLOCK_HEADER + zlib.crc32(self.BLOCK_HEADER).to_bytes(4, "little")
+            out.append(b"\xfd7zXZ\x00" + self.STREAM_FLAGS + zlib.crc32(self.STREAM_FLAGS).to_bytes(4, "little"))
+            out.append(header)
+        view = memoryview(data)
+        for start in range(0, len(view), self.CHUNK_SIZE):
+            chunk = view[start:start + self.CHUNK_SIZE]
+            # 0x01 resets the dictionary at the first chunk, 0x02 continues
+            control = b"\x01" if not self._size else b"\x02"
+            out.append(control + (len(chunk) - 1).to_bytes(2, "big"))
+            out.append(bytes(chunk))
+            self._crc = zlib.crc32(chunk, self._crc)
+            self._size += len(chunk)
+            self._chunks += 3 + len(chunk)
+        return b"".join(out)
+
+    def flush(self):
+        if not self._size:
+            # An empty stream: no block, an index without records
+            index = b"\x00\x00\x00\x00"
+            out = [b"\xfd7zXZ\x00" + self.STREAM_FLAGS + zlib.crc32(self.STREAM_FLAGS).to_bytes(4, "little")]
+        else:
+            compressed = self._chunks + 1  # with the end marker
+            out = [b"\x00" + b"\x00" * (-compressed % 4) + self._crc.to_bytes(4, "little")]
+            unpadded = 12 + compressed + 4
+            index = b"\x00\x01" + _xz_varint(unpadded) + _xz_varint(self._size)
+            index += b"\x00" * (-len(index) % 4)
+        index += zlib.crc32(index).to_bytes(4, "little")
+        backward = (len(index) // 4 - 1).to_bytes(4, "little") + self.STREAM_FLAGS
+        out.append(index)
+        out.append(zlib.crc32(backward).to_bytes(4, "little") + backward + b"YZ")
+        return b"".join(out)
+
+
+class _CodecWriter:
+    """Write-only file object that compresses into a buffered output file.
+
+    tell() reports uncompressed bytes written, which is what tarfile expects
+    from the stream it writes to. Memory use is bounded by the output buffer
+    plus the codec's own window.
+    """
+
+    def __init__(self, path, codec, level, governor=None):
+        self._raw = open(path, "wb", buffering=BUFFER_SIZE)
+        if governor is not None:
+            self._raw = governor.writer(self._raw)
+        self._position = 0
+        self._written = 0
+        self._codec = codec
+        # [compressed offset, uncompressed offset] where each frame starts
+        self.frames = []
+        self._start_frame(level)
+
+    def _start_frame(self, level):
+        codec = self._codec
+        self.level = level
+        self._frame_start = self._position
+        self.frames.append([self._written, self._position])
+        if codec == "gz":
+            # wbits=31 produces a gzip container readable by gzip/tar
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif codec == "xz" and level is XZ_STORE:
+            self._compressor = _XzStoreCompressor()
+        elif codec == "xz":
+            self._compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)
+        elif codec == "zst":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = None
+
+    def restart(self, level):
+        """Continue in a new compressed frame at another level.
+
+        gzip members, xz streams and zstd frames may be concatenated, so
+        the archive still reads as one stream.
+        """
+        if self._compressor is None or level == self.level:
+            return
+        self.new_frame(level)
+
+    def new_frame(self, level=None):
+        """End the current frame so decompression can start here; a no-op at a frame start"""
+        if self._position == self._frame_start:
+            return
+        if self._compressor is not None:
+            self._emit(self._compressor.flush())
+        self._start_frame(self.level if level is None else level)
+
+    @property
+    def frame_bytes(self):
+        """Uncompressed bytes written into the current frame"""
+        return self._position - self._frame_start
+
+    def _emit(self, out):
+        self._written += len(out)
+        self._raw.write(out)
+
+    def write(self, data):
+        self._position += len(data)
+        if self._compressor is None:
+            self._emit(data)
+        else:
+            out = self._compressor.compress(data)
+            if out:
+                self._emit(out)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self._raw.closed:
+            return
+        try:
+            if self._compressor is not None:
+                self._raw.write(self._compressor.flush())
+        finally:
+            self._raw.close()
+
+
+def open_tar_stream(archive_path):
+    """Decompressed, sequential file object of a tar archive written here.
+
+    Reads every concatenated gzip member, xz stream or zstd frame, which
+    tarfile's own stream mode does not.
+    """
+    for codec, (extension, _) in TAR_CODECS.items():
+        if codec != "none" and archive_path.endswith(extension):
+            break
+    else:
+        return open(archive_path, "rb", buffering=BUFFER_SIZE)
+    if codec == "gz":
+        return gzip.open(archive_path, "rb")
+    if codec == "xz":
+        return lzma.open(archive_path, "rb")
+    if zstandard is None:
+        raise ArchiveError("zstd codec needs the 'zstandard' package")
+    raw = open(archive_path, "rb", buffering=BUFFER_SIZE)
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+
+
+def _walk(folder_path):
+    """Yield (path, arcname) for the folder itself and everything below it.
+
+    Arc names start with the folder name, matching WinRAR's -ep1 layout.
+    """
+    base = os.path.basename(os.path.normpath(folder_path))
+    stack = [(folder_path, base)]
+    while stack:
+        path, arcname = stack.pop()
+        yield path, arcname
+        try:
+            with os.scandir(path) as entries:
+                children = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in children:
+            child_arcname = f"{arcname}/{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((entry.path, child_arcname))
+            else:
+                yield entry.path, child_arcname
+        stack.extend(reversed(subdirs))
+
+
+def _walk_files(folder_path, files):
+    """Yield (path, arcname) for the given relative paths only.
+
+    Directories are listed with a trailing "/", which their path keeps.
+    """
+    base = os.path.basename(os.path.normpath(folder_path))
+    for rel_path in files:
+        yield os.path.join(folder_path, *rel_path.split("/")), f"{base}/{rel_path.rstrip('/')}"
+
+
+class _StreamingArchiver(Archiver):
+    """Shared walk/progress logic of the in-process engines"""
+
+    def create(self, folder_path, archive_path, progress=None, files=None, policy=None,
+               checksums=None, governor=None, index=None):
+        done = [0]
+        files_done = 0
+        current = None
+
+        def on_read(count):
+            if governor is not None:
+                governor.read(count)
+            done[0] += count
+            if progress:
+                progress(done[0], files_done, current)
+
+        skipped = 0
+        with self._open(archive_path, governor) as writer:
+            if files is None:
+                entries = _walk(folder_path)
+            else:
+                entries = _walk_files(folder_path, files)
+            for path, arcname in entries:
+                current = arcname
+                if not self._add(writer, path, arcname, on_read, policy, checksums, index):
+                    skipped += 1
+                elif progress and not (path.endswith(os.sep) if files is not None else os.path.isdir(path)):
+                    files_done += 1
+                    progress(done[0], files_done, current)
+            if index is not None:
+                self._finish_index(writer, index)
+        # Mirror RAR's exit code 1: finished, but some files were skipped
+        return 1 if skipped else 0
+
+    def _finish_index(self, writer, index):
+        """Record the archive layout in index once every member is written"""
+
+
+class TarArchiver(_StreamingArchiver):
+    """Streams a tar archive through an optional gzip/xz/zstd codec"""
+
+    name = "tar"
+
+    def __init__(self, codec=DEFAULT_TAR_CODEC, level=None):
+        if codec not in TAR_CODECS:
+            raise ArchiveError(f"Unknown tar codec: {codec}")
+        self.codec = codec
+        self.extension, default_level = TAR_CODECS[codec]
+        self.level = default_level if level is None else int(level)
+        self.level_set = level is not None
+
+    def check(self):
+        if self.codec == "zst" and zstandard is None:
+            raise ArchiveError("zstd codec needs the 'zstandard' package")
+
+    def _open(self, archive_path, governor=None):
+        stream = _CodecWriter(archive_path, self.codec, self.level, governor)
+        try:
+            tar = tarfile.open(
+                fileobj=stream, mode="w", format=tarfile.PAX_FORMAT,
+                copybufsize=BUFFER_SIZE
+            )
+        except Exception:
+            stream.close()
+            raise
+        return _TarWriter(tar, stream)
+
+    def _policy_level(self, compression_class):
+        store, text, fast = TAR_POLICY_LEVELS[self.codec]
+        if compression_class == STORE:
+            return store
+        if compression_class == TEXT:
+            return max(text, self.level)
+        return self.level if self.level_set else fast
+
+    def _add(self, writer, path, arcname, on_read, policy=None, checksums=None, index=None):
+        """Add one entry; returns False if it could not be opened.
+
+        Errors after the member header is written would leave a truncated
+        member behind, so those propagate and fail the whole archive.
+        """
+        try:
+            info = writer.tar.gettarinfo(path, arcname)
+            if info is None:
+                return True  # sockets, devices and the like are not archived
+            src = open(path, "rb", buffering=0) if info.isreg() else None
+        except OSError:
+            return False
+        if src is None:
+            writer.tar.addfile(info)
+            return True
+        with src:
+            if policy is not None:
+                compression_class = policy.classify(path, info.size, src)
+                if self.codec in TAR_POLICY_LEVELS:
+                    level = self._policy_level(compression_class)
+                    store = TAR_POLICY_LEVELS[self.codec][0]
+                    if info.size >= POLICY_FRAME_MIN_SIZE or (level != store and writer.stream.level == store):
+                        writer.stream.restart(level)
+            if index is not None and writer.stream.frame_bytes >= INDEX_FRAME_SIZE:
+                writer.stream.new_frame()
+            offset = writer.tar.offset
+            digest = checksums.new() if checksums is not None else None
+            writer.tar.addfile(info, _ProgressReader(src, on_read, digest))
+        if digest is not None:
+            checksums.add(arcname, digest)
+        if index is not None:
+            index.add(
+                arcname, offset, info.size, len(writer.stream.frames) - 1,
+                digest.hexdigest() if digest is not None else None
+            )
+        return True
+
+    def _finish_index(self, writer, index):
+        index.format = "tar"
+        index.codec = self.codec
+        index.frames = writer.stream.frames
+
+
+class _TarWriter:
+    def __init__(self, tar, stream):
+        self.tar = tar
+        self.stream = stream
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.tar.close()
+        finally:
+            self.stream.close()
+
+
+def _set_zip_level(zinfo, level):
+    # ZipInfo only exposes the per-member level publicly from Python 3.13
+    if hasattr(zinfo, "compress_level"):
+        zinfo.compress_level = level
+    else:
+        zinfo._compresslevel = level
+
+
+class ZipArchiver(_StreamingArchiver):
+    """Writes a zip archive member by member with large copy buffers"""
+
+    name = "zip"
+    extension = ".zip"
+
+    def __init__(self, codec="deflate", level=None):
+        if codec not in ZIP_CODECS:
+            raise ArchiveError(f"Unknown zip codec: {codec}")
+        self.codec = codec
+        self.compression = ZIP_CODECS[codec]
+        self.level = None if level is None else int(level)
+
+    def _open(self, archive_path, governor=None):
+        raw = open(archive_path, "wb", buffering=BUFFER_SIZE)
+        try:
+            target = governor.writer(raw) if governor is not None else raw
+            return _ZipWriter(zipfile.ZipFile(target, "w", self.compression, allowZip64=True), raw)
+        except Exception:
+            raw.close()
+            raise
+
+    def _policy_member(self, zinfo, compression_class):
+        if compression_class == STORE:
+            zinfo.compress_type = zipfile.ZIP_STORED
+            return
+        zinfo.compress_type = self.compression
+        if self.codec in ZIP_POLICY_LEVELS:
+            text, fast = ZIP_POLICY_LEVELS[self.codec]
+            if compression_class == TEXT:
+                _set_zip_level(zinfo, max(text, self.level or 0))
+            else:
+                _set_zip_level(zinfo, fast if self.level is None else self.level)
+        elif self.level is not None:
+            _set_zip_level(zinfo, self.level)
+
+    def _add(self, writer, path, arcname, on_read, policy=None, checksums=None, index=None):
+        """Add one entry; returns False if it could not be opened"""
+        try:
+            st = os.lstat(path)
+            if not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode)):
+                return True  # zip has no portable encoding for links or devices
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            src = None if zinfo.is_dir() else open(path, "rb", buffering=0)
+        except OSError:
+            return False
+        if src is None:
+            writer.zip.writestr(zinfo, b"")
+            return True
+        if policy is not None:
+            self._policy_member(zinfo, policy.classify(path, zinfo.file_size, src))
+        else:
+            zinfo.compress_type = self.compression
+            if self.level is not None:
+                _set_zip_level(zinfo, self.level)
+        digest = checksums.new() if checksums is not None else None
+        with src, writer.zip.open(zinfo, "w") as dest:
+            shutil.copyfileobj(_ProgressReader(src, on_read, digest), dest, BUFFER_SIZE)
+        if digest is not None:
+            checksums.add(arcname, digest)
+        if index is not None:
+            index.add(
+                arcname, zinfo.header_offset, zinfo.file_size, None,
+                digest.hexdigest() if digest is not None else None
+            )
+        return True
+
+    def _finish_index(self, writer, index):
+        index.format = "zip"
+
+
+class _ZipWriter:
+    def __init__(self, zip_file, raw):
+        self.zip = zip_file
+        self.raw = raw
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.zip.close()
+        finally:
+            self.raw.close()
+
+
+ARCHIVERS = ("winrar", "tar", "zip")
+
+# Every archive file extension the backends write
+ARCHIVE_EXTENSIONS = (".rar", ".zip") + tuple(extension for extension, _ in TAR_CODECS.values())
+
+
+def create_archiver(name, winrar_path=None, codec=None, level=None):
+    """Build an archiver backend from backup_config.json style settings"""
+    if name == "winrar":
+        return WinRarArchiver(winrar_path, level)
+    if name == "tar":
+        return TarArchiver(codec or DEFAULT_TAR_CODEC, level)
+    if name == "zip":
+        return ZipArchiver(codec or "deflate", level)
+    raise ArchiveError(f"Unknown archiver: {name}")
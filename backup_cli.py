@@ -0,0 +1,670 @@
+"""Headless command line for the DevOps Monthly Backup Tool.
+
+Runs the same pipeline as the GUI without importing Tk, so it starts quickly
+from cron, Task Scheduler or a systemd timer:
+
+    python backup_cli.py backup --source D:/Projects --destination E:/Backups --all
+    python backup_cli.py backup --json            # folders from backup_config.json
+    python backup_cli.py backup --resume          # continue an interrupted run
+    python backup_cli.py restore E:/Backups Backup_2025-03-31_15-38-22 Project1 D:/Restore
+    python backup_cli.py restore E:/Backups Backup_2025-03-31_15-38-22 Project1 D:/Restore --file "docs/*.xlsx"
+    python backup_cli.py verify E:/Backups/Backup_2025-03-31_15-38-22
+    python backup_cli.py replicate E:/Backups/Backup_2025-03-31_15-38-22
+    python backup_cli.py find "*.xlsx"
+    python backup_cli.py versions Project1/docs/budget.xlsx
+    python backup_cli.py prune --dry-run
+    python backup_cli.py queue run Finance Engineering
+    python backup_cli.py gui
+"""
+import os
+import sys
+import json
+import time
+import tarfile
+import argparse
+import threading
+import multiprocessing
+import backup_pipeline
+from backup_pipeline import BackupError, BackupPipeline, list_source_folders
+from notifier import NotificationDispatcher
+from journal import find_resumable
+from progress import format_transfer
+
+# Exit codes
+EXIT_OK = 0          # every folder backed up
+EXIT_PARTIAL = 1     # some folders failed
+EXIT_USAGE = 2       # bad arguments (argparse)
+EXIT_CONFIG = 3      # configuration or validation error, nothing was backed up
+EXIT_FAILED = 4      # every folder failed
+
+# Seconds between progress lines in text mode
+PROGRESS_LOG_INTERVAL = 10
+
+
+class ConsoleEvents:
+    """Pipeline event sink that writes to a stream instead of the GUI.
+
+    Text mode prints the log as the GUI would show it. JSON mode prints one
+    JSON object per line: {"event": kind, "time": ..., "data": payload}.
+    """
+
+    def __init__(self, json_output=False, stream=None):
+        self.json_output = json_output
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self._last_percent = {}
+        self._last_transfer = 0.0
+
+    def put(self, item):
+        kind, payload = item
+        with self._lock:
+            if kind in ("progress", "job_progress"):
+                # Only whole-percent steps, the pipeline reports far more often
+                if kind == "job_progress":
+                    job, fraction = payload
+                    percent = int(fraction * 100)
+                    payload = [job, percent]
+                else:
+                    job = None
+                    percent = int(payload)
+                    payload = percent
+                if self._last_percent.get(job) == percent:
+                    return
+                self._last_percent[job] = percent
+            elif kind == "transfer" and not self.json_output:
+                now = time.monotonic()
+                if now - self._last_transfer < PROGRESS_LOG_INTERVAL:
+                    return
+                self._last_transfer = now
+                self.stream.write(f"[{payload['percent']:5.1f}%] {format_transfer(payload)}\n")
+                self.stream.flush()
+                return
+            if self.json_output:
+                self.write_json(kind, payload)
+            elif kind == "log":
+                self.stream.write(payload)
+            elif kind == "status":
+                self.stream.write(f"[{payload}]\n")
+            else:
+                return
+            self.stream.flush()
+
+    def write_json(self, kind, payload):
+        record = {"event": kind, "time": round(time.time(), 3), "data": payload}
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def apply_overrides(config, args):
+    """Command line options take precedence over backup_config.json"""
+    overrides = {
+        'winrar_path': args.winrar,
+        'archiver': args.archiver,
+        'codec': args.codec,
+        'compression_level': args.level,
+        'max_workers': args.workers,
+        'backup_mode': args.mode,
+        'storage': args.storage,
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            config[key] = value
+
+    governor_overrides = {
+        'read_bytes_per_sec': args.read_limit,
+        'write_bytes_per_sec': args.write_limit,
+        'max_jobs': args.max_jobs,
+        'windows': args.window,
+    }
+    governor = dict(config.get('governor') or {})
+    governor.update((key, value) for key, value in governor_overrides.items() if value is not None)
+    config['governor'] = governor
+
+    if args.exclude:
+        filters = dict(config.get('filters') or {})
+        filters['exclude'] = list(filters.get('exclude') or []) + args.exclude
+        config['filters'] = filters
+    return config
+
+
+def cmd_backup(args):
+    events = ConsoleEvents(args.json)
+    try:
+        config = apply_overrides(backup_pipeline.load_config(args.config), args)
+    except (OSError, ValueError) as e:
+        events.put(("log", f"Failed to load config: {e}\n"))
+        return EXIT_CONFIG
+
+    source_path = args.source or config.get('source_path', '')
+    destination_path = args.destination or config.get('destination_path', '')
+    if args.all and source_path and os.path.isdir(source_path):
+        folders = list_source_folders(source_path)
+    else:
+        folders = args.folders or config.get('folders', [])
+
+    notifier = NotificationDispatcher(config, log=lambda text: events.put(("log", text)))
+    if not args.no_email:
+        # Also retries emails that earlier runs could not deliver
+        notifier.start()
+    pipeline = BackupPipeline(config, events, notifier=notifier)
+    try:
+        if args.resume is not None:
+            backup_dir = args.resume or find_resumable(destination_path)
+            if not backup_dir:
+                raise BackupError("No interrupted backup to resume!")
+            folders, source_path = pipeline.resume(backup_dir)
+        else:
+            backup_dir = pipeline.prepare(source_path, destination_path, folders)
+    except BackupError as e:
+        events.put(("log", f"Error: {e}\n"))
+        return EXIT_CONFIG
+
+    result = pipeline.run(folders, source_path, backup_dir, notify=not args.no_email)
+    if result.success_count == result.total_folders:
+        exit_code = EXIT_OK
+    elif result.success_count == 0:
+        exit_code = EXIT_FAILED
+    else:
+        exit_code = EXIT_PARTIAL
+
+    # The backup is done; give the email a bounded time before exiting.
+    # Anything still undelivered stays in the outbox for the next run.
+    if not args.no_email and not notifier.flush(args.email_timeout):
+        events.put(("log", f"{notifier.pending()} email(s) left in the outbox for the next run\n"))
+
+    if args.json:
+        events.write_json("result", dict(result.to_dict(), exit_code=exit_code))
+    return exit_code
+
+
+def cmd_restore(args):
+    from chunkstore import ChunkStore, Snapshot
+    import shards
+
+    backup_dir = os.path.join(args.destination, args.backup)
+    snapshot = Snapshot.load(backup_dir)
+    if snapshot is not None and args.folder in snapshot.folders:
+        count, problems = ChunkStore(args.destination).restore_folder(snapshot, args.folder, args.target)
+        for problem in problems:
+            print(f"⚠ {problem}", file=sys.stderr)
+        print(f"Restored {count} files to {os.path.join(args.target, args.folder)}")
+        return EXIT_PARTIAL if problems else EXIT_OK
+
+    # Archives; a sharded folder is put back together from all of its parts
+    winrar_path = args.winrar or backup_pipeline.load_config(args.config)['winrar_path']
+    if args.file:
+        return restore_files(backup_dir, args, winrar_path)
+    try:
+        count = shards.restore_folder(backup_dir, args.folder, args.target, winrar_path, args.workers)
+    except FileNotFoundError:
+        print(f"No snapshot or archive of '{args.folder}' in {args.backup}", file=sys.stderr)
+        return EXIT_CONFIG
+    except (OSError, ValueError) as e:
+        print(f"Restore failed: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    print(f"Restored {args.folder} from {count} archive{'s' if count != 1 else ''} to {args.target}")
+    return EXIT_OK
+
+
+def restore_files(backup_dir, args, winrar_path):
+    """Extract only the files matching --file, located through the member indexes"""
+    import shards
+    from archive_index import restore_members
+
+    names = shards.folder_archives(backup_dir, args.folder)
+    if not names:
+        print(f"No archive of '{args.folder}' in {args.backup}", file=sys.stderr)
+        return EXIT_CONFIG
+    patterns = [f"{args.folder}/{pattern.strip('/')}" + ("/" if pattern.endswith("/") else "") for pattern in args.file]
+    try:
+        restored, problems = restore_members(backup_dir, names, patterns, args.target, winrar_path, args.workers)
+    except FileNotFoundError as e:
+        print(f"{e}; restore the whole folder instead", file=sys.stderr)
+        return EXIT_CONFIG
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"Restore failed: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    if not restored and not problems:
+        print(f"No file of '{args.folder}' matches {', '.join(args.file)}", file=sys.stderr)
+        return EXIT_CONFIG
+    for problem in problems:
+        print(f"⚠ {problem}", file=sys.stderr)
+    print(f"Restored {len(restored)} files to {args.target}")
+    return EXIT_PARTIAL if problems else EXIT_OK
+
+
+def cmd_verify(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from archivers import WinRarArchiver
+    from verification import ChecksumManifest, verify_archive
+
+    events = ConsoleEvents(args.json)
+    checksums = ChecksumManifest.load(args.backup_dir)
+    if checksums is None:
+        events.put(("log", f"No checksum manifest in {args.backup_dir}\n"))
+        return EXIT_CONFIG
+
+    winrar_path = args.winrar or backup_pipeline.load_config(args.config)['winrar_path']
+    archiver = WinRarArchiver(winrar_path) if winrar_path and os.path.exists(winrar_path) else None
+
+    def check(item):
+        name, recorded = item
+        _, _, problems = verify_archive(
+            os.path.join(args.backup_dir, name), checksums.algorithm, recorded['files'],
+            expected_hash=recorded['hash'], archiver=archiver
+        )
+        return name, problems
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for name, problems in pool.map(check, sorted(checksums.archives.items())):
+            if problems:
+                failed += 1
+                events.put(("log", f"✗ {name}\n" + "".join(f"  {problem}\n" for problem in problems)))
+            else:
+                events.put(("log", f"✓ {name}\n"))
+            if args.json:
+                events.write_json("verified", {'archive': name, 'ok': not problems, 'problems': problems})
+
+    total = len(checksums.archives)
+    events.put(("log", f"{total - failed}/{total} archives verified ({checksums.algorithm})\n"))
+    if not failed:
+        return EXIT_OK
+    return EXIT_FAILED if failed == total else EXIT_PARTIAL
+
+
+def cmd_replicate(args):
+    from replication import DEFAULT_REPLICATION, ReplicationError, Replicator, replicable_files
+
+    events = ConsoleEvents(args.json)
+    config = backup_pipeline.load_config(args.config)
+    settings = dict(DEFAULT_REPLICATION, **(config.get('replication') or {}))
+    if args.target:
+        settings['target'] = args.target
+    if args.workers:
+        settings['max_workers'] = args.workers
+    if not settings['target']:
+        events.put(("log", "No replication target - set replication.target in the config or use --target\n"))
+        return EXIT_CONFIG
+    try:
+        replicator = Replicator.from_config(
+            {'replication': settings}, args.backup_dir, log=lambda text: events.put(("log", text))
+        )
+    except ReplicationError as e:
+        events.put(("log", f"{str(e)}\n"))
+        return EXIT_CONFIG
+    except Exception as e:
+        events.put(("log", f"Could not connect to {settings['target']}: {str(e)}\n"))
+        return EXIT_CONFIG
+
+    # Already replicated files are skipped; interrupted uploads continue
+    names = replicable_files(args.backup_dir)
+    for name in names:
+        replicator.submit(name)
+    failed = replicator.close()
+    events.put(("log", replicator.summary() + "\n"))
+    if args.json:
+        events.write_json("result", replicator.to_dict())
+    if not failed:
+        return EXIT_OK
+    return EXIT_FAILED if len(failed) == len(names) else EXIT_PARTIAL
+
+
+def _open_catalog(args):
+    """Catalog path from the config, or None (with a message) if there is none"""
+    path = backup_pipeline.load_config(args.config)['catalog_file']
+    if not path or not os.path.exists(path):
+        print("No backup catalog yet - it is created by the next backup", file=sys.stderr)
+        return None
+    return path
+
+
+def _print_files(rows):
+    for row in rows:
+        size = f"{row['size']:,} B" if row['size'] is not None else ""
+        print(f"{row['backup']}  {row['archive'] or '(chunk store)'}  {row['path']}  {size}  {row['mtime'] or ''}")
+
+
+def cmd_find(args):
+    from catalog import find_files
+
+    path = _open_catalog(args)
+    if path is None:
+        return EXIT_CONFIG
+    rows = find_files(path, args.pattern, args.limit)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_files(rows)
+        print(f"{len(rows)} match(es)", file=sys.stderr)
+    return EXIT_OK if rows else EXIT_PARTIAL
+
+
+def cmd_versions(args):
+    from catalog import file_versions
+
+    path = _open_catalog(args)
+    if path is None:
+        return EXIT_CONFIG
+    rows = file_versions(path, args.path)
+    if not args.all:
+        rows = [row for row in rows if row['changed']]
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_files(rows)
+        print(f"{len(rows)} version(s)", file=sys.stderr)
+    return EXIT_OK if rows else EXIT_PARTIAL
+
+
+def cmd_prune(args):
+    from retention import RetentionPolicy, format_plan, prune
+
+    config = backup_pipeline.load_config(args.config)
+    destination_path = args.destination or config.get('destination_path', '')
+    if not destination_path or not os.path.isdir(destination_path):
+        print("Destination folder doesn't exist!", file=sys.stderr)
+        return EXIT_CONFIG
+
+    policy = RetentionPolicy.from_config(config)
+    for name in ("daily", "weekly", "monthly"):
+        if getattr(args, name) is not None:
+            setattr(policy, name, getattr(args, name))
+    if args.max_bytes is not None:
+        policy.max_total_bytes = args.max_bytes
+
+    plan, errors = prune(
+        destination_path, policy, catalog_path=config['catalog_file'] or None,
+        dry_run=args.dry_run, max_workers=args.workers
+    )
+    if args.json:
+        print(json.dumps({
+            'dry_run': args.dry_run,
+            'keep': plan.keep,
+            'delete': [run.name for run in plan.delete],
+            'freed_bytes': plan.freed_bytes,
+            'kept_bytes': plan.kept_bytes,
+            'errors': errors,
+        }, indent=2))
+    else:
+        print(format_plan(plan, args.dry_run))
+        for error in errors:
+            print(f"Could not delete {error}", file=sys.stderr)
+    return EXIT_PARTIAL if errors else EXIT_OK
+
+
+def _queue_path(args):
+    from job_queue import QUEUE_FILE
+    return backup_pipeline.config_relative_path(QUEUE_FILE, args.config)
+
+
+def _open_queue(args):
+    """The job queue kept next to the configuration file"""
+    from job_queue import JobQueue
+    return JobQueue.load(_queue_path(args))
+
+
+def _lock_queue(args):
+    """Lock of the queue for a command that changes it; None (with a message) while a queue run holds it"""
+    from job_queue import QueueLock
+    lock = QueueLock(_queue_path(args))
+    if not lock.acquire():
+        print("A queue run is working on the queue; try again when it has finished", file=sys.stderr)
+        return None
+    return lock
+
+
+def _add_profiles(queue, config, profiles):
+    """Queue profiles as one batch; None (with a message) if one is not configured"""
+    unknown = [name for name in profiles if name not in (config.get('profiles') or {})]
+    if unknown:
+        print(f"Unknown profile{'s' if len(unknown) > 1 else ''}: {', '.join(unknown)}", file=sys.stderr)
+        return None
+    return queue.add(profiles)
+
+
+def cmd_queue_add(args):
+    config = backup_pipeline.load_config(args.config)
+    lock = _lock_queue(args)
+    if lock is None:
+        return EXIT_CONFIG
+    try:
+        batch = _add_profiles(_open_queue(args), config, args.profiles)
+    finally:
+        lock.release()
+    if batch is None:
+        return EXIT_CONFIG
+    print(f"Queued batch {batch['id']}: jobs {', '.join(str(job_id) for job_id in batch['jobs'])}")
+    return EXIT_OK
+
+
+def cmd_queue_run(args):
+    from job_queue import DONE, FAILED, RUNNING, QueueRunner
+
+    events = ConsoleEvents(args.json)
+    lock = _lock_queue(args)
+    if lock is None:
+        return EXIT_CONFIG
+    try:
+        config = backup_pipeline.load_config(args.config)
+        queue = _open_queue(args)
+        if args.profiles and _add_profiles(queue, config, args.profiles) is None:
+            return EXIT_CONFIG
+    except (OSError, ValueError) as e:
+        events.put(("log", f"Failed to load config or queue: {e}\n"))
+        return EXIT_CONFIG
+    finally:
+        lock.release()
+    if not queue.queued() and not any(job['state'] == RUNNING for job in queue.jobs):
+        events.put(("log", "The queue is empty\n"))
+        return EXIT_OK
+
+    notifier = NotificationDispatcher(config, log=lambda text: events.put(("log", text)))
+    if not args.no_email:
+        notifier.start()
+    try:
+        finished = QueueRunner(
+            queue, config, events, notifier, notify=not args.no_email, max_jobs=args.max_jobs
+        ).run()
+    except BackupError as e:
+        events.put(("log", f"Error: {e}\n"))
+        return EXIT_CONFIG
+
+    if not args.no_email and not notifier.flush(args.email_timeout):
+        events.put(("log", f"{notifier.pending()} email(s) left in the outbox for the next run\n"))
+    states = [job['state'] for job in finished]
+    if all(state == DONE for state in states):
+        exit_code = EXIT_OK
+    elif all(state == FAILED for state in states):
+        exit_code = EXIT_FAILED
+    else:
+        exit_code = EXIT_PARTIAL
+    if args.json:
+        events.write_json("result", {'jobs': finished, 'exit_code': exit_code})
+    return exit_code
+
+
+def cmd_queue_list(args):
+    queue = _open_queue(args)
+    if args.json:
+        print(json.dumps({'jobs': queue.jobs, 'batches': queue.batches}, indent=2))
+        return EXIT_OK
+    if not queue.jobs:
+        print("The queue is empty")
+    for job in queue.jobs:
+        line = f"{job['id']:>4}  batch {job['batch']:<4} {job['profile']:<20} {job['state']:<10}"
+        if job['total_folders']:
+            line += f" {job['success_count']}/{job['total_folders']} folders"
+        if job['error']:
+            line += f" {job['error']}"
+        print(line)
+    return EXIT_OK
+
+
+def cmd_queue_cancel(args):
+    lock = _lock_queue(args)
+    if lock is None:
+        return EXIT_CONFIG
+    try:
+        queue = _open_queue(args)
+        missing = [job_id for job_id in args.jobs if not queue.cancel(job_id)]
+    finally:
+        lock.release()
+    for job_id in missing:
+        print(f"Job {job_id} is not queued", file=sys.stderr)
+    return EXIT_PARTIAL if missing else EXIT_OK
+
+
+def cmd_queue_clear(args):
+    lock = _lock_queue(args)
+    if lock is None:
+        return EXIT_CONFIG
+    try:
+        dropped = _open_queue(args).clear()
+    finally:
+        lock.release()
+    print(f"Removed {dropped} finished job{'s' if dropped != 1 else ''}")
+    return EXIT_OK
+
+
+def cmd_gui(args):
+    # Tk and sv_ttk are only imported when the window is actually needed
+    import backuptool
+    backuptool.main()
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="backup_cli",
+        description="DevOps Monthly Backup Tool - headless mode"
+    )
+    parser.add_argument(
+        "--config", default=backup_pipeline.CONFIG_FILE,
+        help="Configuration file (default: %(default)s)"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup = commands.add_parser("backup", help="Back up folders without the GUI")
+    backup.add_argument("--source", help="Source folder (default: source_path in the config)")
+    backup.add_argument("--destination", help="Destination folder (default: destination_path in the config)")
+    selection = backup.add_mutually_exclusive_group()
+    selection.add_argument("--folders", nargs="+", metavar="FOLDER", help="Folders of the source to back up")
+    selection.add_argument("--all", action="store_true", help="Back up every folder of the source")
+    backup.add_argument("--winrar", help="Path to WinRAR.exe or rar")
+    backup.add_argument("--archiver", choices=("winrar", "tar", "zip"))
+    backup.add_argument("--codec")
+    backup.add_argument("--level", help="Compression level")
+    backup.add_argument("--workers", type=int, help="Folders archived at the same time")
+    backup.add_argument("--mode", choices=("full", "incremental", "differential"))
+    backup.add_argument("--storage", choices=("archive", "chunkstore"))
+    backup.add_argument("--read-limit", type=int, metavar="BYTES_PER_SEC", help="Cap on source reads")
+    backup.add_argument("--write-limit", type=int, metavar="BYTES_PER_SEC", help="Cap on archive writes")
+    backup.add_argument("--max-jobs", type=int, help="Archive jobs allowed at the same time")
+    backup.add_argument(
+        "--window", action="append", metavar="HH:MM-HH:MM",
+        help="Only archive inside this local time window; may be repeated"
+    )
+    backup.add_argument(
+        "--exclude", action="append", metavar="PATTERN",
+        help='Leave out files matching a gitignore-style pattern ("node_modules/", "*.tmp"); may be repeated'
+    )
+    backup.add_argument(
+        "--resume", nargs="?", const="", metavar="BACKUP_DIR",
+        help="Continue an interrupted run (default: the newest one under the destination)"
+    )
+    backup.add_argument("--no-email", action="store_true", help="Do not send the summary email")
+    backup.add_argument(
+        "--email-timeout", type=float, default=30,
+        help="Seconds to wait for email delivery before exiting (default: %(default)s)"
+    )
+    backup.add_argument("--json", action="store_true", help="Write JSON lines instead of text")
+    backup.set_defaults(func=cmd_backup)
+
+    restore = commands.add_parser("restore", help="Restore a folder from its archives or the chunk store")
+    restore.add_argument("destination", help="Backup destination (holds the Backup_* folders and ChunkStore)")
+    restore.add_argument("backup", help="Backup_<timestamp> directory name")
+    restore.add_argument("folder", help="Folder to restore")
+    restore.add_argument("target", help="Directory to restore into")
+    restore.add_argument("--winrar", help="Path to WinRAR.exe or rar, for .rar archives")
+    restore.add_argument("--workers", type=int, help="Part archives (or, with --file, frames) extracted at the same time")
+    restore.add_argument(
+        "--file", action="append", metavar="PATTERN",
+        help='Restore only files matching a path, glob or "dir/" relative to the folder; may be repeated'
+    )
+    restore.set_defaults(func=cmd_restore)
+
+    verify = commands.add_parser("verify", help="Check a backup against its checksum manifest")
+    verify.add_argument("backup_dir", help="Backup_<timestamp> directory to verify")
+    verify.add_argument("--winrar", help="WinRAR/rar used to test .rar archives")
+    verify.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Archives verified at the same time")
+    verify.add_argument("--json", action="store_true", help="Write JSON lines instead of text")
+    verify.set_defaults(func=cmd_verify)
+
+    replicate = commands.add_parser("replicate", help="Copy a backup to the off-site replication target")
+    replicate.add_argument("backup_dir", help="Backup_<timestamp> directory to replicate")
+    replicate.add_argument("--target", help="s3://bucket/prefix or sftp://user@host/path (default: from the config)")
+    replicate.add_argument("--workers", type=int, help="Parts uploaded at the same time")
+    replicate.add_argument("--json", action="store_true", help="Write JSON lines instead of text")
+    replicate.set_defaults(func=cmd_replicate)
+
+    find = commands.add_parser("find", help="Search the catalog of backed up files")
+    find.add_argument("pattern", help='File name or glob ("*.xlsx"), or a path with "/" ("Project1/src/*.py")')
+    find.add_argument("--limit", type=int, default=100, help="Maximum results (default: %(default)s)")
+    find.add_argument("--json", action="store_true", help="Write JSON instead of text")
+    find.set_defaults(func=cmd_find)
+
+    versions = commands.add_parser("versions", help="List the backed up versions of one file")
+    versions.add_argument("path", help="Folder/relative/path of the file")
+    versions.add_argument("--all", action="store_true", help="Show every backup, not only changed versions")
+    versions.add_argument("--json", action="store_true", help="Write JSON instead of text")
+    versions.set_defaults(func=cmd_versions)
+
+    prune = commands.add_parser("prune", help="Delete old backups according to the retention policy")
+    prune.add_argument("--destination", help="Backup destination (default: destination_path in the config)")
+    prune.add_argument("--daily", type=int, help="Days to keep one backup of")
+    prune.add_argument("--weekly", type=int, help="Weeks to keep one backup of")
+    prune.add_argument("--monthly", type=int, help="Months to keep one backup of")
+    prune.add_argument("--max-bytes", type=int, help="Cap on the total size of kept backups")
+    prune.add_argument("--workers", type=int, default=4, help="Directories deleted at the same time")
+    prune.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+    prune.add_argument("--json", action="store_true", help="Write JSON instead of text")
+    prune.set_defaults(func=cmd_prune)
+
+    queue = commands.add_parser("queue", help="Back up named profiles through the persistent job queue")
+    queue_commands = queue.add_subparsers(dest="queue_command", required=True)
+    queue_add = queue_commands.add_parser("add", help="Queue profiles as one batch")
+    queue_add.add_argument("profiles", nargs="+", help="Profile names from the config's profiles block")
+    queue_add.set_defaults(func=cmd_queue_add)
+    queue_run = queue_commands.add_parser("run", help="Run queued jobs until the queue is empty")
+    queue_run.add_argument("profiles", nargs="*", help="Queue these profiles as a batch first")
+    queue_run.add_argument("--max-jobs", type=int, help="Profiles backed up at the same time (default: queue.max_jobs)")
+    queue_run.add_argument("--json", action="store_true", help="Write JSON lines instead of text")
+    queue_run.add_argument("--no-email", action="store_true", help="Do not send the batch emails")
+    queue_run.add_argument(
+        "--email-timeout", type=float, default=30,
+        help="Seconds to wait for email delivery before exiting (default: %(default)s)"
+    )
+    queue_run.set_defaults(func=cmd_queue_run)
+    queue_list = queue_commands.add_parser("list", help="Show queued, running and finished jobs")
+    queue_list.add_argument("--json", action="store_true", help="Write JSON instead of text")
+    queue_list.set_defaults(func=cmd_queue_list)
+    queue_cancel = queue_commands.add_parser("cancel", help="Cancel jobs that have not started")
+    queue_cancel.add_argument("jobs", nargs="+", type=int, help="Job ids")
+    queue_cancel.set_defaults(func=cmd_queue_cancel)
+    queue_clear = queue_commands.add_parser("clear", help="Drop the jobs of batches that have been reported")
+    queue_clear.set_defaults(func=cmd_queue_clear)
+
+    gui = commands.add_parser("gui", help="Open the graphical interface")
+    gui.set_defaults(func=cmd_gui)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    # Needed by the chunk store's process pool in a frozen executable
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,993 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from size_index import FolderSizeIndex
+from archivers import ArchiveError, create_archiver
+from manifest import Manifest, changed_files, find_base_backup, scan_folder
+from filters import FileFilter
+from chunkstore import ChunkStore, Snapshot, find_previous_snapshot
+from notifier import OUTBOX_DIR, NotificationDispatcher
+from compression_policy import CompressionPolicy, CompressionStats
+from verification import ChecksumManifest, FileChecksums, Verifier
+from journal import BackupJournal, DONE, FAILED, IN_PROGRESS
+from catalog import CATALOG_FILE, CatalogWriter
+from retention import DEFAULT_RETENTION, RetentionPolicy, format_plan, prune
+from governor import ResourceGovernor
+from metrics import RunMetrics, write_textfile
+from progress import TransferProgress
+from scheduler import FolderScheduler, throughput_history
+from shards import SHARDS_SUFFIX, plan_shards, remove_shards, save_shard_manifest, shard_archive_name
+from archive_index import INDEX_SUFFIX, ArchiveIndex
+from replication import METADATA_FILES, ReplicationError, Replicator, parse_target
+
+# Configuration file path
+CONFIG_FILE = "backup_config.json"
+
+# Cached folder sizes used for progress estimates
+SIZE_INDEX_FILE = "backup_size_index.json"
+
+# Settings naming files or folders; relative names are taken from the
+# directory of backup_config.json, not the working directory
+CONFIG_PATH_KEYS = ('catalog_file', 'outbox_dir')
+
+# Settings used when backup_config.json does not set them
+DEFAULT_CONFIG = {
+    'smtp_server': '',
+    'smtp_port': '587',
+    'email_address': '',
+    'email_password': '',
+    'recipient_email': '',
+    'smtp_starttls': True,
+    'winrar_path': r"C:\Program Files\WinRAR\WinRAR.exe",
+    'max_workers': 1,
+    'archiver': 'winrar',
+    'codec': '',
+    'compression_level': '',
+    'backup_mode': 'full',
+    'manifest_hash': '',
+    'checksum_hash': 'blake2b',
+    'storage': 'archive',
+    'compression_policy': {},
+    'catalog_file': CATALOG_FILE,
+    'outbox_dir': OUTBOX_DIR,
+    'retention': {},
+    'governor': {},
+    'metrics_textfile': '',
+    'shard_size': 0,
+    'shard_workers': 0,
+    'filters': {},
+    'replication': {},
+    'member_index': True,
+    'profiles': {},
+    'queue': {},
+}
+
+
+class BackupError(Exception):
+    """Raised when a backup cannot be started; the message is shown to the user"""
+
+
+def config_relative_path(name, config_path=CONFIG_FILE):
+    """name resolved against the directory of config_path; absolute names are kept"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), name)
+
+
+def load_config(path=CONFIG_FILE):
+    """Load backup_config.json merged over DEFAULT_CONFIG.
+
+    A missing file gives the defaults; unreadable JSON raises. The
+    CONFIG_PATH_KEYS settings come back resolved against the file's directory.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    for key in CONFIG_PATH_KEYS:
+        if config[key]:
+            config[key] = config_relative_path(config[key], path)
+    return config
+
+
+def list_source_folders(source_path):
+    """Names of the subfolders of source_path, the folders a backup can select"""
+    with os.scandir(source_path) as entries:
+        return sorted(entry.name for entry in entries if entry.is_dir())
+
+
+def save_config(config, path=CONFIG_FILE):
+    """Save configuration to file"""
+    config_dir = os.path.dirname(os.path.abspath(path))
+    config = dict(config)
+    for key in CONFIG_PATH_KEYS:
+        # Undo load_config for files next to the config, so the folder can move
+        if config.get(key) and os.path.dirname(config[key]) == config_dir:
+            config[key] = os.path.basename(config[key])
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=4)
+
+
+class BackupResult:
+    """Outcome of one pipeline run"""
+
+    def __init__(self, backup_dir, total_folders, success_count, backed_up_files, folders, message,
+                 compression=None, throughput=None, stages=None):
+        self.backup_dir = backup_dir
+        self.total_folders = total_folders
+        self.success_count = success_count
+        self.backed_up_files = backed_up_files
+        self.folders = folders  # folder -> (success, archive name or list of part archives)
+        self.message = message
+        self.compression = compression or {}  # policy class -> {'files', 'bytes'}
+        self.throughput = throughput or {}  # see ResourceGovernor.throughput()
+        self.stages = stages or {}  # stage -> {'seconds', 'wall', 'count'}
+
+    def to_dict(self):
+        return {
+            'backup_dir': self.backup_dir,
+            'total_folders': self.total_folders,
+            'success_count': self.success_count,
+            'backed_up_files': self.backed_up_files,
+            'folders': {
+                folder: {'success': success, 'archive': archive_name}
+                for folder, (success, archive_name) in self.folders.items()
+            },
+            'compression': self.compression,
+            'throughput': self.throughput,
+            'stages': self.stages,
+        }
+
+
+class BackupPipeline:
+    """The backup run shared by the GUI and the headless command line.
+
+    Status is reported as (kind, payload) tuples through events.put(), with
+    kind one of "log", "progress", "job_progress" ((folder, fraction)),
+    "transfer" (bytes, files, throughput and ETA; see TransferProgress),
+    "progress_text" or "status" - the same messages BackupApp's gui_queue
+    understands. Nothing here imports Tk.
+
+    The summary email is handed to notifier, a NotificationDispatcher; when
+    none is given the pipeline starts its own on first use. governor, a
+    ResourceGovernor, holds the I/O and CPU budget of the archive jobs; by
+    default one is built from the "governor" config block. Stage and
+    per-folder timings are collected in metrics and saved with the backup
+    as backup_report.json.
+    """
+
+    def __init__(self, config, events, size_index_file=SIZE_INDEX_FILE, notifier=None, governor=None):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.events = events
+        self.size_index_file = size_index_file
+        self.notifier = notifier
+        self.governor = governor
+        self.metrics = RunMetrics()
+        self.replicator = None
+        self.archiver = None
+
+    def prepare(self, source_path, destination_path, folders):
+        """Validate the inputs and create the timestamped backup directory.
+
+        Raises BackupError with a user-facing message; returns backup_dir.
+        """
+        with self.metrics.stage("validation"):
+            self._create_archiver()
+            self._create_governor()
+
+            if not source_path or not destination_path:
+                raise BackupError("Please select both folders!")
+
+            if not os.path.exists(source_path):
+                raise BackupError("Source folder doesn't exist!")
+
+            if not folders:
+                raise BackupError("No folders selected!")
+            self._check_filters(folders)
+            self._check_replication()
+
+            # Create destination if needed
+            if not os.path.exists(destination_path):
+                try:
+                    os.makedirs(destination_path, exist_ok=True)
+                except OSError as e:
+                    raise BackupError(f"Can't create destination: {str(e)}")
+
+            # Create backup directory with timestamp. mkdir claims the name, so
+            # a run started in the same second elsewhere waits for the next one
+            while True:
+                now = datetime.now()
+                backup_dir = os.path.join(
+                    destination_path,
+                    f"Backup_{now.strftime('%Y-%m-%d_%H-%M-%S')}"
+                )
+                try:
+                    os.mkdir(backup_dir)
+                except FileExistsError:
+                    time.sleep(1 - now.microsecond / 1e6)
+                    continue
+                except OSError as e:
+                    raise BackupError(f"Can't create backup folder: {str(e)}")
+                return backup_dir
+
+    def resume(self, backup_dir):
+        """Pick up an interrupted run from its journal; returns (folders, source_path).
+
+        Archiver settings come from the journal so the remaining archives
+        match the finished ones. Pass the result to run() with the same
+        backup_dir. Raises BackupError with a user-facing message.
+        """
+        with self.metrics.stage("validation"):
+            try:
+                journal = BackupJournal.load(backup_dir)
+            except (OSError, ValueError) as e:
+                raise BackupError(f"Can't read backup journal: {str(e)}")
+            if journal is None:
+                raise BackupError("No backup journal found - nothing to resume!")
+            if journal.finished:
+                raise BackupError("This backup has already finished!")
+
+            self.config.update(journal.config)
+            self._create_archiver()
+            self._create_governor()
+            if not os.path.exists(journal.source_path):
+                raise BackupError("Source folder doesn't exist!")
+            self._check_filters(journal.folders)
+            self._check_replication()
+            return list(journal.folders), journal.source_path
+
+    def _create_archiver(self):
+        try:
+            level = self.config['compression_level']
+            self.archiver = create_archiver(
+                self.config['archiver'],
+                winrar_path=self.config['winrar_path'],
+                codec=self.config['codec'] or None,
+                level=level if level not in (None, "") else None
+            )
+            if self.config['storage'] != "chunkstore":
+                self.archiver.check()
+        except ArchiveError as e:
+            raise BackupError(str(e))
+
+    def _create_governor(self):
+        if self.governor is not None:
+            return
+        try:
+            self.governor = ResourceGovernor.from_config(
+                self.config, log=lambda text: self.events.put(("log", text))
+            )
+        except (TypeError, ValueError) as e:
+            raise BackupError(f"Invalid governor settings: {str(e)}")
+
+    def _check_filters(self, folders):
+        for folder in folders:
+            try:
+                FileFilter.from_config(self.config, folder)
+            except (TypeError, ValueError) as e:
+                raise BackupError(f"Invalid filter settings for {folder}: {str(e)}")
+
+    def _check_replication(self):
+        target = (self.config['replication'] or {}).get('target')
+        if target:
+            try:
+                parse_target(target)
+            except ReplicationError as e:
+                raise BackupError(str(e))
+
+    def send_email_notification(self, subject, message):
+        """Queue the email notification; delivery happens on the notifier thread"""
+        config = self.config
+        if not all([config['smtp_server'], config['smtp_port'], config['email_address'],
+                    config['recipient_email']]):
+            self.events.put(("log", "\nEmail notification skipped - incomplete settings\n"))
+            return
+
+        # Format the message with proper line breaks and formatting
+        formatted_message = f""" DevOps Backup Notification
+
+{message}
+
+Backup completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+"""
+
+        if self.notifier is None:
+            self.notifier = NotificationDispatcher(
+                config,
+                log=lambda text: self.events.put(("log", text))
+            )
+        try:
+            self.notifier.enqueue(subject, formatted_message)
+        except OSError as e:
+            self.events.put(("log", f"\nFailed to queue email: {str(e)}\n"))
+            return
+        self.events.put(("log", f"\nEmail notification queued for {config['recipient_email']}\n"))
+
+    def run(self, folders, source_path, backup_dir, notify=True):
+        """Back up folders of source_path into backup_dir.
+
+        Sends the summary email unless notify is False; returns a BackupResult.
+        If backup_dir already has a journal, folders it lists as done are
+        kept and the rest are archived again.
+        """
+        total_folders = len(folders)
+        success_count = 0
+        backed_up_files = []  # List to store successfully backed up files
+
+        journal, resuming = self._open_journal(backup_dir, source_path, folders)
+        finished_folders = {}
+        if resuming:
+            for folder in folders:
+                if journal.state(folder) == DONE:
+                    result = journal.load_folder_result(folder)
+                    if result is not None:
+                        finished_folders[folder] = result
+            self.events.put((
+                "log",
+                f"Resuming {os.path.basename(backup_dir)}: "
+                f"{len(finished_folders)}/{total_folders} folders already done\n"
+            ))
+        pending_folders = [folder for folder in folders if folder not in finished_folders]
+
+        # Every archived file goes into the catalog; rows are written by its own thread
+        catalog = None
+        if self.config['catalog_file']:
+            catalog = CatalogWriter(self.config['catalog_file'], log=lambda text: self.events.put(("log", text)))
+            catalog.begin_run(backup_dir, source_path, self.config['backup_mode'])
+
+        # Index folder sizes once per run instead of rescanning while archiving
+        self.events.put(("progress_text", "Scanning folders..."))
+        scan_start = time.time()
+        size_index = FolderSizeIndex(self.size_index_file)
+        folder_paths = [os.path.join(source_path, folder) for folder in pending_folders]
+        with self.metrics.stage("scan"):
+            folder_totals = size_index.scan(folder_paths)
+            try:
+                size_index.save()
+            except OSError as e:
+                self.events.put(("log", f"⚠ Could not save size index: {str(e)}\n"))
+        total_files = sum(count for count, _ in folder_totals.values())
+        total_bytes = sum(size for _, size in folder_totals.values())
+        self.events.put((
+            "log",
+            f"Indexed {total_files} files ({total_bytes / (1024 * 1024):.1f} MB) "
+            f"in {time.time() - scan_start:.1f}s\n"
+        ))
+
+        # Source bytes read by the archive engines, shared by the worker threads
+        transfer = TransferProgress(
+            self.events,
+            {folder: folder_totals[os.path.abspath(os.path.join(source_path, folder))] for folder in pending_folders}
+        )
+
+        # The governor may be shared with other runs (the job queue); count this run's bytes apart
+        governor = self.governor.run_meter()
+        max_workers = max(1, governor.job_limit(min(int(self.config['max_workers']), total_folders)))
+        if max_workers > 1:
+            self.events.put(("log", f"Archiving {total_folders} folders with {max_workers} parallel jobs\n"))
+        self.events.put(("progress_text", f"0/{total_folders}"))
+
+        # Chunk store mode deduplicates against every earlier snapshot instead
+        use_chunk_store = self.config['storage'] == "chunkstore"
+        previous_snapshot = None
+        snapshot = None
+        if use_chunk_store:
+            previous_snapshot = find_previous_snapshot(
+                os.path.dirname(backup_dir), exclude=os.path.basename(backup_dir)
+            )
+            snapshot = Snapshot()
+
+        # Finished archives are copied off-site while the next folders are archived
+        replication_target = (self.config['replication'] or {}).get('target')
+        self.replicator = None
+        if replication_target and use_chunk_store:
+            self.events.put(("log", "Replication skipped - the chunk store is not replicated\n"))
+        elif replication_target:
+            try:
+                self.replicator = Replicator.from_config(
+                    self.config, backup_dir, log=lambda text: self.events.put(("log", text))
+                )
+                self.events.put(("log", f"Replicating archives to {replication_target}\n"))
+            except Exception as e:
+                self.events.put(("log", f"⚠ Could not connect to {replication_target}: {str(e)}\n"))
+
+        # Incremental/differential runs only archive what changed since a base backup
+        base_name, base_manifest = None, None
+        backup_mode = self.config['backup_mode']
+        if backup_mode in ("incremental", "differential") and not use_chunk_store:
+            if resuming:
+                # Diff against the same base as the interrupted part
+                base_name = journal.base
+                base_manifest = Manifest.load(os.path.join(os.path.dirname(backup_dir), base_name)) if base_name else None
+            else:
+                base_name, base_manifest = find_base_backup(
+                    os.path.dirname(backup_dir), backup_mode, exclude=os.path.basename(backup_dir)
+                )
+                journal.base = base_name
+                self._update_journal(journal.save)
+            if base_manifest is None:
+                self.events.put(("log", "No previous backup manifest found - running a full backup\n"))
+            else:
+                self.events.put(("log", f"{backup_mode.capitalize()} backup against {base_name}\n"))
+        manifest = Manifest(
+            backup_mode if base_manifest else "full",
+            base=base_name,
+            hash_algorithm=self.config['manifest_hash'] or None
+        )
+
+        if use_chunk_store:
+            level = self.config['compression_level']
+            level = int(level) if level not in (None, "") else 3
+            store_context = ChunkStore(os.path.dirname(backup_dir), level=level)
+        else:
+            store_context = nullcontext()
+
+        # Bytes per compression policy class, summed over all folders
+        compression_stats = CompressionStats()
+
+        # Finished archives are verified on their own pool while the next
+        # folders are still being compressed
+        checksum_hash = self.config['checksum_hash']
+        checksum_manifest = None
+        verifier_context = nullcontext()
+        if checksum_hash and not use_chunk_store:
+            checksum_manifest = ChecksumManifest(checksum_hash)
+            verifier_context = Verifier(
+                checksum_hash, max_workers, self.archiver, initializer=governor.lower_priority,
+                metrics=self.metrics
+            )
+
+        # Folders finished before an interruption only contribute their metadata
+        archives = {}
+        for folder, result in finished_folders.items():
+            archives[folder] = (True, result['archive'])
+            manifest.set_folder(
+                folder,
+                {rel_path: tuple(entry) for rel_path, entry in result['entries'].items()},
+                result['deleted']
+            )
+            if checksum_manifest is not None and result['checksums']:
+                checksums = result['checksums']
+                if 'digest' in checksums:
+                    checksums = {result['archive']: checksums}  # journals written before sharding
+                for archive_name, recorded in checksums.items():
+                    checksum_manifest.set_archive(archive_name, **recorded)
+            if snapshot is not None and result['snapshot'] is not None:
+                snapshot.folders[folder] = result['snapshot']
+            if self.replicator is not None and result['archive']:
+                archive_names = result['archive'] if isinstance(result['archive'], list) else [result['archive']]
+                for archive_name in archive_names:
+                    self.replicator.submit(archive_name)
+            transfer.finish(folder)
+
+        # Partial archives of the interrupted run are rewritten from scratch
+        if resuming:
+            for folder in pending_folders:
+                archive_path = os.path.join(backup_dir, self.archiver.archive_name(folder))
+                for leftover in (archive_path, f"{archive_path}.lst", ArchiveIndex.path_for(archive_path)):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                remove_shards(backup_dir, folder)
+
+        # Largest estimated folders first, so no giant folder is left for the end
+        archiver_name = "chunkstore" if use_chunk_store else self.config['archiver']
+        history, overall_rate = throughput_history(
+            os.path.dirname(backup_dir), archiver_name, manifest.mode, exclude=os.path.basename(backup_dir)
+        )
+        folder_sources = {
+            folder: (folder_path, folder_totals[os.path.abspath(folder_path)])
+            for folder, folder_path in zip(pending_folders, folder_paths)
+        }
+        scheduler = FolderScheduler(
+            {folder: totals for folder, (_, totals) in folder_sources.items()}, max_workers,
+            history, overall_rate
+        )
+        if len(pending_folders) > 1:
+            self.events.put((
+                "log",
+                f"Scheduling largest folders first ({len(history)} with past throughput), "
+                f"predicted {scheduler.predicted_makespan:.0f}s\n"
+            ))
+
+        archive_start = time.time()
+        with store_context as chunk_store, verifier_context as verifier:
+            def archive_folder(folder, folder_path, folder_size):
+                # Waits for a job slot and the backup window, at lowered priority
+                with governor.job():
+                    started = time.monotonic()
+                    result = self.backup_single_folder(
+                        folder, folder_path, folder_size, backup_dir, transfer,
+                        manifest, base_manifest,
+                        chunk_store=chunk_store, snapshot=snapshot, previous_snapshot=previous_snapshot,
+                        compression_stats=compression_stats, verifier=verifier, journal=journal,
+                        catalog=catalog, governor=governor
+                    )
+                    folder_metrics = self.metrics.folder(folder)
+                    folder_metrics.seconds = time.monotonic() - started
+                    folder_metrics.success = result[0]
+                    return result
+
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                # Jobs are handed out one at a time, so each free worker takes
+                # the folder that is largest under the latest estimates
+                running = {}
+
+                def submit_next():
+                    folder = scheduler.next()
+                    if folder is not None:
+                        folder_path, (_, folder_size) = folder_sources[folder]
+                        running[pool.submit(archive_folder, folder, folder_path, folder_size)] = folder
+
+                for _ in range(max_workers):
+                    submit_next()
+                finished = len(finished_folders)
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        folder = running.pop(future)
+                        archives[folder] = future.result()
+                        scheduler.finished(folder, self.metrics.folder(folder).seconds)
+                        submit_next()
+                        finished += 1
+                        transfer.finish(folder)
+                        self.events.put(("progress_text", f"{finished}/{total_folders}"))
+            archive_seconds = time.time() - archive_start
+            schedule = scheduler.report(archive_seconds)
+
+            if verifier is not None:
+                self.events.put(("status", "Verifying archives..."))
+                verification = verifier.results()
+
+        if verifier is not None:
+            verified = 0
+            for folder, parts in verification.items():
+                failed = False
+                for archive_name, checksums, archive_hash, size, problems in parts:
+                    if not problems:
+                        checksum_manifest.set_archive(archive_name, size, archive_hash, checksums.files)
+                        continue
+                    failed = True
+                    for problem in problems[:10]:
+                        self.events.put(("log", f"  {archive_name}: {problem}\n"))
+                if not failed:
+                    verified += 1
+                    continue
+                self.events.put(("log", f"✗ {folder} failed verification\n"))
+                if catalog is not None:
+                    catalog.mark_failed(folder)
+                archives[folder] = (False, None)
+                self.metrics.folder(folder).success = False
+                # Carry the old state forward so the next run retries these changes
+                previous = base_manifest.folders.get(folder) if base_manifest else None
+                if previous is not None:
+                    manifest.set_folder(folder, previous)
+                else:
+                    manifest.folders.pop(folder, None)
+            self.events.put((
+                "log",
+                f"\nVerified {verified}/{len(verification)} archives ({checksum_hash})\n"
+            ))
+
+        try:
+            manifest.save(backup_dir)
+            if snapshot is not None:
+                snapshot.save(backup_dir)
+            if checksum_manifest is not None:
+                checksum_manifest.save(backup_dir)
+            journal.finish()
+            journal.discard_folder_results()
+        except OSError as e:
+            self.events.put(("log", f"⚠ Could not write backup manifest: {str(e)}\n"))
+
+        # Report archives in the order the folders were selected
+        for folder in folders:
+            success, archive_name = archives[folder]
+            if success:
+                success_count += 1
+            if isinstance(archive_name, list):
+                backed_up_files.extend(archive_name)
+            elif archive_name:
+                backed_up_files.append(archive_name)
+
+        throughput = governor.throughput(archive_seconds)
+        run_report = {
+            'backup': os.path.basename(backup_dir),
+            'backup_dir': backup_dir,
+            'source_path': source_path,
+            'archiver': archiver_name,
+            'mode': manifest.mode,
+            'base': manifest.base,
+            'total_folders': total_folders,
+            'success_count': success_count,
+            'resumed_folders': len(finished_folders),
+            'throughput': throughput,
+            'compression': compression_stats.to_dict(),
+            'schedule': schedule,
+            'replication': None,
+        }
+
+        if self.replicator is not None:
+            # The run's metadata goes last, once it describes every archive;
+            # the replicas get the report as it stands before replication
+            self.save_report(backup_dir, run_report)
+            for name in sorted(os.listdir(backup_dir)):
+                if name in METADATA_FILES or name.endswith((SHARDS_SUFFIX, INDEX_SUFFIX)):
+                    self.replicator.submit(name)
+            self.events.put(("status", "Waiting for replication..."))
+            with self.metrics.stage("replication"):
+                self.replicator.close()
+            run_report['replication'] = self.replicator.to_dict()
+
+        if catalog is not None:
+            catalog.finish_run(total_folders, success_count, manifest.mode, manifest.base)
+            catalog.close()
+
+        # Final status with list of backup files
+        result_message = f"Backup completed with {success_count}/{total_folders} successes.\n\n"
+        backup_location = backup_dir.replace('\\', '/')
+        result_message += f"Backup location: {backup_location}\n\n"
+
+        if use_chunk_store:
+            result_message += (
+                f"Chunk store: {chunk_store.stored_bytes / (1024 * 1024):.1f} MB new data stored "
+                f"for {chunk_store.logical_bytes / (1024 * 1024):.1f} MB backed up\n\n"
+            )
+
+        compression_summary = compression_stats.summary()
+        if compression_summary:
+            result_message += f"Compression classes:\n{compression_summary}\n\n"
+
+        if pending_folders:
+            result_message += f"{governor.summary(archive_seconds)}\n"
+            result_message += (
+                f"Makespan: {schedule['actual_makespan']:.1f}s "
+                f"(predicted {schedule['predicted_makespan']:.1f}s, {schedule['replans']} re-plans)\n\n"
+            )
+
+        if run_report['replication'] is not None:
+            result_message += f"{self.replicator.summary()}\n\n"
+
+        if backed_up_files:
+            result_message += "Backup files created:\n"
+            result_message += "\n".join(f"• {filename}" for filename in backed_up_files)
+            result_message += "\n\n"
+
+        # Old backups are only pruned once a complete new one exists
+        retention = dict(DEFAULT_RETENTION, **(self.config['retention'] or {}))
+        if retention['enabled'] and success_count == total_folders:
+            with self.metrics.stage("retention"):
+                result_message += self.apply_retention(os.path.dirname(backup_dir), retention['dry_run'])
+
+        # Send email notification
+        if notify:
+            email_subject = f"Backup Completed: {success_count}/{total_folders} successes"
+            with self.metrics.stage("notification"):
+                self.send_email_notification(email_subject, result_message)
+
+        self.save_report(backup_dir, run_report)
+
+        self.events.put(("log", result_message))
+        self.events.put(("progress", 100))
+        self.events.put(("progress_text", "Completed"))
+        self.events.put(("status", "Backup finished"))
+        return BackupResult(
+            backup_dir, total_folders, success_count, backed_up_files, archives, result_message,
+            compression_stats.to_dict(), throughput, self.metrics.stages()
+        )
+
+    def save_report(self, backup_dir, run):
+        """Write backup_report.json and, if configured, the Prometheus textfile"""
+        report = self.metrics.to_dict(**run)
+        try:
+            self.metrics.save(backup_dir, report)
+        except OSError as e:
+            self.events.put(("log", f"⚠ Could not write run report: {str(e)}\n"))
+        if self.config['metrics_textfile']:
+            try:
+                write_textfile(self.config['metrics_textfile'], report)
+            except OSError as e:
+                self.events.put(("log", f"⚠ Could not write metrics textfile: {str(e)}\n"))
+        return report
+
+    def apply_retention(self, destination_path, dry_run=False):
+        """Prune old backups per the retention settings; returns a summary for the result message"""
+        self.events.put(("status", "Applying retention policy..."))
+        try:
+            plan, errors = prune(
+                destination_path,
+                RetentionPolicy.from_config(self.config),
+                catalog_path=self.config['catalog_file'] or None,
+                dry_run=dry_run,
+                max_workers=max(1, int(self.config['max_workers']))
+            )
+        except OSError as e:
+            self.events.put(("log", f"⚠ Retention failed: {str(e)}\n"))
+            return ""
+        self.events.put(("log", f"\nRetention{' (dry run)' if dry_run else ''}:\n{format_plan(plan, dry_run)}\n"))
+        for error in errors:
+            self.events.put(("log", f"⚠ Could not delete {error}\n"))
+        verb = "Would delete" if dry_run else "Deleted"
+        return f"Retention: {verb} {len(plan.delete)} old backups ({plan.freed_bytes / (1024 ** 3):.2f} GB)\n\n"
+
+    def backup_single_folder(self, folder, folder_path, folder_size, backup_dir, transfer,
+                             manifest, base_manifest=None, chunk_store=None, snapshot=None,
+                             previous_snapshot=None, compression_stats=None, verifier=None,
+                             journal=None, catalog=None, governor=None):
+        """Archive one folder and record it in the run manifest.
+
+        Returns (success, archive_name); archive_name is None when nothing
+        was written, e.g. an incremental run with no changes, and a list of
+        part archives when the folder was sharded. Runs on a
+        worker thread, so it only reports through events.
+        """
+        archive_name = self.archiver.archive_name(folder)
+        previous = base_manifest.folders.get(folder) if base_manifest else None
+        folder_metrics = self.metrics.folder(folder)
+        folder_metrics.size = folder_size
+
+        self.events.put(("log", f"\nBacking up '{folder}'...\n"))
+        self._mark_folder(journal, folder, IN_PROGRESS, archive=archive_name)
+
+        try:
+            file_filter = FileFilter.from_config(self.config, folder)
+            others = [] if file_filter is not None else None
+            with self.metrics.stage("scan", folder):
+                entries = scan_folder(folder_path, manifest.hash_algorithm, file_filter=file_filter, others=others)
+            if file_filter is not None:
+                # Progress and throughput go by what is left after filtering
+                folder_size = sum(size for size, _, _ in entries.values())
+                folder_metrics.size = folder_size
+                self.events.put(("log", f"{folder}: {file_filter.summary()}\n"))
+            transfer.set_folder(folder, len(entries), folder_size)
+            if chunk_store is not None:
+                previous_files = previous_snapshot.folders.get(folder) if previous_snapshot else None
+                with self.metrics.stage("compression", folder):
+                    files, stored, skipped = chunk_store.backup_folder(
+                        folder_path,
+                        entries,
+                        previous_files,
+                        progress=lambda done, files_done=None: transfer.update(folder, done, files_done)
+                    )
+                snapshot.folders[folder] = files
+                if governor is not None:
+                    governor.record(folder_size, stored)
+                folder_metrics.files = len(entries)
+                folder_metrics.bytes_in = folder_size
+                folder_metrics.bytes_out = stored
+                folder_metrics.exit_code = 1 if skipped else 0
+                if skipped:
+                    self.events.put(("log", f"✗ {folder} failed ({skipped} files could not be read)\n"))
+                    return False, None
+                manifest.set_folder(folder, entries)
+                if catalog is not None:
+                    catalog.add_archive(folder, None, self._catalog_rows(folder, entries))
+                self._folder_done(journal, folder, None, manifest, snapshot=snapshot)
+                self.events.put(("log", f"✓ {folder} stored ({stored / (1024 * 1024):.1f} MB new)\n"))
+                return True, None
+
+            # A filtered folder is archived from its file list, so excluded files stay out.
+            # The directories and links it keeps go into the first archive of a full backup.
+            # The list is complete before archiving starts: the manifest, the shard plan
+            # and WinRAR's list file need all of it, and it shares the manifest's strings
+            files = sorted(entries) if file_filter is not None else None
+            extras = []
+            deleted = []
+            if previous is not None:
+                files = changed_files(entries, previous)
+                deleted = [rel_path for rel_path in previous if rel_path not in entries]
+                if not files:
+                    folder_metrics.exit_code = 0
+                    transfer.set_folder(folder, 0, 0)
+                    self.events.put(("log", f"= {folder} unchanged ({len(deleted)} deleted)\n"))
+                    manifest.set_folder(folder, entries, deleted)
+                    self._folder_done(journal, folder, None, manifest)
+                    return True, None
+                folder_size = sum(entries[rel_path][0] for rel_path in files)
+                transfer.set_folder(folder, len(files), folder_size)
+                self.events.put((
+                    "log",
+                    f"{len(files)} changed, {len(deleted)} deleted of {len(entries)} files in {folder}\n"
+                ))
+            elif files is not None and not files and not others:
+                folder_metrics.exit_code = 0
+                self.events.put(("log", f"= {folder} has no files left after filtering\n"))
+                manifest.set_folder(folder, entries)
+                self._folder_done(journal, folder, None, manifest)
+                return True, None
+            elif others:
+                extras = others
+
+            # Folders above shard_size are split into part archives made in parallel
+            parts = [(archive_name, files)]
+            shard_size = int(self.config['shard_size'] or 0)
+            if shard_size and folder_size > shard_size:
+                shards = plan_shards(
+                    {rel_path: entries[rel_path][0] for rel_path in (sorted(entries) if files is None else files)},
+                    shard_size
+                )
+                if shards:
+                    parts = [
+                        (shard_archive_name(self.archiver, folder, index, len(shards)), shard)
+                        for index, shard in enumerate(shards, start=1)
+                    ]
+                    archive_name = [name for name, _ in parts]
+                    self.events.put(("log", f"Splitting {folder} into {len(parts)} shards\n"))
+
+            policy = CompressionPolicy.from_config(self.config, folder, compression_stats)
+            part_lock = threading.Lock()
+
+            def archive_part(part):
+                name, part_files = part
+                checksums = FileChecksums(verifier.algorithm) if verifier is not None else None
+                index = None
+                if self.config['member_index']:
+                    index = ArchiveIndex(verifier.algorithm if verifier is not None else None)
+
+                def progress(done, files_done=None, current=None):
+                    transfer.update(folder, done, files_done, current, part=name)
+
+                returncode = self.archiver.create(
+                    folder_path,
+                    os.path.join(backup_dir, name),
+                    progress=progress,
+                    files=sorted(part_files + extras) if extras and name == parts[0][0] else part_files,
+                    policy=policy,
+                    checksums=checksums,
+                    governor=governor,
+                    index=index
+                )
+                if index is not None and returncode in (0, 1):
+                    try:
+                        index.save(os.path.join(backup_dir, name))
+                    except OSError as e:
+                        self.events.put(("log", f"⚠ Could not write member index of {name}: {str(e)}\n"))
+                return name, part_files, checksums, returncode
+
+            with self.metrics.stage("compression", folder):
+                if len(parts) == 1:
+                    results = [archive_part(parts[0])]
+                else:
+                    shard_workers = min(len(parts), int(self.config['shard_workers'] or 0) or os.cpu_count() or 1)
+                    # The folder's own job slot covers one worker; each further
+                    # worker needs a slot that is free right now
+                    if governor is not None:
+                        extra_jobs = governor.extra_jobs(shard_workers - 1)
+                    else:
+                        extra_jobs = nullcontext(shard_workers - 1)
+                    with extra_jobs as extra, ThreadPoolExecutor(
+                        max_workers=1 + extra,
+                        initializer=governor.lower_priority if governor is not None else None
+                    ) as pool:
+                        results = list(pool.map(archive_part, parts))
+            returncode = max(result[3] for result in results)
+            folder_metrics.exit_code = returncode
+            folder_metrics.files = len(entries) if files is None else len(files)
+            folder_metrics.bytes_in = folder_size
+
+            if returncode == 0:
+                sizes = {name: os.path.getsize(os.path.join(backup_dir, name)) for name, *_ in results}
+                archive_size = sum(sizes.values())
+                folder_metrics.bytes_out = archive_size
+                if governor is not None:
+                    governor.record(folder_size, archive_size)
+                manifest.set_folder(folder, entries, deleted)
+                if len(parts) > 1:
+                    save_shard_manifest(backup_dir, folder, [
+                        {'archive': name, 'files': len(part_files),
+                         'bytes': sum(entries[rel_path][0] for rel_path in part_files)}
+                        for name, part_files, _, _ in results
+                    ])
+                if catalog is not None:
+                    catalog.add_archives(folder, [
+                        (name, self._catalog_rows(folder, entries, part_files, checksums), sizes[name])
+                        for name, part_files, checksums, _ in results
+                    ])
+                if verifier is not None:
+                    # Only a folder whose archives all verified counts as done for a resume
+                    verified = {}
+                    failed = []
+
+                    def on_verified(name, checksums, archive_hash, size, problems):
+                        with part_lock:
+                            verified[name] = (name, checksums, archive_hash, size)
+                            if problems:
+                                failed.append(name)
+                            if len(verified) < len(results):
+                                return
+                        if failed:
+                            self._mark_folder(journal, folder, FAILED, archive=archive_name)
+                        else:
+                            self._folder_done(
+                                journal, folder, archive_name, manifest, archives=list(verified.values())
+                            )
+
+                    for name, _, checksums, _ in results:
+                        verifier.submit(
+                            folder, os.path.join(backup_dir, name), checksums,
+                            on_done=partial(on_verified, name, checksums)
+                        )
+                else:
+                    self._folder_done(
+                        journal, folder, archive_name, manifest,
+                        archives=[(name, None, None, sizes[name]) for name, *_ in results]
+                    )
+                self.events.put(("log", f"✓ {folder} backed up\n"))
+                return True, archive_name
+
+            self.events.put(("log", f"✗ {folder} failed (Error code: {returncode})\n"))
+
+        except Exception as e:
+            self.events.put(("log", f"⚠ Error: {folder} - {str(e)}\n"))
+
+        # Carry the old state forward so the next run retries these changes
+        if previous is not None:
+            manifest.set_folder(folder, previous)
+        self._mark_folder(journal, folder, FAILED, archive=archive_name)
+        return False, None
+
+    @staticmethod
+    def _catalog_rows(folder, entries, files=None, checksums=None):
+        """Catalog rows of the files in one archive (all of entries unless files is given)"""
+        rows = []
+        for rel_path in entries if files is None else files:
+            size, mtime, digest = entries[rel_path]
+            path = f"{folder}/{rel_path}"
+            if checksums is not None:
+                digest = checksums.files.get(path, digest)
+            rows.append((path, size, mtime, digest))
+        return rows
+
+    def _open_journal(self, backup_dir, source_path, folders):
+        """The journal of backup_dir and whether it came from an earlier run"""
+        try:
+            journal = BackupJournal.load(backup_dir)
+        except (OSError, ValueError) as e:
+            self.events.put(("log", f"⚠ Ignoring unreadable backup journal: {str(e)}\n"))
+            journal = None
+        if journal is not None:
+            return journal, True
+        journal = BackupJournal(backup_dir, source_path, folders, self.config)
+        self._update_journal(journal.save)
+        return journal, False
+
+    def _update_journal(self, action, *args, **kwargs):
+        # A journal that cannot be written only costs the ability to resume
+        try:
+            action(*args, **kwargs)
+        except OSError as e:
+            self.events.put(("log", f"⚠ Could not update backup journal: {str(e)}\n"))
+
+    def _mark_folder(self, journal, folder, state, **info):
+        if journal is not None:
+            self._update_journal(journal.mark, folder, state, **info)
+
+    def _folder_done(self, journal, folder, archive_name, manifest, snapshot=None, archives=()):
+        """Mark a folder done, keeping the metadata a resumed run needs for it.
+
+        archives has one (archive name, checksums, archive hash, size) per
+        archive written; checksums and hash are None when not verified.
+        """
+        if self.replicator is not None:
+            for name, *_ in archives:
+                self.replicator.submit(name)
+        if journal is None:
+            return
+        result = {
+            'archive': archive_name,
+            'entries': manifest.folders.get(folder, {}),
+            'deleted': manifest.deleted.get(folder, []),
+            'checksums': None,
+            'snapshot': snapshot.folders.get(folder) if snapshot is not None else None,
+        }
+        if archives and archives[0][1] is not None:
+            result['checksums'] = {
+                name: {'size': size, 'digest': archive_hash, 'files': checksums.files}
+                for name, checksums, archive_hash, size in archives
+            }
+        size = sum(part[3] for part in archives) if archives else None
+        archive_hash = archives[0][2] if len(archives) == 1 else None
+        self._update_journal(journal.save_folder_result, folder, result)
+        self._mark_folder(journal, folder, DONE, archive=archive_name, size=size, hash=archive_hash)
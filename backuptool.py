@@ -1,18 +1,25 @@
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import subprocess
-from datetime import datetime
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 import threading
-import queue
 import sv_ttk
 from tkinter.font import Font
-import time
-import json
-from pathlib import Path
+import multiprocessing
+from archivers import ARCHIVERS, TAR_CODECS, ZIP_CODECS
+from manifest import BACKUP_MODES, HASH_ALGORITHMS
+import backup_pipeline
+from backup_pipeline import BackupError, BackupPipeline
+from ui_channel import UpdateChannel
+from notifier import NotificationDispatcher
+from journal import find_resumable
+from folder_browser import FolderBrowser
+from progress import format_transfer
+
+# Lines kept in the log widget; older lines are trimmed
+MAX_LOG_LINES = 10000
+
+# Longest current file name shown under the progress bar
+MAX_CURRENT_FILE_CHARS = 60
 
 class BackupApp:
     def __init__(self, root):
@@ -21,10 +28,10 @@ class BackupApp:
         self.root.geometry("1000x700")
         
         # Configuration file path
-        self.CONFIG_FILE = "backup_config.json"
+        self.CONFIG_FILE = backup_pipeline.CONFIG_FILE
         
-        # Hardcoded WinRAR path
-        self.winrar_path = r"C:\Program Files\WinRAR\WinRAR.exe"
+        # Default WinRAR path, overridden by backup_config.json
+        self.winrar_path = backup_pipeline.DEFAULT_CONFIG['winrar_path']
         
         # Initialize email settings
         self.smtp_server = ""
@@ -33,43 +40,88 @@ class BackupApp:
         self.email_password = ""
         self.recipient_email = ""
         
+        # Full configuration, including keys not edited in the UI
+        self.config = {}
+        
+        # Number of folders archived at the same time
+        self.max_workers = 1
+        
+        # Archiver backend ("winrar", "tar" or "zip"), codec and level
+        self.archiver_name = "winrar"
+        self.codec = ""
+        self.compression_level = ""
+        
+        # "full", "incremental" or "differential", and the optional manifest hash
+        self.backup_mode = "full"
+        self.manifest_hash = ""
+        
+        # "archive" writes one archive per folder, "chunkstore" deduplicates into ChunkStore
+        self.storage_mode = "archive"
+        
         # Load configuration
         self.load_config()
         
         self.setup_ui()
-        self.folder_vars = []
         
-        # Queue for thread-safe GUI updates
-        self.gui_queue = queue.Queue()
+        # Coalescing channel for thread-safe GUI updates; only the main
+        # thread touches Tk, once per frame in process_queue
+        self.gui_queue = UpdateChannel()
+        self.progress_text = ""
+        self.job_progress = {}
+        
+        # Emails are sent in the background and retried from the outbox;
+        # starting it here also delivers anything left from earlier sessions
+        self.notifier = NotificationDispatcher(
+            self.config,
+            log=lambda text: self.gui_queue.put(("log", text))
+        ).start()
         self.root.after(100, self.process_queue)
 
     def load_config(self):
         """Load configuration from file"""
-        config_path = Path(self.CONFIG_FILE)
-        if config_path.exists():
-            try:
-                with open(config_path, 'r') as f:
-                    config = json.load(f)
-                    self.smtp_server = config.get('smtp_server', '')
-                    self.smtp_port = config.get('smtp_port', '587')
-                    self.email_address = config.get('email_address', '')
-                    self.email_password = config.get('email_password', '')
-                    self.recipient_email = config.get('recipient_email', '')
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load config: {e}")
+        try:
+            config = backup_pipeline.load_config(self.CONFIG_FILE)
+            self.config = config
+            self.smtp_server = config['smtp_server']
+            self.smtp_port = config['smtp_port']
+            self.email_address = config['email_address']
+            self.email_password = config['email_password']
+            self.recipient_email = config['recipient_email']
+            self.winrar_path = config['winrar_path']
+            self.max_workers = int(config['max_workers'])
+            self.archiver_name = config['archiver']
+            self.codec = config['codec']
+            self.compression_level = str(config['compression_level'])
+            self.backup_mode = config['backup_mode']
+            self.manifest_hash = config['manifest_hash']
+            self.storage_mode = config['storage']
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load config: {e}")
 
-    def save_config(self):
-        """Save configuration to file"""
-        config = {
+    def sync_config(self):
+        """Copy the settings edited in the UI into self.config"""
+        # Keep keys that are only edited by hand in backup_config.json
+        self.config.update({
             'smtp_server': self.smtp_server,
             'smtp_port': self.smtp_port,
             'email_address': self.email_address,
             'email_password': self.email_password,
-            'recipient_email': self.recipient_email
-        }
+            'recipient_email': self.recipient_email,
+            'max_workers': self.max_workers,
+            'archiver': self.archiver_name,
+            'codec': self.codec,
+            'compression_level': self.compression_level,
+            'backup_mode': self.backup_mode,
+            'manifest_hash': self.manifest_hash,
+            'storage': self.storage_mode,
+            'winrar_path': self.winrar_path
+        })
+
+    def save_config(self):
+        """Save configuration to file"""
+        self.sync_config()
         try:
-            with open(self.CONFIG_FILE, 'w') as f:
-                json.dump(config, f, indent=4)
+            backup_pipeline.save_config(self.config, self.CONFIG_FILE)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save config: {e}")
 
@@ -195,23 +247,13 @@ class BackupApp:
         self.folder_frame = ttk.LabelFrame(main_frame, text=" Folders ", padding=10)
         self.folder_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Canvas and Scrollbar for folders
-        self.canvas = tk.Canvas(self.folder_frame, bg="#333333", highlightthickness=0, height=150)
-        self.scrollbar = ttk.Scrollbar(self.folder_frame, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(
-                scrollregion=self.canvas.bbox("all")
-            )
+        # Virtualized folder list; folders stream in from a background scan
+        self.folder_browser = FolderBrowser(
+            self.folder_frame,
+            size_index_file=backup_pipeline.SIZE_INDEX_FILE,
+            on_status=lambda text: self.status_var.set(text)
         )
-        
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
+        self.folder_browser.pack(fill=tk.BOTH, expand=True)
         
         # Progress and Log Panel
         bottom_frame = ttk.Frame(main_frame)
@@ -231,6 +273,10 @@ class BackupApp:
         
         self.progress_label = ttk.Label(progress_frame, text="Ready", anchor=tk.W)
         self.progress_label.pack(fill=tk.X)
+
+        # Bytes, files, throughput and ETA as reported by the archive engines
+        self.transfer_label = ttk.Label(progress_frame, text="", anchor=tk.W)
+        self.transfer_label.pack(fill=tk.X)
         
         # Log Frame
         log_frame = ttk.LabelFrame(bottom_frame, text=" Log ", padding=10)
@@ -292,7 +338,7 @@ class BackupApp:
     def show_settings(self):
         settings_window = tk.Toplevel(self.root)
         settings_window.title("Settings")
-        settings_window.geometry("400x300")
+        settings_window.geometry("400x570")
         
         # Create StringVars and set their values from loaded config
         smtp_server_var = tk.StringVar(value=self.smtp_server)
@@ -300,6 +346,13 @@ class BackupApp:
         email_var = tk.StringVar(value=self.email_address)
         password_var = tk.StringVar(value=self.email_password)
         recipient_var = tk.StringVar(value=self.recipient_email)
+        workers_var = tk.StringVar(value=str(self.max_workers))
+        archiver_var = tk.StringVar(value=self.archiver_name)
+        codec_var = tk.StringVar(value=self.codec)
+        level_var = tk.StringVar(value=self.compression_level)
+        mode_var = tk.StringVar(value=self.backup_mode)
+        hash_var = tk.StringVar(value=self.manifest_hash)
+        storage_var = tk.StringVar(value=self.storage_mode)
         
         ttk.Label(settings_window, text="Application Settings", font=("Segoe UI", 12)).pack(pady=10)
         
@@ -321,15 +374,70 @@ class BackupApp:
         ttk.Label(email_frame, text="Recipient:").grid(row=4, column=0, sticky=tk.W, pady=2)
         ttk.Entry(email_frame, textvariable=recipient_var).grid(row=4, column=1, sticky=tk.EW, padx=5, pady=2)
         
+        backup_frame = ttk.LabelFrame(settings_window, text="Backup", padding=10)
+        backup_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(backup_frame, text="Parallel jobs:").grid(row=0, column=0, sticky=tk.W, pady=2)
+        ttk.Spinbox(backup_frame, from_=1, to=64, width=5, textvariable=workers_var).grid(row=0, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(backup_frame, text="Archiver:").grid(row=1, column=0, sticky=tk.W, pady=2)
+        ttk.Combobox(backup_frame, values=ARCHIVERS, state="readonly", width=10, textvariable=archiver_var).grid(row=1, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(backup_frame, text="Codec:").grid(row=2, column=0, sticky=tk.W, pady=2)
+        codec_box = ttk.Combobox(backup_frame, state="readonly", width=10, textvariable=codec_var)
+        codec_box.grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(backup_frame, text="Level:").grid(row=3, column=0, sticky=tk.W, pady=2)
+        ttk.Entry(backup_frame, width=5, textvariable=level_var).grid(row=3, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(backup_frame, text="Mode:").grid(row=4, column=0, sticky=tk.W, pady=2)
+        ttk.Combobox(backup_frame, values=BACKUP_MODES, state="readonly", width=12, textvariable=mode_var).grid(row=4, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(backup_frame, text="Manifest hash:").grid(row=5, column=0, sticky=tk.W, pady=2)
+        ttk.Combobox(backup_frame, values=("",) + HASH_ALGORITHMS, state="readonly", width=12, textvariable=hash_var).grid(row=5, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(backup_frame, text="Storage:").grid(row=6, column=0, sticky=tk.W, pady=2)
+        ttk.Combobox(backup_frame, values=("archive", "chunkstore"), state="readonly", width=12, textvariable=storage_var).grid(row=6, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        def update_codecs(*_):
+            # Codecs depend on the archiver; WinRAR has none to choose from
+            codecs = {"tar": list(TAR_CODECS), "zip": list(ZIP_CODECS)}.get(archiver_var.get(), [])
+            codec_box.config(values=codecs, state="readonly" if codecs else "disabled")
+            if codec_var.get() not in codecs:
+                codec_var.set("")
+        
+        archiver_var.trace_add("write", update_codecs)
+        update_codecs()
+        
         def save_settings():
+            try:
+                max_workers = int(workers_var.get())
+                if max_workers < 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", "Parallel jobs must be a whole number of at least 1!")
+                return
+            
+            level = level_var.get().strip()
+            if level and not level.isdigit():
+                messagebox.showerror("Error", "Level must be empty or a whole number!")
+                return
+            
             self.smtp_server = smtp_server_var.get()
             self.smtp_port = smtp_port_var.get()
             self.email_address = email_var.get()
             self.email_password = password_var.get()
             self.recipient_email = recipient_var.get()
+            self.max_workers = max_workers
+            self.archiver_name = archiver_var.get()
+            self.codec = codec_var.get()
+            self.compression_level = level
+            self.backup_mode = mode_var.get()
+            self.manifest_hash = hash_var.get()
+            self.storage_mode = storage_var.get()
             
             self.save_config()  # Save to file
-            messagebox.showinfo("Settings Saved", "Email settings have been saved.")
+            messagebox.showinfo("Settings Saved", "Settings have been saved.")
             settings_window.destroy()
         
         ttk.Button(
@@ -360,265 +468,130 @@ class BackupApp:
             messagebox.showerror("Error", "Source folder does not exist!")
             return
 
-        # Clear previous widgets
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
-        try:
-            folders = [f for f in os.listdir(source_path) if os.path.isdir(os.path.join(source_path, f))]
-            
-            if not folders:
-                ttk.Label(
-                    self.scrollable_frame, 
-                    text="No folders found",
-                    foreground="gray"
-                ).pack(pady=20)
-                return
-            
-            self.folder_vars = []
-            
-            # Organize folders into a grid (3 columns)
-            for i, folder in enumerate(folders):
-                var = tk.BooleanVar()
-                chk = ttk.Checkbutton(
-                    self.scrollable_frame, 
-                    text=folder, 
-                    variable=var,
-                    style="Toggle.TButton"
-                )
-                
-                row = i // 3
-                col = i % 3
-                chk.grid(row=row, column=col, padx=5, pady=1, sticky=tk.W)
-                self.folder_vars.append((folder, var))
-                
-            self.status_var.set(f"Loaded {len(folders)} folders")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load folders: {str(e)}")
-            self.status_var.set("Error loading folders")
+        self.folder_browser.load(source_path)
 
     def select_all_folders(self):
-        for _, var in self.folder_vars:
-            var.set(True)
+        self.folder_browser.select_all()
         self.status_var.set("All folders selected")
 
     def clear_log(self):
         self.log_text.delete(1.0, tk.END)
         self.status_var.set("Log cleared")
 
-    def send_email_notification(self, subject, message):
-        """Send email notification using saved settings"""
-        if not all([self.smtp_server, self.smtp_port, self.email_address, 
-                   self.email_password, self.recipient_email]):
-            self.log_text.insert(tk.END, "\nEmail notification skipped - incomplete settings\n")
-            return
-            
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.email_address
-            msg['To'] = self.recipient_email
-            msg['Subject'] = subject
-            
-            # Format the message with proper line breaks and formatting
-            formatted_message = f""" DevOps Backup Notification
-
-{message}
-
-Backup completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-"""
-            
-            msg.attach(MIMEText(formatted_message, 'plain'))
-            
-            with smtplib.SMTP(self.smtp_server, int(self.smtp_port)) as server:
-                server.starttls()
-                server.login(self.email_address, self.email_password)
-                server.send_message(msg)
-                
-            self.log_text.insert(tk.END, f"\nEmail notification sent to {self.recipient_email}\n")
-        except Exception as e:
-            self.log_text.insert(tk.END, f"\nFailed to send email: {str(e)}\n")
-
     def backup_folders(self):
-        # Validate inputs
-        if not self.winrar_entry.get() or not os.path.exists(self.winrar_entry.get()):
-            messagebox.showerror("Error", "Invalid WinRAR path!")
+        # Get selected folders
+        selected_folders = self.folder_browser.selected()
+        if not selected_folders:
+            messagebox.showwarning("Warning", "No folders selected!")
             return
-            
+        
+        # Worker threads must not read Tk widgets
+        self.winrar_path = self.winrar_entry.get()
+        self.sync_config()
+        pipeline = BackupPipeline(self.config, self.gui_queue, notifier=self.notifier)
+        
         source_path = self.source_entry.get()
-        destination_path = self.destination_entry.get()
-
-        if not source_path or not destination_path:
-            messagebox.showerror("Error", "Please select both folders!")
-            return
-
-        if not os.path.exists(source_path):
-            messagebox.showerror("Error", "Source folder doesn't exist!")
-            return
-
-        # Create destination if needed
-        if not os.path.exists(destination_path):
-            try:
-                os.makedirs(destination_path)
-            except OSError as e:
-                messagebox.showerror("Error", f"Can't create destination: {str(e)}")
-                return
-
-        # Create backup directory with timestamp
-        now = datetime.now()
-        backup_dir = os.path.join(
-            destination_path, 
-            f"Backup_{now.strftime('%Y-%m-%d_%H-%M-%S')}"
-        )
         
+        # Offer to continue a run that was interrupted, e.g. by a crash
+        resume_dir = find_resumable(self.destination_entry.get()) if self.destination_entry.get() else None
+        if resume_dir and not messagebox.askyesno(
+            "Resume Backup",
+            f"The backup {os.path.basename(resume_dir)} did not finish.\n\n"
+            "Resume it? Folders that were already backed up are skipped.\n"
+            "Choose No to start a new backup."
+        ):
+            resume_dir = None
+        
+        # Validate inputs and create the timestamped backup directory
         try:
-            os.makedirs(backup_dir)
-        except OSError as e:
-            messagebox.showerror("Error", f"Can't create backup folder: {str(e)}")
-            return
-
-        # Get selected folders
-        selected_folders = [folder for folder, var in self.folder_vars if var.get()]
-        if not selected_folders:
-            messagebox.showwarning("Warning", "No folders selected!")
+            if resume_dir:
+                backup_dir = resume_dir
+                selected_folders, source_path = pipeline.resume(resume_dir)
+            else:
+                backup_dir = pipeline.prepare(
+                    source_path,
+                    self.destination_entry.get(),
+                    selected_folders
+                )
+        except BackupError as e:
+            messagebox.showerror("Error", str(e))
             return
 
         # Prepare UI for backup
         self.clear_log()
+        self.job_progress = {}
         self.progress_bar["value"] = 0
         self.progress_label.config(text="Starting...")
+        self.transfer_label.config(text="")
         self.status_var.set("Backup in progress...")
         
         # Run backup in a separate thread
         threading.Thread(
             target=self.perform_backup,
-            args=(selected_folders, source_path, backup_dir),
+            args=(pipeline, selected_folders, source_path, backup_dir),
             daemon=True
         ).start()
 
-    def perform_backup(self, folders, source_path, backup_dir):
-        total_folders = len(folders)
-        success_count = 0
-        backed_up_files = []  # List to store successfully backed up files
-        
-        for i, folder in enumerate(folders):
-            folder_path = os.path.join(source_path, folder)
-            archive_name = f"{folder}.rar"
-            archive_path = os.path.join(backup_dir, archive_name)
-            
-            # Update UI
-            self.gui_queue.put(("log", f"\nBacking up '{folder}'...\n"))
-            self.gui_queue.put(("progress", (i / total_folders) * 100))
-            self.gui_queue.put(("progress_text", f"{i+1}/{total_folders}"))
-            
-            # Build WinRAR command with more performance-friendly settings
-            winrar_cmd = [
-                self.winrar_entry.get(),
-                "a",                    # Add to archive
-                "-r",                   # Recurse subdirectories
-                "-ep1",                 # Exclude base directory
-                "-ibck",                # Run in background
-                "-y",                   # Assume yes on all queries
-                "-m1",                  # Use fastest compression (less CPU intensive)
-                "-dh",                  # Disable hard links processing
-                "-oi",                  # Disable "save NTFS security info"
-                "-ol",                  # Store symbolic links as links
-                "-os",                  # Save NTFS alternate streams
-                "-t",                   # Test after archiving
-                archive_path,
-                folder_path
-            ]
-            
-            try:
-                # Configure process for minimal impact
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                
-                # Create process with low priority
-                process = subprocess.Popen(
-                    winrar_cmd,
-                    startupinfo=startupinfo,
-                    creationflags=(
-                        subprocess.CREATE_NO_WINDOW | 
-                        subprocess.BELOW_NORMAL_PRIORITY_CLASS
-                    )
-                )
-                
-                # Monitor progress without blocking
-                while process.poll() is None:
-                    time.sleep(0.5)  # Longer sleep to reduce CPU usage
-                    # Update progress if needed
-                    if os.path.exists(archive_path):
-                        try:
-                            current_size = os.path.getsize(archive_path)
-                            folder_size = sum(
-                                os.path.getsize(os.path.join(dirpath, filename)) 
-                                for dirpath, _, filenames in os.walk(folder_path) 
-                                for filename in filenames
-                            )
-                            progress = (i + (current_size / max(folder_size, 1))) / total_folders * 100
-                            self.gui_queue.put(("progress", progress))
-                        except:
-                            pass
-                    
-                    # Process GUI events in batches to reduce overhead
-                    if i % 5 == 0:
-                        self.root.update()
-                
-                if process.returncode == 0:
-                    self.gui_queue.put(("log", f"✓ {folder} backed up\n"))
-                    success_count += 1
-                    backed_up_files.append(archive_name)  # Add to list of successful backups
-                else:
-                    self.gui_queue.put(("log", f"✗ {folder} failed (Error code: {process.returncode})\n"))
-                    
-            except Exception as e:
-                self.gui_queue.put(("log", f"⚠ Error: {folder} - {str(e)}\n"))
-            
-            # Final update for this folder
-            self.gui_queue.put(("progress", ((i + 1) / total_folders) * 100))
-            self.root.update()
-
-        # Final status with list of backup files
-        result_message = f"Backup completed with {success_count}/{total_folders} successes.\n\n"
-        result_message += f"Backup location: {backup_dir.replace('\\', '/')}\n\n"
-        
-        if success_count > 0:
-            result_message += "Backup files created:\n"
-            result_message += "\n".join(f"• {filename}" for filename in backed_up_files)
-            result_message += "\n\n"
-        
-        # Send email notification
-        email_subject = f"Backup Completed: {success_count}/{total_folders} successes"
-        self.send_email_notification(email_subject, result_message)
-        
-        self.gui_queue.put(("log", result_message))
-        self.gui_queue.put(("progress", 100))
-        self.gui_queue.put(("progress_text", "Completed"))
-        self.gui_queue.put(("status", "Backup finished"))
-        self.gui_queue.put(("messagebox", f"Backup completed with {success_count}/{total_folders} successes"))
-        self.root.update()  # Ensure final updates are processed
+    def perform_backup(self, pipeline, folders, source_path, backup_dir):
+        result = pipeline.run(folders, source_path, backup_dir)
+        self.gui_queue.put((
+            "messagebox",
+            f"Backup completed with {result.success_count}/{result.total_folders} successes"
+        ))
 
     def process_queue(self):
-        try:
-            while True:
-                msg_type, msg = self.gui_queue.get_nowait()
-                if msg_type == "log":
-                    self.log_text.insert(tk.END, msg)
-                    self.log_text.see(tk.END)
-                elif msg_type == "progress":
-                    self.progress_bar["value"] = msg
-                elif msg_type == "progress_text":
-                    self.progress_label.config(text=msg)
-                elif msg_type == "status":
-                    self.status_var.set(msg)
-                elif msg_type == "messagebox":
-                    messagebox.showinfo("Backup Complete", msg)
-        except queue.Empty:
-            pass
+        """Apply one coalesced frame of worker updates on the Tk main thread"""
+        frame = self.gui_queue.drain()
+        if frame.log or frame.dropped:
+            text = frame.log
+            if frame.dropped:
+                text = f"\n… {frame.dropped} log messages skipped …\n" + text
+            self.log_text.insert(tk.END, text)
+            
+            # Keep the widget bounded on very long runs
+            line_count = int(self.log_text.index("end-1c").split(".")[0])
+            if line_count > MAX_LOG_LINES:
+                self.log_text.delete("1.0", f"{line_count - MAX_LOG_LINES}.0")
+            self.log_text.see(tk.END)
+        
+        if "progress" in frame.state:
+            self.progress_bar["value"] = frame.state["progress"]
+        if "status" in frame.state:
+            self.status_var.set(frame.state["status"])
+        if "transfer" in frame.state:
+            transfer = frame.state["transfer"]
+            text = format_transfer(transfer)
+            if transfer["current"] and transfer["bytes_done"] < transfer["total_bytes"]:
+                current = transfer["current"]
+                if len(current) > MAX_CURRENT_FILE_CHARS:
+                    current = "…" + current[-MAX_CURRENT_FILE_CHARS:]
+                text += f"  —  {current}"
+            self.transfer_label.config(text=text)
+        if "progress_text" in frame.state or frame.jobs:
+            self.progress_text = frame.state.get("progress_text", self.progress_text)
+            for job, fraction in frame.jobs.items():
+                if fraction >= 1.0:
+                    self.job_progress.pop(job, None)
+                else:
+                    self.job_progress[job] = fraction
+            running = ", ".join(
+                f"{job} {fraction * 100:.0f}%" for job, fraction in self.job_progress.items()
+            )
+            self.progress_label.config(
+                text=f"{self.progress_text}  —  {running}" if running else self.progress_text
+            )
+        
+        for msg_type, msg in frame.events:
+            if msg_type == "messagebox":
+                messagebox.showinfo("Backup Complete", msg)
         self.root.after(100, self.process_queue)
         
-if __name__ == "__main__":
+def main():
     root = tk.Tk()
     app = BackupApp(root)
     root.mainloop()
+
+if __name__ == "__main__":
+    # Needed by the chunk store's process pool in the frozen executable
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,322 @@
+"""Archive throughput benchmark for the backup pipeline.
+
+Generates synthetic source trees, backs each one up with every selected
+archiver/codec/level through BackupPipeline, and writes the results as JSON:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --engines tar:zst zip:deflate winrar --levels 1 3 --scale medium
+    python benchmark.py --output new.json --baseline old.json --tolerance 0.10
+
+Each case runs in a fresh child process so its peak RSS is measured alone.
+With --baseline, the exit code is 1 when any case lost more than the
+tolerance in MB/s compared to the baseline file.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import multiprocessing
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_VERSION = 1
+MB = 1024 * 1024
+
+# Tree shapes at scale 1 ("small"); other scales multiply counts or sizes
+TREE_SHAPES = ("many_small", "few_huge", "incompressible", "text_heavy")
+SCALES = {"small": 1, "medium": 4, "large": 16}
+
+DEFAULT_ENGINES = ("tar:none", "tar:gz", "tar:xz", "tar:zst", "zip:deflate", "zip:xz", "winrar", "chunkstore")
+
+WORDS = (
+    "backup archive folder server deploy pipeline error warning info debug request "
+    "response user config database cache timeout retry connection token session "
+    "build release version commit branch merge docker kubernetes node service"
+).split()
+
+
+class NullEvents:
+    """Discards pipeline events so logging does not skew timings"""
+
+    def put(self, item):
+        pass
+
+
+def _random_bytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def _text(rng, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = f"{rng.randint(0, 99999):05d} " + " ".join(rng.choices(WORDS, k=rng.randint(4, 16))) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def _write_stream(path, size, make_block, rng):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            block = make_block(rng, min(MB, remaining))
+            f.write(block)
+            remaining -= len(block)
+
+
+def generate_tree(root, shape, scale):
+    """Create one synthetic source folder; reused when it already exists"""
+    path = os.path.join(root, f"{shape}_x{scale}")
+    marker = os.path.join(root, f".{shape}_x{scale}.done")
+    if os.path.exists(marker):
+        return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    rng = random.Random(f"{shape}-{scale}")
+
+    if shape == "many_small":
+        for i in range(2000 * scale):
+            directory = os.path.join(path, f"d{i % 50:02d}", f"s{i % 7}")
+            os.makedirs(directory, exist_ok=True)
+            size = rng.randint(512, 8192)
+            data = _text(rng, size) if i % 2 else _random_bytes(rng, size)
+            with open(os.path.join(directory, f"f{i:06d}.dat"), "wb") as f:
+                f.write(data)
+    elif shape == "few_huge":
+        # Half text, half random: moderately compressible
+        for i in range(2):
+            def block(block_rng, size):
+                half = size // 2
+                return _text(block_rng, half) + _random_bytes(block_rng, size - half)
+            _write_stream(os.path.join(path, f"huge{i}.bin"), 16 * MB * scale, block, rng)
+    elif shape == "incompressible":
+        for i in range(16):
+            _write_stream(os.path.join(path, f"random{i:02d}.bin"), MB * scale, _random_bytes, rng)
+    elif shape == "text_heavy":
+        for i in range(16):
+            _write_stream(os.path.join(path, f"log{i:02d}.txt"), MB * scale, _text, rng)
+    else:
+        raise ValueError(f"Unknown tree shape: {shape}")
+
+    with open(marker, "w") as f:
+        f.write(datetime.now().isoformat())
+    return path
+
+
+def _tree_stats(path):
+    files = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+def _peak_rss():
+    """Peak resident set size of this process and its children, in bytes"""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def _run_case(case, source_root, work_dir, connection):
+    """Child process body: run one backup and send the measurements back"""
+    from backup_pipeline import BackupPipeline, BackupError
+
+    config = dict(case["config"])
+    destination = os.path.join(work_dir, "out")
+    shutil.rmtree(destination, ignore_errors=True)
+    pipeline = BackupPipeline(config, NullEvents(), size_index_file=os.path.join(work_dir, "bench_index.json"))
+    try:
+        backup_dir = pipeline.prepare(source_root, destination, [case["tree"]])
+        start = time.perf_counter()
+        result = pipeline.run([case["tree"]], source_root, backup_dir, notify=False)
+        seconds = time.perf_counter() - start
+    except BackupError as e:
+        connection.send({"error": str(e)})
+        return
+
+    if config["storage"] == "chunkstore":
+        _, bytes_out = _tree_stats(os.path.join(destination, "ChunkStore"))
+    else:
+        bytes_out = sum(
+            os.path.getsize(os.path.join(backup_dir, name)) for name in result.backed_up_files
+        )
+    connection.send({
+        "ok": result.success_count == result.total_folders,
+        "seconds": seconds,
+        "bytes_out": bytes_out,
+        "peak_rss_bytes": _peak_rss(),
+    })
+    shutil.rmtree(destination, ignore_errors=True)
+
+
+def run_case(case, source_root, work_dir):
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case, args=(case, source_root, work_dir, sender))
+    process.start()
+    sender.close()
+    try:
+        measurement = receiver.recv()
+    except EOFError:
+        measurement = {"error": f"benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return measurement
+
+
+def build_cases(trees, engines, levels, winrar_path, workers):
+    cases = []
+    for tree in trees:
+        for engine in engines:
+            name, _, codec = engine.partition(":")
+            for level in levels:
+                config = {
+                    "archiver": "tar" if name == "chunkstore" else name,
+                    "codec": codec,
+                    "compression_level": "" if level == "default" else level,
+                    "storage": "chunkstore" if name == "chunkstore" else "archive",
+                    "winrar_path": winrar_path,
+                    "max_workers": workers,
+                    "backup_mode": "full",
+                    "manifest_hash": "",
+                    # Only the archiving is measured: no catalog writes, metrics
+                    # textfile or replication (runs are started with notify=False)
+                    "catalog_file": "",
+                    "metrics_textfile": "",
+                    "replication": {},
+                }
+                cases.append({"tree": tree, "engine": engine, "level": level, "config": config})
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """Cases whose MB/s dropped by more than tolerance against the baseline"""
+    def key(result):
+        return result["tree"], result["engine"], str(result["level"])
+
+    previous = {key(result): result for result in baseline.get("results", []) if result.get("ok")}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if not old or not result.get("ok"):
+            continue
+        if result["mb_per_s"] < old["mb_per_s"] * (1 - tolerance):
+            regressions.append({
+                "tree": result["tree"],
+                "engine": result["engine"],
+                "level": result["level"],
+                "baseline_mb_per_s": old["mb_per_s"],
+                "mb_per_s": result["mb_per_s"],
+            })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark archive throughput of the backup pipeline")
+    parser.add_argument("--engines", nargs="+", default=list(DEFAULT_ENGINES),
+                        help="archiver[:codec] or chunkstore (default: all available)")
+    parser.add_argument("--levels", nargs="+", default=["default"], help="Compression levels to try")
+    parser.add_argument("--trees", nargs="+", default=list(TREE_SHAPES), choices=TREE_SHAPES)
+    parser.add_argument("--scale", default="small", choices=SCALES)
+    parser.add_argument("--workers", type=int, default=1, help="max_workers passed to the pipeline")
+    parser.add_argument("--workdir", default="bench_work", help="Where trees are generated (reused)")
+    parser.add_argument("--winrar", help="WinRAR/rar path (default: winrar_path from backup_config.json)")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed MB/s drop (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    from backup_pipeline import load_config
+    from archivers import ArchiveError, create_archiver
+
+    winrar_path = args.winrar or load_config()["winrar_path"]
+    engines = []
+    for engine in args.engines:
+        name, _, codec = engine.partition(":")
+        try:
+            if name != "chunkstore":
+                create_archiver(name, winrar_path=winrar_path, codec=codec or None).check()
+            engines.append(engine)
+        except ArchiveError as e:
+            print(f"Skipping {engine}: {e}", file=sys.stderr)
+
+    scale = SCALES[args.scale]
+    source_root = os.path.join(args.workdir, "trees")
+    os.makedirs(source_root, exist_ok=True)
+    trees = {}
+    for shape in args.trees:
+        print(f"Preparing {shape} tree...", file=sys.stderr)
+        path = generate_tree(source_root, shape, scale)
+        trees[os.path.basename(path)] = _tree_stats(path)
+
+    results = []
+    for case in build_cases(trees, engines, args.levels, winrar_path, args.workers):
+        files, bytes_in = trees[case["tree"]]
+        print(f"{case['tree']} / {case['engine']} / level {case['level']}...", file=sys.stderr)
+        measurement = run_case(case, source_root, args.workdir)
+        result = {
+            "tree": case["tree"],
+            "engine": case["engine"],
+            "level": case["level"],
+            "files": files,
+            "bytes_in": bytes_in,
+        }
+        if "error" in measurement:
+            result.update(ok=False, error=measurement["error"])
+        else:
+            seconds = max(measurement["seconds"], 1e-9)
+            result.update(
+                ok=measurement["ok"],
+                seconds=round(seconds, 4),
+                bytes_out=measurement["bytes_out"],
+                mb_per_s=round(bytes_in / MB / seconds, 2),
+                files_per_s=round(files / seconds, 1),
+                ratio=round(measurement["bytes_out"] / max(bytes_in, 1), 4),
+                peak_rss_bytes=measurement["peak_rss_bytes"],
+            )
+        results.append(result)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        if regressions:
+            exit_code = 1
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+# Catalog of every backed up file; the catalog_file setting, resolved next
+# to backup_config.json by backup_pipeline.load_config
+CATALOG_FILE = "backup_catalog.db"
+
+# File rows written per transaction
+BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    backup_dir TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    source_path TEXT,
+    mode TEXT,
+    base TEXT,
+    started TEXT,
+    finished TEXT,
+    total_folders INTEGER,
+    success_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    folder TEXT NOT NULL,
+    archive TEXT,
+    size INTEGER,
+    success INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS files (
+    archive_id INTEGER NOT NULL REFERENCES archives(id),
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT,
+    ext TEXT
+);
+CREATE INDEX IF NOT EXISTS files_path ON files(path);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+CREATE INDEX IF NOT EXISTS files_archive ON files(archive_id);
+CREATE INDEX IF NOT EXISTS archives_run ON archives(run_id, folder);
+"""
+
+# Columns added after the first catalog version: table -> ((column, type), ...)
+_ADDED_COLUMNS = {
+    "runs": (("base", "TEXT"),),
+    "archives": (("size", "INTEGER"),),
+    "files": (("ext", "TEXT"),),
+}
+
+# Created after the columns they cover exist
+_ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS files_ext ON files(ext);
+"""
+
+_GLOB_CHARS = set("*?[")
+
+
+def file_extension(path):
+    """What follows the last "." of the file name, or None; "*.ext" searches use it"""
+    name = path.rsplit("/", 1)[-1]
+    return name.rsplit(".", 1)[1] if "." in name else None
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    added = set()
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns:
+            if column not in existing:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                added.add((table, column))
+    if ("files", "ext") in added:
+        # Files recorded before the column existed
+        connection.create_function("file_extension", 1, file_extension, deterministic=True)
+        connection.execute("UPDATE files SET ext = file_extension(name)")
+        connection.commit()
+    connection.executescript(_ADDED_INDEXES)
+    return connection
+
+
+class CatalogWriter:
+    """Records a backup run in the catalog from a background thread.
+
+    The archiving threads only put rows on a queue; one writer thread owns
+    the SQLite connection and inserts them in large transactions. Errors
+    are reported through log and never stop the backup.
+    """
+
+    def __init__(self, path, log=None):
+        self.path = path
+        self.log = log or (lambda text: None)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="catalog", daemon=True)
+        self._thread.start()
+
+    def begin_run(self, backup_dir, source_path, mode):
+        self._queue.put(("run", (os.path.abspath(backup_dir), os.path.basename(backup_dir), source_path, mode)))
+
+    def add_archive(self, folder, archive_name, rows, size=None):
+        """rows: (path inside the archive, size, mtime_ns, hash) per file; size is the archive's"""
+        self.add_archives(folder, [(archive_name, rows, size)])
+
+    def add_archives(self, folder, archives):
+        """Record the (archive name, rows, size) of every part archive of a sharded folder"""
+        self._queue.put(("archive", (folder, archives)))
+
+    def mark_failed(self, folder):
+        self._queue.put(("failed", folder))
+
+    def finish_run(self, total_folders, success_count, mode=None, base=None):
+        """mode and base are what the run actually did, e.g. "full" after a fallback"""
+        self._queue.put(("finish", (total_folders, success_count, mode, base)))
+
+    def close(self):
+        """Wait until everything queued is written"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error as e:
+            self.log(f"⚠ Catalog disabled: {str(e)}\n")
+            while self._queue.get() is not None:
+                pass
+            return
+
+        run_id = None
+        pending = 0
+        with connection:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, payload = item
+                try:
+                    if kind == "run":
+                        run_id = self._insert_run(connection, *payload)
+                    elif run_id is None:
+                        continue
+                    elif kind == "archive":
+                        pending += self._insert_archive(connection, run_id, *payload)
+                    elif kind == "failed":
+                        connection.execute(
+                            "UPDATE archives SET success = 0 WHERE run_id = ? AND folder = ?",
+                            (run_id, payload)
+                        )
+                    elif kind == "finish":
+                        total_folders, success_count, mode, base = payload
+                        connection.execute(
+                            "UPDATE runs SET finished = ?, total_folders = ?, success_count = ?, "
+                            "mode = COALESCE(?, mode), base = ? WHERE id = ?",
+                            (datetime.now().isoformat(timespec="seconds"), total_folders, success_count,
+                             mode, base, run_id)
+                        )
+                    # Commit in large batches, or whenever the queue runs dry
+                    if pending >= BATCH_SIZE or self._queue.empty():
+                        connection.commit()
+                        pending = 0
+                except sqlite3.Error as e:
+                    connection.rollback()
+                    pending = 0
+                    self.log(f"⚠ Could not update catalog: {str(e)}\n")
+        connection.close()
+
+    @staticmethod
+    def _insert_run(connection, backup_dir, name, source_path, mode):
+        # A resumed run keeps the row of its first part
+        connection.execute(
+            "INSERT OR IGNORE INTO runs (backup_dir, name, source_path, mode, started) VALUES (?, ?, ?, ?, ?)",
+            (backup_dir, name, source_path, mode, datetime.now().isoformat(timespec="seconds"))
+        )
+        return connection.execute("SELECT id FROM runs WHERE backup_dir = ?", (backup_dir,)).fetchone()[0]
+
+    @staticmethod
+    def _insert_archive(connection, run_id, folder, archives):
+        # Replace what an interrupted part of the same run recorded
+        connection.execute(
+            "DELETE FROM files WHERE archive_id IN (SELECT id FROM archives WHERE run_id = ? AND folder = ?)",
+            (run_id, folder)
+        )
+        connection.execute("DELETE FROM archives WHERE run_id = ? AND folder = ?", (run_id, folder))
+        count = 0
+        for archive_name, rows, size in archives:
+            archive_id = connection.execute(
+                "INSERT INTO archives (run_id, folder, archive, size) VALUES (?, ?, ?, ?)",
+                (run_id, folder, archive_name, size)
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO files (archive_id, path, name, size, mtime_ns, hash, ext) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((archive_id, path, path.rsplit("/", 1)[-1], size, mtime, digest, file_extension(path))
+                 for path, size, mtime, digest in rows)
+            )
+            count += len(rows)
+        return count
+
+
+_QUERY = """
+SELECT runs.name, runs.backup_dir, archives.archive, files.path, files.size, files.mtime_ns, files.hash
+FROM files
+JOIN archives ON archives.id = files.archive_id
+JOIN runs ON runs.id = archives.run_id
+WHERE archives.success = 1 AND {condition}
+ORDER BY runs.name DESC, files.path
+"""
+
+
+def _rows(connection, condition, params, limit=None):
+    sql = _QUERY.format(condition=condition)
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return [
+        {
+            'backup': name,
+            'backup_dir': backup_dir,
+            'archive': archive,
+            'path': path,
+            'size': size,
+            'mtime': datetime.fromtimestamp(mtime / 1e9).isoformat(timespec="seconds") if mtime else None,
+            'hash': digest,
+        }
+        for name, backup_dir, archive, path, size, mtime, digest in connection.execute(sql, params)
+    ]
+
+
+def find_files(path, pattern, limit=100):
+    """Files whose path matches pattern, newest backup first.
+
+    Patterns with a "/" match the whole path ("Project1/src/*.py"), others
+    the file name ("*.xlsx", "report.docx"). Glob matching is case
+    sensitive, like the archives themselves.
+
+    A leading "*" keeps SQLite from using the name index, so "*.ext"
+    patterns are looked up through the indexed extension column instead.
+    """
+    column = "files.path" if "/" in pattern else "files.name"
+    operator = "GLOB" if _GLOB_CHARS & set(pattern) else "="
+    condition, params = f"{column} {operator} ?", (pattern,)
+    extension = pattern[2:]
+    if column == "files.name" and pattern.startswith("*.") and not _GLOB_CHARS & set(extension):
+        if "." in extension:
+            # "*.tar.gz": the extension column holds the last part, "gz"
+            extension = extension.rsplit(".", 1)[1]
+        condition, params = f"files.ext = ? AND {condition}", (extension, pattern)
+    with closing(connect(path)) as connection:
+        return _rows(connection, condition, params, limit)
+
+
+def file_versions(path, file_path):
+    """Every backup of one file ("Folder/dir/file"), newest first.
+
+    Each entry has 'changed' set when its size, mtime or hash differs from
+    the next older backup, so distinct versions are easy to pick out.
+    """
+    with closing(connect(path)) as connection:
+        rows = _rows(connection, "files.path = ?", (file_path,))
+    for row, older in zip(rows, rows[1:] + [None]):
+        row['changed'] = older is None or any(row[key] != older[key] for key in ('size', 'mtime', 'hash'))
+    return rows
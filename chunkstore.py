@@ -0,0 +1,367 @@
+import os
+import gzip
+import json
+import zlib
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is used without it
+    zstandard = None
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, chunking falls back to a Python loop
+    numpy = None
+
+# Shared chunk store below the destination folder
+STORE_DIR_NAME = "ChunkStore"
+# Written into every Backup_<timestamp> directory in chunk store mode
+SNAPSHOT_NAME = "snapshot.json.gz"
+SNAPSHOT_VERSION = 1
+
+# Content-defined chunking parameters (FastCDC with normalized chunking)
+MIN_CHUNK = 256 * 1024
+AVG_CHUNK = 1024 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+READ_SIZE = 8 * 1024 * 1024
+_MASK_S = (1 << 22) - 1     # harder cut condition below the average size
+_MASK_L = (1 << 18) - 1     # easier cut condition above it
+_MASK_64 = (1 << 64) - 1
+
+# Gear table derived from a fixed hash so chunk boundaries are identical on
+# every machine and every run
+_GEAR = [
+    int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), "little")
+    for i in range(256)
+]
+# The cut tests only look at the low 22 bits of the hash, so 32 bits of it do
+_GEAR_ARRAY = numpy.array([value & 0xFFFFFFFF for value in _GEAR], dtype=numpy.uint32) if numpy is not None else None
+# Bytes hashed per vector step while looking for a cut point
+_SCAN_BLOCK = 256 * 1024
+
+# Files are handed to worker processes in batches to amortize the IPC cost
+BATCH_FILES = 64
+BATCH_BYTES = 64 * 1024 * 1024
+
+# Chunk file header byte: which codec compressed the payload
+_RAW = b"-"
+_ZLIB = b"z"
+_ZSTD = b"s"
+_DECODE_ERRORS = (ValueError, RuntimeError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def _gear_hashes(data, start, stop):
+    """Low 32 bits of the gear hash after each byte of data[start:stop], from h = 0 at start.
+
+    Each step shifts the hash left by one, so a byte leaves the low 32 bits
+    after 32 steps: they are the sum of gear[data[i - k]] << k over k < 32.
+    The window is built up by doubling, five vector passes in all.
+    """
+    h = numpy.take(_GEAR_ARRAY, numpy.frombuffer(data, dtype=numpy.uint8, count=stop - start, offset=start))
+    width = 1
+    while width < 32:
+        h[width:] += h[:-width] << numpy.uint32(width)
+        width *= 2
+    return h
+
+
+def _cut_point_vectorized(data, start, normal_stop, stop):
+    """_cut_point with numpy, a block at a time; gives the same cut points"""
+    first = start + MIN_CHUNK
+    for low, high, mask in ((first, normal_stop, _MASK_S), (normal_stop, stop, _MASK_L)):
+        mask = numpy.uint32(mask)
+        for block in range(low, high, _SCAN_BLOCK):
+            block_end = min(block + _SCAN_BLOCK, high)
+            # A hash depends on the 31 bytes before it, no further back than first
+            origin = max(first, block - 31)
+            hits = numpy.flatnonzero((_gear_hashes(data, origin, block_end)[block - origin:] & mask) == 0)
+            if hits.size:
+                return block + int(hits[0]) + 1
+    return stop
+
+
+def _cut_point(data, start, end):
+    """Return the end offset of the chunk that starts at data[start].
+
+    Uses numpy when it is installed; the pure-Python loop gives the same
+    cut points but manages only a few MB/s per core.
+    """
+    size = end - start
+    if size <= MIN_CHUNK:
+        return end
+    limit = min(size, MAX_CHUNK)
+    normal = min(AVG_CHUNK, limit)
+    if _GEAR_ARRAY is not None:
+        return _cut_point_vectorized(data, start, start + normal, start + limit)
+    gear = _GEAR
+    h = 0
+    i = start + MIN_CHUNK
+    stop = start + normal
+    while i < stop:
+        h = ((h << 1) + gear[data[i]]) & _MASK_64
+        if not h & _MASK_S:
+            return i + 1
+        i += 1
+    stop = start + limit
+    while i < stop:
+        h = ((h << 1) + gear[data[i]]) & _MASK_64
+        if not h & _MASK_L:
+            return i + 1
+        i += 1
+    return stop
+
+
+def iter_chunks(f):
+    """Yield content-defined chunks of a binary file with bounded memory"""
+    buffer = b""
+    eof = False
+    while True:
+        if not eof and len(buffer) < MAX_CHUNK:
+            block = f.read(READ_SIZE)
+            if block:
+                buffer += block
+                continue
+            eof = True
+        if not buffer:
+            return
+        # The buffer holds at least MAX_CHUNK bytes unless the file ended
+        cut = _cut_point(buffer, 0, len(buffer))
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+def _chunk_path(chunk_dir, chunk_id):
+    return os.path.join(chunk_dir, chunk_id[:2], chunk_id)
+
+
+def _encode(data, level):
+    if zstandard is not None:
+        packed = _ZSTD + zstandard.ZstdCompressor(level=level).compress(data)
+    else:
+        packed = _ZLIB + zlib.compress(data, min(level, 9))
+    if len(packed) >= len(data) + 1:
+        return _RAW + data
+    return packed
+
+
+def _decode(packed):
+    codec, payload = packed[:1], packed[1:]
+    if codec == _RAW:
+        return payload
+    if codec == _ZLIB:
+        return zlib.decompress(payload)
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Chunk was written with zstd; install the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown chunk codec {codec!r}")
+
+
+def _store_files(chunk_dir, paths, level):
+    """Chunk, hash, compress and store files; runs in a worker process.
+
+    Returns one (chunk_ids, stored_bytes) tuple per path, or None for files
+    that could not be read.
+    """
+    results = []
+    for path in paths:
+        try:
+            chunk_ids = []
+            stored = 0
+            with open(path, "rb", buffering=0) as f:
+                for chunk in iter_chunks(f):
+                    chunk_id = hashlib.blake2b(chunk, digest_size=32).hexdigest()
+                    chunk_ids.append(chunk_id)
+                    target = _chunk_path(chunk_dir, chunk_id)
+                    if os.path.exists(target):
+                        continue
+                    packed = _encode(chunk, level)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    # Concurrent writers of the same chunk race harmlessly
+                    tmp_path = f"{target}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as out:
+                        out.write(packed)
+                    os.replace(tmp_path, target)
+                    stored += len(packed)
+            results.append((chunk_ids, stored))
+        except OSError:
+            results.append(None)
+    return results
+
+
+class Snapshot:
+    """Per-backup index mapping every file to its list of chunk ids"""
+
+    def __init__(self, created=None):
+        self.created = created or datetime.now().isoformat(timespec="seconds")
+        self.folders = {}
+
+    def save(self, backup_dir):
+        path = os.path.join(backup_dir, SNAPSHOT_NAME)
+        tmp_path = f"{path}.tmp"
+        data = {"version": SNAPSHOT_VERSION, "created": self.created, "folders": self.folders}
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, backup_dir):
+        """Load the snapshot of a backup directory, or None if it has none"""
+        path = os.path.join(backup_dir, SNAPSHOT_NAME)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SNAPSHOT_VERSION:
+            return None
+        snapshot = cls(data.get("created"))
+        snapshot.folders = data["folders"]
+        return snapshot
+
+
+def find_previous_snapshot(destination_path, exclude=None):
+    """Newest snapshot under destination_path other than exclude, or None"""
+    try:
+        names = sorted(
+            (name for name in os.listdir(destination_path)
+             if name.startswith("Backup_") and name != exclude),
+            reverse=True
+        )
+    except OSError:
+        return None
+    for name in names:
+        try:
+            snapshot = Snapshot.load(os.path.join(destination_path, name))
+        except (OSError, ValueError, EOFError):
+            continue
+        if snapshot is not None:
+            return snapshot
+    return None
+
+
+class ChunkStore:
+    """Content-addressed, deduplicating store shared by all backups.
+
+    Files are cut into content-defined chunks named by their BLAKE2b hash,
+    so identical data across folders and months is stored once. Chunking,
+    hashing and compression run in a process pool; use the store as a
+    context manager so the pool is shut down after the run.
+    """
+
+    def __init__(self, destination_path, max_workers=None, level=3):
+        self.root = os.path.join(destination_path, STORE_DIR_NAME)
+        self.chunk_dir = os.path.join(self.root, "chunks")
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.level = level
+        self._pool = None
+        # Run totals, updated by concurrent backup_folder calls
+        self.logical_bytes = 0
+        self.stored_bytes = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown()
+        self._pool = None
+
+    def backup_folder(self, folder_path, entries, previous=None, progress=None):
+        """Store the files described by entries ({rel_path: (size, mtime, hash)}).
+
+        Files whose size and mtime match the previous snapshot reuse its chunk
+        lists without being read. Returns (files, stored_bytes, skipped) where
+        files is the snapshot entry for this folder.
+        """
+        previous = previous or {}
+        files = {}
+        done = 0
+        files_done = 0
+        batches = []
+        batch = []
+        batch_bytes = 0
+        for rel_path, (size, mtime, _) in entries.items():
+            old = previous.get(rel_path)
+            if old and old["size"] == size and old["mtime"] == mtime:
+                files[rel_path] = old
+                done += size
+                files_done += 1
+                continue
+            batch.append((rel_path, size, mtime))
+            batch_bytes += size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                batches.append(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            batches.append(batch)
+        if progress:
+            progress(done, files_done)
+
+        futures = {}
+        for batch in batches:
+            paths = [os.path.join(folder_path, *rel_path.split("/")) for rel_path, _, _ in batch]
+            futures[self._pool.submit(_store_files, self.chunk_dir, paths, self.level)] = batch
+
+        stored = 0
+        skipped = 0
+        for future in as_completed(futures):
+            batch = futures[future]
+            for (rel_path, size, mtime), result in zip(batch, future.result()):
+                done += size
+                files_done += 1
+                if result is None:
+                    skipped += 1
+                    continue
+                chunk_ids, stored_bytes = result
+                files[rel_path] = {"size": size, "mtime": mtime, "chunks": chunk_ids}
+                stored += stored_bytes
+            if progress:
+                progress(done, files_done)
+
+        with self._lock:
+            self.logical_bytes += sum(info["size"] for info in files.values())
+            self.stored_bytes += stored
+        return files, stored, skipped
+
+    def restore_folder(self, snapshot, folder, target_dir, max_workers=None):
+        """Rebuild one folder of a snapshot below target_dir.
+
+        Every chunk is checked against its hash. A file with a missing or
+        corrupt chunk is removed again and reported. Returns (number of
+        files restored, problems).
+        """
+        files = snapshot.folders[folder]
+        base = os.path.join(target_dir, folder)
+
+        def restore(item):
+            rel_path, info = item
+            path = os.path.join(base, *rel_path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(path, "wb") as out:
+                    for chunk_id in info["chunks"]:
+                        with open(_chunk_path(self.chunk_dir, chunk_id), "rb") as f:
+                            chunk = _decode(f.read())
+                        if hashlib.blake2b(chunk, digest_size=32).hexdigest() != chunk_id:
+                            raise ValueError(f"chunk {chunk_id} is corrupt")
+                        out.write(chunk)
+                os.utime(path, ns=(info["mtime"], info["mtime"]))
+            except (OSError,) + _DECODE_ERRORS as e:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return f"{rel_path}: {str(e)}"
+            return None
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+            problems = [problem for problem in pool.map(restore, files.items()) if problem]
+        return len(files) - len(problems), problems
+
@@ -0,0 +1,165 @@
+import os
+import math
+import threading
+from collections import Counter
+
+# Compression classes, in the order they are reported
+STORE = "store"        # already compressed: stored as is
+TEXT = "text"          # compresses well: compressed hard
+DEFAULT = "default"    # everything else: fast level
+POLICY_CLASSES = (STORE, TEXT, DEFAULT)
+
+# Formats that are compressed already; recompressing them only costs CPU
+STORE_EXTENSIONS = frozenset((
+    ".7z", ".rar", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".txz", ".zst", ".lz4", ".lzma", ".cab",
+    ".jar", ".war", ".apk", ".whl", ".nupkg", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".epub",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp3", ".aac", ".m4a", ".ogg", ".opus", ".flac",
+    ".mp4", ".m4v", ".mkv", ".mov", ".avi", ".webm", ".wmv",
+    ".pdf", ".iso", ".dmg", ".msi", ".vhdx", ".qcow2",
+))
+
+TEXT_EXTENSIONS = frozenset((
+    ".txt", ".log", ".csv", ".tsv", ".json", ".jsonl", ".xml", ".yaml", ".yml", ".toml", ".ini",
+    ".cfg", ".conf", ".md", ".rst", ".html", ".htm", ".css", ".js", ".ts", ".py", ".java", ".cs",
+    ".c", ".h", ".cpp", ".hpp", ".go", ".rs", ".rb", ".php", ".sh", ".ps1", ".bat", ".sql", ".svg",
+))
+
+# Settings of the "compression_policy" block in backup_config.json
+DEFAULT_POLICY = {
+    'enabled': True,
+    'store_extensions': [],     # added to STORE_EXTENSIONS
+    'text_extensions': [],      # added to TEXT_EXTENSIONS
+    'entropy_threshold': 7.5,   # bits per byte of the sample at which a file is stored
+    'sample_size': 4096,        # bytes read from the start of files with unknown extensions
+}
+
+# Files smaller than this are not sampled; they are too small to matter
+MIN_SAMPLE_FILE_SIZE = 512
+
+
+def sample_entropy(data):
+    """Shannon entropy of data in bits per byte (0 to 8)"""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def _looks_like_text(data):
+    if b"\0" in data:
+        return False
+    # Printable ASCII, tabs/newlines, and UTF-8 lead/continuation bytes
+    binary = data.translate(None, bytes(range(32, 256)) + b"\t\n\r\f\b")
+    return len(binary) <= len(data) // 100
+
+
+class CompressionStats:
+    """Files and bytes per compression class, shared by the folders of a run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {name: [0, 0] for name in POLICY_CLASSES}
+
+    def add(self, compression_class, size):
+        with self._lock:
+            counts = self._counts[compression_class]
+            counts[0] += 1
+            counts[1] += size
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                name: {'files': files, 'bytes': size}
+                for name, (files, size) in self._counts.items()
+            }
+
+    def summary(self):
+        """One line per class that saw any files, for the result message"""
+        lines = []
+        for name, counts in self.to_dict().items():
+            if counts['files']:
+                lines.append(
+                    f"• {name}: {counts['files']} files, {counts['bytes'] / (1024 * 1024):.1f} MB"
+                )
+        return "\n".join(lines)
+
+
+class CompressionPolicy:
+    """Decides per file whether it is stored, compressed hard or compressed fast.
+
+    Known extensions decide on their own. Other files are judged from the
+    first sample_size bytes: high byte entropy means already-compressed data,
+    printable data means text. Every decision is counted in stats.
+    """
+
+    def __init__(self, store_extensions=(), text_extensions=(), entropy_threshold=7.5,
+                 sample_size=4096, stats=None):
+        self.store_extensions = STORE_EXTENSIONS | {ext.lower() for ext in store_extensions}
+        self.text_extensions = TEXT_EXTENSIONS | {ext.lower() for ext in text_extensions}
+        self.entropy_threshold = float(entropy_threshold)
+        self.sample_size = int(sample_size)
+        self.stats = stats
+
+    @classmethod
+    def from_config(cls, config, folder, stats=None):
+        """Policy for one folder, or None when the policy is disabled for it.
+
+        config is the whole backup configuration; settings under
+        compression_policy.folders.<folder> override the top-level ones.
+        """
+        settings = dict(DEFAULT_POLICY)
+        block = config.get('compression_policy') or {}
+        settings.update({key: value for key, value in block.items() if key != 'folders'})
+        settings.update((block.get('folders') or {}).get(folder, {}))
+        if not settings['enabled']:
+            return None
+        return cls(
+            settings['store_extensions'],
+            settings['text_extensions'],
+            settings['entropy_threshold'],
+            settings['sample_size'],
+            stats
+        )
+
+    def classify_name(self, path):
+        """Class from the file name alone, or None when it takes a sample"""
+        ext = os.path.splitext(path)[1].lower()
+        if ext in self.store_extensions:
+            return STORE
+        if ext in self.text_extensions:
+            return TEXT
+        return None
+
+    def classify(self, path, size, fileobj=None):
+        """Class of one regular file.
+
+        When fileobj is given the sample is read from it and it is rewound
+        afterwards, so the caller can archive from the same handle.
+        """
+        compression_class = self.classify_name(path)
+        if compression_class is None:
+            compression_class = DEFAULT
+            if size >= MIN_SAMPLE_FILE_SIZE:
+                sample = self._sample(path, fileobj)
+                if sample_entropy(sample) >= self.entropy_threshold:
+                    compression_class = STORE
+                elif _looks_like_text(sample):
+                    compression_class = TEXT
+        self.record(compression_class, size)
+        return compression_class
+
+    def record(self, compression_class, size):
+        if self.stats is not None:
+            self.stats.add(compression_class, size)
+
+    def _sample(self, path, fileobj):
+        try:
+            if fileobj is None:
+                with open(path, "rb") as f:
+                    return f.read(self.sample_size)
+            sample = fileobj.read(self.sample_size)
+            fileobj.seek(0)
+            return sample
+        except OSError:
+            return b""
@@ -0,0 +1,248 @@
+import os
+import re
+import time
+
+# Settings of the "filters" block in backup_config.json
+DEFAULT_FILTERS = {
+    'exclude': [],         # gitignore-style patterns, e.g. ["node_modules/", ".git/", "*.tmp"]
+    'include': [],         # when set, only matching files (or files below matching directories)
+    'min_size': 0,         # bytes; smaller files are left out, 0 = no limit
+    'max_size': 0,         # bytes; larger files are left out, 0 = no limit
+    'min_age_days': 0,     # files modified more recently are left out, 0 = no limit
+    'max_age_days': 0,     # files not modified for longer are left out, 0 = no limit
+}
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def glob_to_regex(pattern):
+    """Regex source matching relative paths for one gitignore-style glob.
+
+    * and ? stop at slashes, ** crosses them, [...] is a character class.
+    Patterns with a slash are anchored to the folder root; others match a
+    name at any depth.
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if char == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                if i + 2 == n:
+                    out.append(".*")
+                    i += 2
+                    continue
+                if pattern[i + 2] == "/":
+                    out.append("(?:.*/)?")
+                    i += 3
+                    continue
+            while i < n and pattern[i] == "*":
+                i += 1
+            out.append("[^/]*")
+            continue
+        if char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            start = i + 2 if pattern[i + 1:i + 2] in ("!", "^") else i + 1
+            end = pattern.find("]", start + 1)
+            if end < 0:
+                out.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif char == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return ("" if anchored else "(?:.*/)?") + "".join(out)
+
+
+class _RuleSet:
+    """An ordered gitignore-style pattern list compiled into a few regexes.
+
+    Consecutive patterns of the same sign are joined into one alternation
+    (one for directory-only patterns, one for the rest). As in gitignore the
+    last matching pattern wins, so the groups are tried from the end and the
+    first group that matches decides.
+    """
+
+    def __init__(self, patterns):
+        rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            pattern = pattern[1:] if negated else pattern
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+            source = glob_to_regex(pattern)
+            try:
+                re.compile(source)
+            except re.error as e:
+                raise ValueError(f"Invalid filter pattern {pattern!r}: {e}")
+            rules.append((negated, dir_only, source))
+
+        self._groups = []
+        for negated, dir_only, source in rules:
+            if not self._groups or self._groups[-1][0] != negated:
+                self._groups.append((negated, [], []))
+            self._groups[-1][2 if dir_only else 1].append(source)
+        self._groups = [
+            (negated, self._compile(any_sources), self._compile(dir_sources))
+            for negated, any_sources, dir_sources in reversed(self._groups)
+        ]
+
+    @staticmethod
+    def _compile(sources):
+        if not sources:
+            return None
+        return re.compile("(?:" + "|".join(sources) + ")", re.DOTALL).fullmatch
+
+    def __bool__(self):
+        return bool(self._groups)
+
+    def match(self, rel_path, is_dir):
+        """True or False from the last pattern matching rel_path, None if none does"""
+        for negated, match_any, match_dir in self._groups:
+            if (match_any and match_any(rel_path)) or (is_dir and match_dir and match_dir(rel_path)):
+                return not negated
+        return None
+
+
+class FileFilter:
+    """Include/exclude rules and size/age limits of one source folder.
+
+    Patterns are compiled once; walk() asks excludes_dir() for every
+    directory and accepts_file() for every file. Counts of what was left
+    out are kept for the log.
+    """
+
+    def __init__(self, exclude=(), include=(), min_size=0, max_size=0, min_age_days=0, max_age_days=0,
+                 now=None):
+        self.exclude = _RuleSet(exclude)
+        self.include = _RuleSet(include)
+        self.min_size = int(min_size or 0)
+        self.max_size = int(max_size or 0)
+        now = time.time() if now is None else now
+        # mtime bounds in ns: files must be older than newest_ns and newer than oldest_ns
+        self.newest_ns = int((now - float(min_age_days) * DAY_SECONDS) * 1e9) if min_age_days else None
+        self.oldest_ns = int((now - float(max_age_days) * DAY_SECONDS) * 1e9) if max_age_days else None
+        self.skipped_files = 0
+        self.skipped_dirs = 0
+
+    @classmethod
+    def from_config(cls, config, folder):
+        """Filter for one folder, or None when it has no rules.
+
+        config is the whole backup configuration. Patterns under
+        filters.folders.<folder> are added to the top-level ones; its size
+        and age limits replace them.
+        """
+        block = config.get('filters') or {}
+        folder_block = (block.get('folders') or {}).get(folder, {})
+        settings = dict(DEFAULT_FILTERS)
+        settings.update({key: value for key, value in block.items() if key != 'folders'})
+        settings.update(folder_block)
+        for key in ('exclude', 'include'):
+            settings[key] = list(block.get(key) or []) + list(folder_block.get(key) or [])
+        if not any(settings[key] for key in DEFAULT_FILTERS):
+            return None
+        return cls(
+            settings['exclude'],
+            settings['include'],
+            settings['min_size'],
+            settings['max_size'],
+            settings['min_age_days'],
+            settings['max_age_days']
+        )
+
+    def excludes_dir(self, rel_path):
+        return bool(self.exclude.match(rel_path, True))
+
+    def includes_dir(self, rel_path):
+        """True when include patterns select the whole directory"""
+        return bool(self.include.match(rel_path, True))
+
+    def accepts_link(self, rel_path, included=False):
+        """Whether a symbolic link is backed up; only the patterns apply to links"""
+        if self.exclude and self.exclude.match(rel_path, False):
+            return False
+        if self.include and not included and not self.include.match(rel_path, False):
+            return False
+        return True
+
+    def accepts_file(self, rel_path, st, included=False):
+        """Whether a file (with its stat result) is backed up; included is set below included directories"""
+        if not self.accepts_link(rel_path, included):
+            return False
+        if self.min_size and st.st_size < self.min_size:
+            return False
+        if self.max_size and st.st_size > self.max_size:
+            return False
+        if self.newest_ns is not None and st.st_mtime_ns > self.newest_ns:
+            return False
+        if self.oldest_ns is not None and st.st_mtime_ns < self.oldest_ns:
+            return False
+        return True
+
+    def summary(self):
+        """What the walks left out, for the log"""
+        return f"{self.skipped_files} files and {self.skipped_dirs} directories left out by filters"
+
+
+def walk(folder_path, file_filter=None, others=None):
+    """Yield (relative_path, stat_result) for every regular file below folder_path.
+
+    Relative paths use forward slashes. Directories excluded by file_filter
+    are pruned without being opened. Only the directories still to be
+    visited are held in memory, so callers can stream the files onward.
+
+    When others is a list, the directories (with a trailing "/") and
+    symbolic links that file_filter keeps are appended to it. With include
+    patterns, only directories inside included ones are kept; the others
+    are recreated from the paths of their files.
+    """
+    stack = [(folder_path, "", False)]
+    while stack:
+        path, prefix, included = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    rel_path = prefix + entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if file_filter is None:
+                                subtree = False
+                            elif file_filter.excludes_dir(rel_path):
+                                file_filter.skipped_dirs += 1
+                                continue
+                            else:
+                                subtree = included or (bool(file_filter.include) and file_filter.includes_dir(rel_path))
+                            stack.append((entry.path, rel_path + "/", subtree))
+                            if others is not None and (file_filter is None or not file_filter.include or subtree):
+                                others.append(rel_path + "/")
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            if file_filter is None or file_filter.accepts_file(rel_path, st, included):
+                                yield rel_path, st
+                            else:
+                                file_filter.skipped_files += 1
+                        elif others is not None and entry.is_symlink():
+                            if file_filter is None or file_filter.accepts_link(rel_path, included):
+                                others.append(rel_path)
+                            else:
+                                file_filter.skipped_files += 1
+                    except OSError:
+                        pass
+        except OSError:
+            pass
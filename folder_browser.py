@@ -0,0 +1,282 @@
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+from size_index import FolderSizeIndex
+
+# Folder names handed from the scan thread to the GUI per message
+SCAN_BATCH = 500
+# How often the GUI picks up scan results (ms)
+POLL_INTERVAL = 50
+# Delay between the last keystroke in the filter box and refiltering (ms)
+FILTER_DELAY = 150
+
+CHECKED = "☑"
+UNCHECKED = "☐"
+
+
+def format_size(size):
+    if size is None:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class FolderBrowser(ttk.Frame):
+    """Checkable folder list that stays responsive with tens of thousands of folders.
+
+    The source is enumerated with os.scandir on a background thread and the
+    names stream in as they are found. The Treeview only holds as many rows
+    as fit on screen; scrolling re-labels those rows from the folder list
+    instead of creating one widget per folder. Sizes come from the cached
+    FolderSizeIndex and are never computed here.
+    """
+
+    def __init__(self, master, size_index_file=None, on_status=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.size_index_file = size_index_file
+        self.on_status = on_status or (lambda text: None)
+
+        self.source_path = None
+        self.folders = []       # folder names, in scan order until the scan ends
+        self.visible = []       # indices into self.folders that match the filter
+        self.sizes = {}         # folder name -> bytes from the size index
+        self.checked = set()
+        self.offset = 0
+        self.rows = []          # Treeview item ids, one per on-screen row
+
+        self._scan_id = 0
+        self._results = queue.SimpleQueue()
+        self._filter_job = None
+
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", self._schedule_filter)
+        ttk.Entry(filter_frame, textvariable=self.filter_var).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        self.count_label = ttk.Label(filter_frame, text="", foreground="gray")
+        self.count_label.pack(side=tk.RIGHT)
+
+        list_frame = ttk.Frame(self)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(
+            list_frame,
+            columns=("check", "name", "size"),
+            show="headings",
+            selectmode="none"
+        )
+        self.tree.heading("check", text="")
+        self.tree.heading("name", text="Folder", anchor=tk.W)
+        self.tree.heading("size", text="Size", anchor=tk.E)
+        self.tree.column("check", width=30, stretch=False, anchor=tk.CENTER)
+        self.tree.column("name", width=400, anchor=tk.W)
+        self.tree.column("size", width=100, stretch=False, anchor=tk.E)
+        self.scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self._on_scrollbar)
+
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<Configure>", lambda e: self._resize_rows(e.height))
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(3))
+
+    # Loading
+
+    def load(self, source_path):
+        """Start enumerating source_path; results stream in on the GUI thread"""
+        self._scan_id += 1
+        self.source_path = source_path
+        self.folders = []
+        self.visible = []
+        self.sizes = {}
+        self.checked = set()
+        self.offset = 0
+        self._render()
+        self.on_status("Loading folders...")
+
+        threading.Thread(
+            target=self._scan,
+            args=(self._scan_id, source_path),
+            daemon=True
+        ).start()
+        self.after(POLL_INTERVAL, self._poll, self._scan_id)
+
+    def _scan(self, scan_id, source_path):
+        """Runs on a worker thread; never touches Tk"""
+        names = []
+        batch = []
+        try:
+            with os.scandir(source_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            batch.append(entry.name)
+                    except OSError:
+                        continue
+                    if len(batch) >= SCAN_BATCH:
+                        self._results.put((scan_id, "folders", batch))
+                        names.extend(batch)
+                        batch = []
+        except OSError as e:
+            self._results.put((scan_id, "error", str(e)))
+            return
+        if batch:
+            self._results.put((scan_id, "folders", batch))
+            names.extend(batch)
+        self._results.put((scan_id, "done", None))
+
+        # Sizes are looked up in the cached index only; nothing is rescanned.
+        # "sizes" is always sent, even empty, as it ends the polling
+        sizes = {}
+        if self.size_index_file and os.path.exists(self.size_index_file):
+            index = FolderSizeIndex(self.size_index_file)
+            for name in names:
+                files, size = index.totals(os.path.join(source_path, name))
+                if files:
+                    sizes[name] = size
+        self._results.put((scan_id, "sizes", sizes))
+
+    def _poll(self, scan_id):
+        if scan_id != self._scan_id:
+            return
+        finished = False
+        changed = False
+        while True:
+            try:
+                result_id, kind, payload = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result_id != scan_id:
+                continue  # left over from an earlier load
+            if kind == "folders":
+                start = len(self.folders)
+                self.folders.extend(payload)
+                self.visible.extend(
+                    i for i in range(start, len(self.folders)) if self._matches(self.folders[i])
+                )
+                changed = True
+            elif kind == "done":
+                self.folders.sort(key=str.lower)
+                self._apply_filter()
+                self.on_status(f"Loaded {len(self.folders)} folders")
+            elif kind == "sizes":
+                self.sizes = payload
+                changed = True
+                finished = True
+            elif kind == "error":
+                self.on_status(f"Error loading folders: {payload}")
+                finished = True
+        if changed:
+            self._render()
+        if not finished:
+            self.after(POLL_INTERVAL, self._poll, scan_id)
+
+    # Selection
+
+    def selected(self):
+        """Checked folder names in display order"""
+        return [name for name in self.folders if name in self.checked]
+
+    def select_all(self):
+        """Check every folder that matches the current filter"""
+        self.checked.update(self.folders[i] for i in self.visible)
+        self._render()
+
+    def _on_click(self, event):
+        item = self.tree.identify_row(event.y)
+        if item in self.rows:
+            position = self.offset + self.rows.index(item)
+            if position < len(self.visible):
+                name = self.folders[self.visible[position]]
+                if name in self.checked:
+                    self.checked.discard(name)
+                else:
+                    self.checked.add(name)
+                self._render()
+            return "break"
+
+    # Filtering
+
+    def _matches(self, name):
+        needle = self.filter_var.get().strip().lower()
+        return not needle or needle in name.lower()
+
+    def _schedule_filter(self, *_):
+        if self._filter_job:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(FILTER_DELAY, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        needle = self.filter_var.get().strip().lower()
+        if needle:
+            self.visible = [i for i, name in enumerate(self.folders) if needle in name.lower()]
+        else:
+            self.visible = list(range(len(self.folders)))
+        self.offset = 0
+        self._render()
+
+    # Virtual scrolling
+
+    def _row_height(self):
+        height = ttk.Style().lookup("Treeview", "rowheight")
+        try:
+            return max(int(height), 1)
+        except (TypeError, ValueError):
+            return 20
+
+    def _resize_rows(self, height):
+        # Leave room for the heading so the Treeview never scrolls itself
+        wanted = max(1, (height - self._row_height() - 4) // self._row_height())
+        while len(self.rows) < wanted:
+            self.rows.append(self.tree.insert("", tk.END, values=("", "", "")))
+        while len(self.rows) > wanted:
+            self.tree.delete(self.rows.pop())
+        self._render()
+
+    def _scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.visible) - len(self.rows)))
+        self._render()
+
+    def _scroll_by(self, rows):
+        self._scroll_to(self.offset + rows)
+        return "break"
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.visible)))
+        elif unit == "pages":
+            self._scroll_by(int(amount) * max(1, len(self.rows) - 1))
+        else:
+            self._scroll_by(int(amount))
+
+    def _render(self):
+        """Re-label the on-screen rows from the current offset"""
+        total = len(self.visible)
+        self.offset = max(0, min(self.offset, total - len(self.rows)))
+        for row, item in enumerate(self.rows):
+            position = self.offset + row
+            if position < total:
+                name = self.folders[self.visible[position]]
+                mark = CHECKED if name in self.checked else UNCHECKED
+                self.tree.item(item, values=(mark, name, format_size(self.sizes.get(name))))
+            else:
+                self.tree.item(item, values=("", "", ""))
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + len(self.rows)) / total))
+        else:
+            self.scrollbar.set(0, 1)
+        self.count_label.config(
+            text=f"{len(self.checked)} selected / {total} shown / {len(self.folders)} folders"
+        )
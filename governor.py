@@ -0,0 +1,368 @@
+import os
+import time
+import signal
+import shutil
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Settings of the "governor" block in backup_config.json
+DEFAULT_GOVERNOR = {
+    'read_bytes_per_sec': 0,     # source reads of the tar/zip engines, 0 = unlimited
+    'write_bytes_per_sec': 0,    # archive writes of the tar/zip engines, 0 = unlimited
+    'max_jobs': 0,               # concurrent archive jobs, 0 = max_workers
+    'nice': 0,                   # Linux: nice level of the backup threads, 0 = unchanged
+    'ionice': '',                # Linux: "idle" or "best-effort" I/O class of the backup threads
+    'windows': [],               # e.g. ["22:00-06:00"]: only archive inside these local times
+    'winrar_sleep_ms': 0,        # WinRAR's own -ri sleep time between its I/O operations
+}
+
+# ionice classes by name, as the ionice tool numbers them
+IONICE_CLASSES = {"best-effort": ("2", "7"), "idle": ("3", None)}
+
+# How often a running job checks whether its time window has closed
+WINDOW_CHECK_INTERVAL = 1.0
+
+# Longest single sleep while waiting for a window to open
+PAUSE_POLL_SECONDS = 60
+
+
+def parse_window(text):
+    """(start, end) minutes after midnight of an "HH:MM-HH:MM" window"""
+    try:
+        start, end = (datetime.strptime(part.strip(), "%H:%M") for part in text.split("-"))
+    except ValueError:
+        raise ValueError(f"Invalid time window {text!r}, expected HH:MM-HH:MM")
+    return start.hour * 60 + start.minute, end.hour * 60 + end.minute
+
+
+def _in_window(window, minute):
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end  # crosses midnight
+
+
+class TokenBucket:
+    """Blocking rate limiter shared by every thread of a run.
+
+    consume() takes the tokens at once and lets the bucket go into debt, so
+    large reads never wait for a full bucket; the next caller sleeps the
+    debt off instead. The bucket holds at most one second of tokens.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._tokens = self.rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        """Take count tokens; returns the seconds slept"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= count
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _ThrottledWriter:
+    """File object whose writes are paced by the governor; everything else is passed through"""
+
+    def __init__(self, raw, governor):
+        self._raw = raw
+        self._governor = governor
+
+    def write(self, data):
+        self._governor.write(len(data))
+        return self._raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def _suspend(process):
+    if os.name == "nt":
+        import ctypes
+        ctypes.windll.ntdll.NtSuspendProcess(int(process._handle))
+    else:
+        process.send_signal(signal.SIGSTOP)
+
+
+def _resume(process):
+    if os.name == "nt":
+        import ctypes
+        ctypes.windll.ntdll.NtResumeProcess(int(process._handle))
+    else:
+        process.send_signal(signal.SIGCONT)
+
+
+class ResourceGovernor:
+    """I/O and CPU budget of the backup jobs.
+
+    Archivers call read() and write() with the bytes they move; token
+    buckets pace them to the configured rates, and outside the time windows
+    the calls block until the next window opens. job() limits how many
+    archive jobs run at once and lowers the CPU and I/O priority of the
+    thread running them. record() collects what each job moved, for the
+    throughput report.
+    """
+
+    def __init__(self, read_bytes_per_sec=0, write_bytes_per_sec=0, max_jobs=0, nice=0, ionice="",
+                 windows=(), winrar_sleep_ms=0, log=None):
+        self.read_limit = int(read_bytes_per_sec or 0)
+        self.write_limit = int(write_bytes_per_sec or 0)
+        self.max_jobs = int(max_jobs or 0)
+        self.nice = int(nice or 0)
+        if ionice and ionice not in IONICE_CLASSES:
+            raise ValueError(f"Unknown ionice class {ionice!r}, expected one of {', '.join(IONICE_CLASSES)}")
+        self.ionice = ionice or ""
+        self.windows = [parse_window(window) for window in windows]
+        self.winrar_sleep_ms = int(winrar_sleep_ms or 0)
+        self.log = log or (lambda text: None)
+
+        self._read_bucket = TokenBucket(self.read_limit) if self.read_limit else None
+        self._write_bucket = TokenBucket(self.write_limit) if self.write_limit else None
+        self._jobs = threading.BoundedSemaphore(self.max_jobs) if self.max_jobs else None
+        self._lock = threading.Lock()
+        self._pause_lock = threading.Lock()
+        self._window_checked = 0.0
+        self._prioritized = set()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.throttled_seconds = 0.0
+        self.paused_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config, log=None):
+        settings = dict(DEFAULT_GOVERNOR, **(config.get('governor') or {}))
+        return cls(
+            settings['read_bytes_per_sec'],
+            settings['write_bytes_per_sec'],
+            settings['max_jobs'],
+            settings['nice'],
+            settings['ionice'],
+            settings['windows'],
+            settings['winrar_sleep_ms'],
+            log
+        )
+
+    @property
+    def limited(self):
+        return bool(self.read_limit or self.write_limit or self.max_jobs or self.windows)
+
+    def job_limit(self, max_workers):
+        """Worker pool size for max_workers under the job cap"""
+        return min(max_workers, self.max_jobs) if self.max_jobs else max_workers
+
+    @contextmanager
+    def job(self):
+        """Run one archive job inside the budget: waits for a free slot and an open window"""
+        if self._jobs is not None:
+            self._jobs.acquire()
+        try:
+            self.wait_for_window()
+            self.lower_priority()
+            yield
+        finally:
+            if self._jobs is not None:
+                self._jobs.release()
+
+    @contextmanager
+    def extra_jobs(self, count):
+        """Take up to count more job slots without waiting; yields how many were taken.
+
+        A job that fans out, such as a sharded folder, runs one worker in
+        its own slot and one more per extra slot, so max_jobs bounds every
+        worker. Waiting here could deadlock jobs that each hold a slot.
+        """
+        taken = 0
+        if self._jobs is None:
+            yield count
+            return
+        try:
+            while taken < count and self._jobs.acquire(blocking=False):
+                taken += 1
+            yield taken
+        finally:
+            for _ in range(taken):
+                self._jobs.release()
+
+    def read(self, count):
+        self._pace(self._read_bucket, count)
+
+    def write(self, count):
+        self._pace(self._write_bucket, count)
+
+    def writer(self, raw):
+        """raw with its writes paced, or raw itself when writes are unlimited"""
+        return _ThrottledWriter(raw, self) if self._write_bucket is not None or self.windows else raw
+
+    def _pace(self, bucket, count):
+        if self.windows and time.monotonic() - self._window_checked >= WINDOW_CHECK_INTERVAL:
+            self.wait_for_window()
+        if bucket is not None:
+            waited = bucket.consume(count)
+            if waited:
+                with self._lock:
+                    self.throttled_seconds += waited
+
+    def record(self, bytes_in, bytes_out):
+        """Count the source bytes a finished job archived and the bytes it wrote"""
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def window_open(self, now=None):
+        if not self.windows:
+            return True
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        return any(_in_window(window, minute) for window in self.windows)
+
+    def next_window_start(self, now=None):
+        now = now or datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        starts = []
+        for start, _ in self.windows:
+            candidate = midnight + timedelta(minutes=start)
+            starts.append(candidate if candidate > now else candidate + timedelta(days=1))
+        return min(starts)
+
+    def wait_for_window(self):
+        """Block while outside every time window; returns the seconds waited"""
+        self._window_checked = time.monotonic()
+        if self.window_open():
+            return 0.0
+        # One thread logs and sleeps; the others queue up behind it
+        with self._pause_lock:
+            started = time.monotonic()
+            if not self.window_open():
+                self.log(f"Outside the backup window - paused until {self.next_window_start():%H:%M}\n")
+                while not self.window_open():
+                    remaining = (self.next_window_start() - datetime.now()).total_seconds()
+                    time.sleep(min(max(remaining, 1), PAUSE_POLL_SECONDS))
+                self.log("Backup window open - resuming\n")
+            waited = time.monotonic() - started
+        self._window_checked = time.monotonic()
+        with self._lock:
+            self.paused_seconds += waited
+        return waited
+
+    def hold(self, process):
+        """Suspend an external archiver process while outside the time windows"""
+        if self.window_open():
+            return
+        try:
+            _suspend(process)
+        except (OSError, AttributeError):
+            self.wait_for_window()
+            return
+        try:
+            self.wait_for_window()
+        finally:
+            _resume(process)
+
+    def lower_priority(self):
+        """Apply nice/ionice to the calling thread (Linux; a no-op elsewhere).
+
+        Both are per thread on Linux and inherited by the processes a thread
+        starts, so external archivers run at the same priority.
+        """
+        if os.name != "posix" or not (self.nice or self.ionice):
+            return
+        thread_id = threading.get_native_id()
+        with self._lock:
+            if thread_id in self._prioritized:
+                return
+            self._prioritized.add(thread_id)
+        if self.nice:
+            try:
+                current = os.getpriority(os.PRIO_PROCESS, thread_id)
+                if self.nice > current:
+                    os.setpriority(os.PRIO_PROCESS, thread_id, self.nice)
+            except OSError as e:
+                self.log(f"⚠ Could not set nice level: {str(e)}\n")
+        if self.ionice and shutil.which("ionice"):
+            io_class, level = IONICE_CLASSES[self.ionice]
+            cmd = ["ionice", "-c", io_class] + (["-n", level] if level else []) + ["-p", str(thread_id)]
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0:
+                self.log(f"⚠ Could not set I/O priority: {result.stderr.strip()}\n")
+
+    def run_meter(self):
+        """A view of this governor that counts one run's bytes; the budget stays shared"""
+        return _RunMeter(self)
+
+    def throughput(self, seconds, bytes_in=None, bytes_out=None):
+        """Effective rates over seconds of archiving, with the time lost to the budget.
+
+        bytes_in and bytes_out default to everything recorded so far.
+        """
+        seconds = max(seconds, 1e-6)
+        with self._lock:
+            bytes_in = self.bytes_in if bytes_in is None else bytes_in
+            bytes_out = self.bytes_out if bytes_out is None else bytes_out
+            return {
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+                'seconds': round(seconds, 3),
+                'read_mb_per_sec': round(bytes_in / seconds / (1024 * 1024), 2),
+                'write_mb_per_sec': round(bytes_out / seconds / (1024 * 1024), 2),
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'paused_seconds': round(self.paused_seconds, 3),
+            }
+
+    def summary(self, seconds, bytes_in=None, bytes_out=None):
+        """One line for the result message"""
+        stats = self.throughput(seconds, bytes_in, bytes_out)
+        line = (
+            f"Throughput: {stats['read_mb_per_sec']:.1f} MB/s read, "
+            f"{stats['write_mb_per_sec']:.1f} MB/s written over {stats['seconds']:.1f}s"
+        )
+        limits = []
+        if self.read_limit:
+            limits.append(f"read {self.read_limit / (1024 * 1024):.1f} MB/s")
+        if self.write_limit:
+            limits.append(f"write {self.write_limit / (1024 * 1024):.1f} MB/s")
+        if self.max_jobs:
+            limits.append(f"{self.max_jobs} jobs")
+        if limits:
+            line += f" (limits: {', '.join(limits)}; throttled {stats['throttled_seconds']:.1f}s)"
+        if stats['paused_seconds']:
+            line += f", paused {stats['paused_seconds']:.0f}s outside the backup window"
+        return line
+
+
+class _RunMeter:
+    """One run's view of a ResourceGovernor that several runs share.
+
+    Pacing, windows and the job cap are the governor's; record() also
+    counts the bytes of this run alone, so its report shows its own rates.
+    """
+
+    def __init__(self, governor):
+        self._governor = governor
+        self._lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __getattr__(self, name):
+        return getattr(self._governor, name)
+
+    def record(self, bytes_in, bytes_out):
+        self._governor.record(bytes_in, bytes_out)
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def throughput(self, seconds):
+        return self._governor.throughput(seconds, self.bytes_in, self.bytes_out)
+
+    def summary(self, seconds):
+        return self._governor.summary(seconds, self.bytes_in, self.bytes_out)
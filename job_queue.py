@@ -0,0 +1,454 @@
+import os
+import json
+import threading
+from datetime import datetime
+from backup_pipeline import BackupError, BackupPipeline, list_source_folders
+from governor import ResourceGovernor
+from journal import BackupJournal, DONE as FOLDER_DONE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Queue state; backup_cli keeps it next to the config file in use
+QUEUE_FILE = "backup_queue.json"
+QUEUE_VERSION = 1
+
+# Settings of the "queue" block in backup_config.json
+DEFAULT_QUEUE = {
+    'max_jobs': 2,                    # profiles backed up at the same time
+    'per_destination': 1,             # of those, at most this many writing to one destination
+    'destinations': {},               # destination path -> its own limit
+    'report_dir': "batch_reports",    # batch_<id>.json files, relative to the queue file
+}
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"          # every folder backed up
+PARTIAL = "partial"    # some folders failed
+FAILED = "failed"      # nothing backed up, or the run could not start
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, PARTIAL, FAILED, CANCELLED)
+
+# Profiles cannot override these; a batch sends one notification with the global settings
+NOTIFICATION_KEYS = (
+    'smtp_server', 'smtp_port', 'email_address', 'email_password', 'recipient_email', 'smtp_starttls',
+)
+
+
+def profile_config(config, name):
+    """Configuration of one profile: its settings merged over the global ones.
+
+    A profile in the "profiles" block names a source_path and
+    destination_path, optionally folders (all subfolders when left out)
+    and any engine setting such as archiver, codec, governor or filters.
+    Its runs go to <destination_path>/<profile>, so incremental bases,
+    retention and throughput history only ever see the profile's own runs
+    even when several profiles share a destination.
+    """
+    profiles = config.get('profiles') or {}
+    if name not in profiles:
+        raise BackupError(f"Unknown profile: {name}")
+    job_config = dict(config)
+    job_config.update(
+        (key, value) for key, value in profiles[name].items() if key not in NOTIFICATION_KEYS
+    )
+    job_config.pop('profiles', None)
+    if job_config.get('destination_path'):
+        job_config['destination_path'] = os.path.join(job_config['destination_path'], name)
+    return job_config
+
+
+def destination_key(path):
+    return os.path.normcase(os.path.abspath(path)) if path else ""
+
+
+def profile_destination(config, name):
+    """Key of the destination a profile writes to, shared with the other profiles there"""
+    return destination_key(((config.get('profiles') or {}).get(name) or {}).get('destination_path'))
+
+
+class JobQueue:
+    """Backup jobs waiting for, or done by, a queue run; kept in backup_queue.json.
+
+    Every change rewrites the file atomically. Jobs are added in batches,
+    one per `queue add`; a batch is reported once all of its jobs are
+    finished. Jobs a killed run left "running" are queued again when the
+    next run starts and continue from their backup's journal.
+    """
+
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        self.jobs = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=QUEUE_FILE):
+        queue = cls(path)
+        if not os.path.exists(path):
+            return queue
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != QUEUE_VERSION:
+            raise ValueError(f"Unsupported queue file version: {data.get('version')}")
+        queue.jobs = data["jobs"]
+        queue.batches = data["batches"]
+        return queue
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": QUEUE_VERSION, "jobs": self.jobs, "batches": self.batches}, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def add(self, profiles):
+        """Queue one job per profile as a new batch; returns the batch"""
+        with self._lock:
+            now = datetime.now().isoformat(timespec="seconds")
+            batch = {
+                'id': max((batch['id'] for batch in self.batches), default=0) + 1,
+                'added': now,
+                'jobs': [],
+                'reported': None,
+            }
+            next_id = max((job['id'] for job in self.jobs), default=0) + 1
+            for job_id, profile in enumerate(profiles, start=next_id):
+                self.jobs.append({
+                    'id': job_id,
+                    'batch': batch['id'],
+                    'profile': profile,
+                    'state': QUEUED,
+                    'added': now,
+                    'started': None,
+                    'finished': None,
+                    'backup_dir': None,
+                    'total_folders': 0,
+                    'success_count': 0,
+                    'error': None,
+                    'message': None,
+                })
+                batch['jobs'].append(job_id)
+            self.batches.append(batch)
+            self._save()
+            return batch
+
+    def update(self, entry, **info):
+        """Change fields of one of the jobs or batches and save"""
+        with self._lock:
+            entry.update(info)
+            self._save()
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started; returns False if there is no such job"""
+        with self._lock:
+            for job in self.jobs:
+                if job['id'] == job_id and job['state'] == QUEUED:
+                    job['state'] = CANCELLED
+                    job['finished'] = datetime.now().isoformat(timespec="seconds")
+                    self._save()
+                    return True
+            return False
+
+    def clear(self):
+        """Forget reported batches and their jobs; returns how many jobs were dropped"""
+        with self._lock:
+            reported = {batch['id'] for batch in self.batches if batch['reported']}
+            kept = [job for job in self.jobs if job['batch'] not in reported]
+            dropped = len(self.jobs) - len(kept)
+            self.jobs = kept
+            self.batches = [batch for batch in self.batches if batch['id'] not in reported]
+            self._save()
+            return dropped
+
+    def requeue_interrupted(self):
+        """Queue again the jobs a run that was killed left running; returns them"""
+        with self._lock:
+            interrupted = [job for job in self.jobs if job['state'] == RUNNING]
+            for job in interrupted:
+                job['state'] = QUEUED
+            if interrupted:
+                self._save()
+            return interrupted
+
+    def queued(self):
+        return [job for job in self.jobs if job['state'] == QUEUED]
+
+    def batch_jobs(self, batch):
+        return [job for job in self.jobs if job['batch'] == batch['id']]
+
+
+class QueueLock:
+    """Exclusive lock on a queue, held by the one `queue run` working on it.
+
+    The lock is an OS file lock on <queue file>.lock, so it is released when
+    the holding process exits or is killed; no stale lock is left behind.
+    """
+
+    def __init__(self, queue_path):
+        self.path = f"{queue_path}.lock"
+        self._file = None
+
+    def acquire(self):
+        """Take the lock without waiting; returns False if another process holds it"""
+        f = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise BackupError("Another queue run is working on this queue")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _JobEvents:
+    """Pipeline event sink of one job; log and status lines name the profile.
+
+    The per-folder progress bars of several runs would only fight each
+    other, so those events are dropped; transfer events carry the profile.
+    """
+
+    def __init__(self, events, profile):
+        self.events = events
+        self.profile = profile
+
+    def put(self, item):
+        kind, payload = item
+        if kind == "log":
+            payload = "".join(
+                f"[{self.profile}] {line}" if line.strip() else line for line in payload.splitlines(True)
+            )
+        elif kind == "status":
+            payload = f"{self.profile}: {payload}"
+        elif kind == "transfer":
+            payload = dict(payload, profile=self.profile)
+        else:
+            return
+        self.events.put((kind, payload))
+
+
+class QueueRunner:
+    """Runs the queued jobs until none is left, several at a time.
+
+    Up to max_jobs pipelines run in parallel, each in its own thread, and
+    at most the destination's limit of them write to the same destination.
+    A job whose destination is busy, or whose profile is already running,
+    waits while later jobs start. When the last job of a batch finishes, the batch
+    report is written and one notification sent for the whole batch.
+
+    All jobs share one ResourceGovernor built from the global config, so
+    its bandwidth caps and max_jobs hold for the queue as a whole. Only a
+    profile with its own "governor" block gets a governor of its own.
+    """
+
+    def __init__(self, queue, config, events, notifier=None, notify=True, max_jobs=None):
+        self.queue = queue
+        self.config = config
+        self.events = events
+        self.notifier = notifier
+        self.notify = notify
+        settings = dict(DEFAULT_QUEUE, **(config.get('queue') or {}))
+        self.max_jobs = max(1, int(max_jobs or settings['max_jobs']))
+        self.per_destination = max(1, int(settings['per_destination']))
+        self.destination_limits = {
+            destination_key(path): max(1, int(limit)) for path, limit in (settings['destinations'] or {}).items()
+        }
+        self.report_dir = os.path.join(os.path.dirname(os.path.abspath(queue.path)), settings['report_dir'])
+        self.governor = None
+        self._cond = threading.Condition()
+        self._running = {}  # job id -> (destination key, profile)
+        self.finished = []  # jobs finished by this run
+
+    def run(self):
+        """Work through the queue; returns the jobs this run finished.
+
+        Raises BackupError if another process is already running the queue.
+        """
+        with QueueLock(self.queue.path):
+            # Holding the lock means no other run is alive, so jobs still
+            # marked running were left behind by a killed one
+            self.queue = JobQueue.load(self.queue.path)
+            return self._run()
+
+    def _run(self):
+        try:
+            self.governor = ResourceGovernor.from_config(
+                self.config, log=lambda text: self.events.put(("log", text))
+            )
+        except (TypeError, ValueError):
+            self.governor = None  # each pipeline reports the invalid settings when it starts
+        for job in self.queue.requeue_interrupted():
+            self.events.put(("log", f"Job {job['id']} ({job['profile']}) was interrupted; queued again\n"))
+        # Batches whose last job finished just before a restart still get their report
+        for batch in self.queue.batches:
+            self._report_if_done(batch)
+        threads = []
+        with self._cond:
+            while True:
+                for job, destination in self._ready():
+                    self._running[job['id']] = (destination, job['profile'])
+                    self.queue.update(job, state=RUNNING, started=datetime.now().isoformat(timespec="seconds"))
+                    thread = threading.Thread(target=self._execute, args=(job,), name=f"job-{job['id']}")
+                    thread.start()
+                    threads.append(thread)
+                if not self._running:
+                    break
+                self._cond.wait()
+        for thread in threads:
+            thread.join()
+        return self.finished
+
+    def _ready(self):
+        """(job, destination key) of the queued jobs that fit into the free slots, in queue order"""
+        ready = []
+        busy = [destination for destination, _ in self._running.values()]
+        profiles = {profile for _, profile in self._running.values()}
+        for job in self.queue.queued():
+            if len(self._running) + len(ready) >= self.max_jobs:
+                break
+            # Two runs of one profile would share its backup series
+            if job['profile'] in profiles:
+                continue
+            destination = profile_destination(self.config, job['profile'])
+            limit = self.destination_limits.get(destination, self.per_destination)
+            if destination and busy.count(destination) >= limit:
+                continue
+            busy.append(destination)
+            profiles.add(job['profile'])
+            ready.append((job, destination))
+        return ready
+
+    def _execute(self, job):
+        try:
+            info = self._run_job(job)
+        except Exception as e:
+            info = {'state': FAILED, 'error': f"Unexpected error: {str(e)}"}
+        info['finished'] = datetime.now().isoformat(timespec="seconds")
+        with self._cond:
+            self.queue.update(job, **info)
+            del self._running[job['id']]
+            self.finished.append(job)
+            self.events.put(("log", f"Job {job['id']} ({job['profile']}) {job['state']}\n"))
+            batch = next(batch for batch in self.queue.batches if batch['id'] == job['batch'])
+            self._report_if_done(batch)
+            self._cond.notify_all()
+
+    def _run_job(self, job):
+        """Back up one profile; returns the job fields to record"""
+        events = _JobEvents(self.events, job['profile'])
+        try:
+            config = profile_config(self.config, job['profile'])
+        except BackupError as e:
+            return {'state': FAILED, 'error': str(e)}
+        own_governor = 'governor' in self.config['profiles'][job['profile']]
+        pipeline = BackupPipeline(
+            config, events, notifier=self.notifier, governor=None if own_governor else self.governor
+        )
+        backup_dir = job['backup_dir']
+        try:
+            journal = BackupJournal.load(backup_dir) if backup_dir else None
+        except (OSError, ValueError):
+            journal = None
+        try:
+            if journal is not None and journal.finished:
+                # Finished just before the queue run was stopped
+                done = sum(1 for entry in journal.folders.values() if entry['state'] == FOLDER_DONE)
+                return self._outcome(len(journal.folders), done)
+            if journal is not None:
+                folders, source_path = pipeline.resume(backup_dir)
+            else:
+                source_path = config.get('source_path', '')
+                folders = config.get('folders') or []
+                if not folders and source_path and os.path.isdir(source_path):
+                    folders = list_source_folders(source_path)
+                backup_dir = pipeline.prepare(source_path, config.get('destination_path', ''), folders)
+                self.queue.update(job, backup_dir=backup_dir)
+        except BackupError as e:
+            events.put(("log", f"Error: {e}\n"))
+            return {'state': FAILED, 'error': str(e)}
+        result = pipeline.run(folders, source_path, backup_dir, notify=False)
+        info = self._outcome(result.total_folders, result.success_count)
+        info['message'] = result.message
+        return info
+
+    @staticmethod
+    def _outcome(total_folders, success_count):
+        if success_count == total_folders:
+            state = DONE
+        elif success_count == 0:
+            state = FAILED
+        else:
+            state = PARTIAL
+        return {'state': state, 'total_folders': total_folders, 'success_count': success_count}
+
+    def _report_if_done(self, batch):
+        """Write the report and send the notification of a batch whose jobs are all finished"""
+        jobs = self.queue.batch_jobs(batch)
+        if batch['reported'] or any(job['state'] not in FINISHED_STATES for job in jobs):
+            return
+        complete = sum(1 for job in jobs if job['state'] == DONE)
+        message = f"Batch {batch['id']}: {complete}/{len(jobs)} profiles backed up completely.\n\n"
+        for job in jobs:
+            message += f"== {job['profile']}: {job['state']}"
+            if job['total_folders']:
+                message += f", {job['success_count']}/{job['total_folders']} folders"
+            message += " ==\n"
+            if job['error']:
+                message += f"{job['error']}\n"
+            message += f"{job['message'] or ''}\n"
+
+        report = {
+            'batch': batch['id'],
+            'added': batch['added'],
+            'finished': datetime.now().isoformat(timespec="seconds"),
+            'profiles': len(jobs),
+            'complete': complete,
+            'jobs': [{key: value for key, value in job.items() if key != 'message'} for job in jobs],
+        }
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            with open(os.path.join(self.report_dir, f"batch_{batch['id']}.json"), "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=4)
+        except OSError as e:
+            self.events.put(("log", f"⚠ Could not write batch report: {str(e)}\n"))
+        self.events.put(("log", f"\n{message}"))
+
+        if self.notify:
+            # The global email settings; profiles cannot change them
+            BackupPipeline(self.config, self.events, notifier=self.notifier).send_email_notification(
+                f"Backup Batch Completed: {complete}/{len(jobs)} profiles", message
+            )
+        self.queue.update(batch, reported=report['finished'])
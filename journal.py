@@ -0,0 +1,158 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+# Written into every Backup_<timestamp> directory while the run is going
+JOURNAL_NAME = "backup_journal.json"
+JOURNAL_VERSION = 1
+
+# Per-folder results of finished folders, read back on resume
+RESUME_DIR_NAME = ".resume"
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+# Settings a resumed run must reuse so its archives match the first part
+JOURNAL_CONFIG_KEYS = (
+    'archiver', 'codec', 'compression_level', 'backup_mode', 'manifest_hash', 'checksum_hash',
+    'storage', 'filters', 'shard_size', 'member_index',
+)
+
+
+def _write_atomic(path, data, compress=False):
+    """Write JSON so a crash leaves either the old or the new file, never half of one"""
+    tmp_path = f"{path}.tmp"
+    opener = gzip.open if compress else open
+    with opener(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, indent=None if compress else 4)
+        f.flush()
+        if not compress:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BackupJournal:
+    """Crash-safe record of how far a backup run got.
+
+    Every state change rewrites backup_journal.json atomically. Folders that
+    finished also leave their manifest, checksum and snapshot entries under
+    .resume/, so a resumed run can write complete metadata without redoing
+    them. The journal is marked finished once the run's metadata is saved.
+    """
+
+    def __init__(self, backup_dir, source_path, folders, config, base=None, created=None):
+        self.backup_dir = backup_dir
+        self.source_path = source_path
+        # Journals written before a key was added leave it to the current config
+        self.config = {key: config[key] for key in JOURNAL_CONFIG_KEYS if key in config}
+        self.base = base
+        self.created = created or datetime.now().isoformat(timespec="seconds")
+        self.finished = False
+        self.folders = {folder: {'state': PENDING} for folder in folders}
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.backup_dir, JOURNAL_NAME)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        _write_atomic(self.path, {
+            "version": JOURNAL_VERSION,
+            "created": self.created,
+            "source_path": self.source_path,
+            "config": self.config,
+            "base": self.base,
+            "finished": self.finished,
+            "folders": self.folders,
+        })
+
+    def mark(self, folder, state, **info):
+        """Record a folder's new state (plus e.g. archive, size, hash) and save"""
+        with self._lock:
+            entry = {'state': state, 'updated': datetime.now().isoformat(timespec="seconds")}
+            entry.update(info)
+            self.folders[folder] = entry
+            self._save()
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+            self._save()
+
+    def state(self, folder):
+        return self.folders.get(folder, {}).get('state', PENDING)
+
+    def save_folder_result(self, folder, result):
+        """Keep a finished folder's metadata for a later resume"""
+        directory = os.path.join(self.backup_dir, RESUME_DIR_NAME)
+        os.makedirs(directory, exist_ok=True)
+        _write_atomic(self._result_path(folder), result, compress=True)
+
+    def load_folder_result(self, folder):
+        path = self._result_path(folder)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def _result_path(self, folder):
+        # Readable, but unique even for names that differ only in odd characters
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in folder)
+        suffix = hashlib.blake2b(folder.encode("utf-8"), digest_size=4).hexdigest()
+        return os.path.join(self.backup_dir, RESUME_DIR_NAME, f"{safe_name}_{suffix}.json.gz")
+
+    def discard_folder_results(self):
+        directory = os.path.join(self.backup_dir, RESUME_DIR_NAME)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    @classmethod
+    def load(cls, backup_dir):
+        """Read the journal of backup_dir; None if it has none"""
+        path = os.path.join(backup_dir, JOURNAL_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != JOURNAL_VERSION:
+            return None
+        journal = cls(backup_dir, data["source_path"], [], data["config"], data.get("base"), data.get("created"))
+        journal.finished = data.get("finished", False)
+        journal.folders = data["folders"]
+        return journal
+
+
+def find_resumable(destination_path):
+    """Backup_<timestamp> directory of an interrupted run, or None.
+
+    Only the newest backup with a journal counts; once a later run has
+    finished, older interrupted ones are not offered any more.
+    """
+    try:
+        names = sorted(
+            (name for name in os.listdir(destination_path) if name.startswith("Backup_")),
+            reverse=True
+        )
+    except OSError:
+        return None
+    for name in names:
+        backup_dir = os.path.join(destination_path, name)
+        try:
+            journal = BackupJournal.load(backup_dir)
+        except (OSError, ValueError):
+            continue
+        if journal is not None:
+            return None if journal.finished else backup_dir
+    return None
@@ -0,0 +1,172 @@
+import os
+import gzip
+import json
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from filters import walk
+
+# Written into every Backup_<timestamp> directory
+MANIFEST_NAME = "backup_manifest.jsonl.gz"
+MANIFEST_VERSION = 1
+
+BACKUP_MODES = ("full", "incremental", "differential")
+HASH_ALGORITHMS = ("blake2b", "sha256")
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path, algorithm):
+    """Hex digest of a file, read in large blocks"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_folder(folder_path, hash_algorithm=None, max_workers=4, file_filter=None, others=None):
+    """Describe every file below folder_path.
+
+    Returns {relative_path: (size, mtime_ns, hash)} where relative paths use
+    forward slashes and hash is None unless hash_algorithm is set. Files and
+    directories rejected by file_filter are left out. Directories and links
+    go into others, as filters.walk() puts them.
+    """
+    entries = {
+        rel_path: (st.st_size, st.st_mtime_ns, None)
+        for rel_path, st in walk(folder_path, file_filter, others)
+    }
+
+    if hash_algorithm:
+        def digest(rel_path):
+            try:
+                return rel_path, file_digest(os.path.join(folder_path, rel_path), hash_algorithm)
+            except OSError:
+                return rel_path, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for rel_path, hexdigest in pool.map(digest, list(entries)):
+                size, mtime, _ = entries[rel_path]
+                entries[rel_path] = (size, mtime, hexdigest)
+    return entries
+
+
+def changed_files(current, previous):
+    """Relative paths in current that are new or differ from previous.
+
+    Files are compared by size and mtime, and by hash when both sides have one.
+    """
+    changed = []
+    for rel_path, (size, mtime, digest) in current.items():
+        old = previous.get(rel_path)
+        if old is None or old[0] != size:
+            changed.append(rel_path)
+        elif digest and old[2]:
+            if digest != old[2]:
+                changed.append(rel_path)
+        elif old[1] != mtime:
+            changed.append(rel_path)
+    return sorted(changed)
+
+
+class Manifest:
+    """State of every backed up file in one Backup_<timestamp> directory.
+
+    The manifest always lists the complete source state at backup time, even
+    for incremental runs, so the next run can diff against it directly.
+    Stored as gzipped JSON lines: a header line followed by one line per file.
+    Folders without files have no lines, so the header lists them.
+    """
+
+    def __init__(self, mode="full", base=None, hash_algorithm=None, created=None):
+        self.mode = mode
+        self.base = base
+        self.hash_algorithm = hash_algorithm
+        self.created = created or datetime.now().isoformat(timespec="seconds")
+        self.folders = {}
+        self.deleted = {}
+
+    def set_folder(self, folder, entries, deleted=()):
+        self.folders[folder] = entries
+        if deleted:
+            self.deleted[folder] = sorted(deleted)
+
+    def save(self, backup_dir):
+        path = os.path.join(backup_dir, MANIFEST_NAME)
+        tmp_path = f"{path}.tmp"
+        header = {
+            "version": MANIFEST_VERSION,
+            "mode": self.mode,
+            "base": self.base,
+            "hash": self.hash_algorithm,
+            "created": self.created,
+            "deleted": self.deleted,
+            "empty": sorted(folder for folder, entries in self.folders.items() if not entries),
+        }
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(json.dumps(header) + "\n")
+            for folder, entries in self.folders.items():
+                for rel_path, (size, mtime, digest) in entries.items():
+                    f.write(json.dumps([folder, rel_path, size, mtime, digest]) + "\n")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, backup_dir):
+        """Load the manifest of a backup directory, or None if it has none"""
+        path = os.path.join(backup_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != MANIFEST_VERSION:
+                return None
+            manifest = cls(header["mode"], header.get("base"), header.get("hash"), header.get("created"))
+            manifest.deleted = header.get("deleted", {})
+            for folder in header.get("empty", ()):
+                manifest.folders[folder] = {}
+            for line in f:
+                folder, rel_path, size, mtime, digest = json.loads(line)
+                manifest.folders.setdefault(folder, {})[rel_path] = (size, mtime, digest)
+        return manifest
+
+
+def read_manifest_header(backup_dir):
+    """Header of a backup's manifest (mode, base, ...) without reading the file list"""
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    return header if header.get("version") == MANIFEST_VERSION else None
+
+
+def find_base_backup(destination_path, mode, exclude=None):
+    """Find the backup an incremental or differential run is compared against.
+
+    Incremental runs use the newest backup with a manifest; differential runs
+    use the newest full backup. Returns (backup_dir_name, manifest) or
+    (None, None) when there is nothing to compare against.
+    """
+    try:
+        names = sorted(
+            (name for name in os.listdir(destination_path)
+             if name.startswith("Backup_") and name != exclude),
+            reverse=True
+        )
+    except OSError:
+        return None, None
+
+    for name in names:
+        try:
+            manifest = Manifest.load(os.path.join(destination_path, name))
+        except (OSError, ValueError, EOFError):
+            continue
+        if manifest is None:
+            continue
+        if mode == "incremental" or manifest.mode == "full":
+            return name, manifest
+    return None, None
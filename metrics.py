@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# Written into every Backup_<timestamp> directory once the run is over
+REPORT_NAME = "backup_report.json"
+REPORT_VERSION = 1
+
+# Stages of a run, in the order they are reported
+STAGES = ("validation", "scan", "compression", "verify", "replication", "retention", "notification")
+
+
+class FolderMetrics:
+    """Timings and sizes of one folder's archive job"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.seconds = 0.0
+        self.stages = {}  # stage -> seconds
+        self.size = 0  # bytes in the folder, of which bytes_in were archived
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.exit_code = None
+        self.success = False
+
+    def to_dict(self):
+        seconds = max(self.seconds, 1e-6)
+        return {
+            'folder': self.folder,
+            'success': self.success,
+            'exit_code': self.exit_code,
+            'seconds': round(self.seconds, 3),
+            'stages': {stage: round(value, 3) for stage, value in self.stages.items()},
+            'size': self.size,
+            'files': self.files,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'files_per_sec': round(self.files / seconds, 1),
+            'mb_per_sec': round(self.bytes_in / seconds / (1024 * 1024), 2),
+        }
+
+
+class RunMetrics:
+    """Per-stage and per-folder instrumentation of one backup run.
+
+    stage() times a block of work. Stages that run on several threads at
+    once report both the summed time ('seconds') and the span from the
+    first start to the last end ('wall'). The result is saved as
+    backup_report.json and can also be written for Prometheus'
+    textfile collector.
+    """
+
+    def __init__(self):
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._start = time.monotonic()
+        self._stages = {}  # stage -> [seconds, first start, last end, count]
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def folder(self, name):
+        with self._lock:
+            return self._folder(name)
+
+    @contextmanager
+    def stage(self, name, folder=None):
+        """Time the block as stage name, for the run and, if given, the folder"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            with self._lock:
+                entry = self._stages.setdefault(name, [0.0, start, end, 0])
+                entry[0] += end - start
+                entry[1] = min(entry[1], start)
+                entry[2] = max(entry[2], end)
+                entry[3] += 1
+                if folder is not None:
+                    stages = self._folder(folder).stages
+                    stages[name] = stages.get(name, 0.0) + end - start
+
+    def _folder(self, name):
+        if name not in self._folders:
+            self._folders[name] = FolderMetrics(name)
+        return self._folders[name]
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._start
+
+    def stages(self):
+        with self._lock:
+            items = sorted(
+                self._stages.items(),
+                key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES)
+            )
+            return {
+                name: {'seconds': round(seconds, 3), 'wall': round(last - first, 3), 'count': count}
+                for name, (seconds, first, last, count) in items
+            }
+
+    def to_dict(self, **run):
+        """The full report; run holds run-level fields such as backup_dir and mode"""
+        with self._lock:
+            folders = [metrics.to_dict() for metrics in self._folders.values()]
+        report = {
+            'version': REPORT_VERSION,
+            'started': self.started,
+            'finished': datetime.now().isoformat(timespec="seconds"),
+            'seconds': round(self.elapsed, 3),
+        }
+        report.update(run)
+        report['stages'] = self.stages()
+        report['folders'] = folders
+        return report
+
+    def save(self, backup_dir, report):
+        path = os.path.join(backup_dir, REPORT_NAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+
+def load_report(backup_dir):
+    """Read the run report of backup_dir; None if it has none"""
+    path = os.path.join(backup_dir, REPORT_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return report if report.get("version") == REPORT_VERSION else None
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def write_textfile(path, report):
+    """Write a report in Prometheus' text format for node_exporter's textfile collector.
+
+    The file is replaced atomically so the collector never reads half of it.
+    It always describes the latest run; backup_run_timestamp_seconds says when
+    that was.
+    """
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    # No per-run label: each metric stays one series that can be graphed over months
+    run = {}
+    throughput = report.get('throughput') or {}
+    metric("backup_run_timestamp_seconds", "Time the backup run finished.", [(run, round(time.time()))])
+    metric("backup_run_duration_seconds", "Wall time of the backup run.", [(run, report['seconds'])])
+    metric("backup_run_folders", "Folders in the backup run.", [(run, report.get('total_folders', 0))])
+    metric("backup_run_folders_succeeded", "Folders backed up successfully.", [(run, report.get('success_count', 0))])
+    metric("backup_run_bytes_read", "Source bytes archived by the run.", [(run, throughput.get('bytes_in', 0))])
+    metric("backup_run_bytes_written", "Archive bytes written by the run.", [(run, throughput.get('bytes_out', 0))])
+    metric(
+        "backup_stage_duration_seconds", "Summed time spent in each stage.",
+        [(dict(run, stage=stage), values['seconds']) for stage, values in report['stages'].items()]
+    )
+    metric(
+        "backup_stage_wall_seconds", "Span from the first start to the last end of each stage.",
+        [(dict(run, stage=stage), values['wall']) for stage, values in report['stages'].items()]
+    )
+    per_folder = (
+        ("backup_folder_duration_seconds", "Wall time of each folder's archive job.", 'seconds'),
+        ("backup_folder_files", "Files archived per folder.", 'files'),
+        ("backup_folder_bytes_read", "Source bytes archived per folder.", 'bytes_in'),
+        ("backup_folder_bytes_written", "Archive bytes written per folder.", 'bytes_out'),
+        ("backup_folder_mb_per_second", "Source MB archived per second per folder.", 'mb_per_sec'),
+        ("backup_folder_success", "1 when the folder was backed up.", 'success'),
+        ("backup_folder_exit_code", "Exit code of each folder's archiver; -1 when it did not run.", 'exit_code'),
+    )
+    for name, help_text, key in per_folder:
+        samples = []
+        for entry in report['folders']:
+            value = entry[key]
+            if key == 'exit_code' and value is None:
+                value = -1
+            samples.append((dict(run, folder=entry['folder']), int(value) if key == 'success' else value))
+        metric(name, help_text, samples)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
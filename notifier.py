@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+
+# Outstanding notifications, one JSON file each; the outbox_dir setting,
+# resolved next to backup_config.json by backup_pipeline.load_config
+OUTBOX_DIR = "backup_outbox"
+
+# A message claimed longer ago than this belonged to a process that died
+# while sending it, and goes back to the outbox
+CLAIM_TIMEOUT = 600
+
+
+class NotificationDispatcher:
+    """Delivers email notifications on a background thread.
+
+    enqueue() writes the message to the outbox directory and returns at once,
+    so a backup never waits for SMTP. The worker thread keeps one SMTP
+    connection open across messages, retries failures with exponential
+    backoff and deletes a message file only after it was delivered. Messages
+    still in the outbox when the process exits are sent on the next start.
+    Messages that fail max_attempts times are moved to outbox/failed.
+
+    The GUI, the CLI and the job queue can share one outbox: a worker claims
+    a message by renaming it to a name of its own before sending it, so each
+    message is sent by one process only.
+
+    SMTP settings are read from config at send time, using the same keys as
+    backup_config.json. STARTTLS is skipped when smtp_starttls is false and
+    login when email_password is empty, e.g. for a local test server.
+    """
+
+    def __init__(self, config, outbox_dir=None, log=None, max_attempts=8,
+                 base_delay=5, max_delay=600, idle_timeout=30):
+        self.config = config
+        outbox_dir = outbox_dir or config.get('outbox_dir') or OUTBOX_DIR
+        self.outbox_dir = outbox_dir
+        self.failed_dir = os.path.join(outbox_dir, "failed")
+        self.log = log or (lambda text: None)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idle_timeout = idle_timeout
+
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._busy = False
+        self._server = None
+        self._last_used = 0
+        self._claim_suffix = f".{os.getpid()}-{uuid.uuid4().hex[:8]}.sending"
+
+    # Public API
+
+    def start(self):
+        """Start the worker thread; picks up messages left from earlier runs"""
+        if self._thread is None:
+            os.makedirs(self.outbox_dir, exist_ok=True)
+            self._recover_claims()
+            self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+            self._thread.start()
+        return self
+
+    def enqueue(self, subject, body):
+        """Persist a message for delivery and wake the worker"""
+        os.makedirs(self.outbox_dir, exist_ok=True)
+        record = {
+            'subject': subject,
+            'body': body,
+            'from': self.config.get('email_address', ''),
+            'to': self.config.get('recipient_email', ''),
+            'created': datetime.now().isoformat(timespec="seconds"),
+            'attempts': 0,
+            'next_attempt': 0,
+        }
+        name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}.json"
+        self._write(os.path.join(self.outbox_dir, name), record)
+        with self._condition:
+            self._condition.notify_all()
+        self.start()
+        return name
+
+    def pending(self):
+        """Number of messages waiting in the outbox"""
+        return len(self._message_files())
+
+    def flush(self, timeout=None):
+        """Wait until the outbox is empty; returns False if timeout ran out first.
+
+        Messages that are only waiting for a retry count as pending.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._busy or self._message_files():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining if remaining is not None else 1)
+        return True
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close()
+
+    # Worker
+
+    def _message_files(self):
+        try:
+            return sorted(
+                name for name in os.listdir(self.outbox_dir) if name.endswith(".json")
+            )
+        except OSError:
+            return []
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                due, wait = self._due_messages()
+                if not due:
+                    if self._server is not None and time.time() - self._last_used > self.idle_timeout:
+                        self._close()
+                    self._condition.wait(min(wait, self.idle_timeout))
+                    continue
+                self._busy = True
+
+            try:
+                for name, _ in due:
+                    self._deliver(name)
+            except Exception as e:
+                self.log(f"\n⚠ Notification error: {str(e)}\n")
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _due_messages(self):
+        """Messages ready to send now, and seconds until the next one is due"""
+        now = time.time()
+        due = []
+        wait = self.idle_timeout
+        for name in self._message_files():
+            try:
+                with open(os.path.join(self.outbox_dir, name), 'r') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if record.get('next_attempt', 0) <= now:
+                due.append((name, record))
+            else:
+                wait = min(wait, record['next_attempt'] - now)
+        return due, max(wait, 0.1)
+
+    def _recover_claims(self):
+        """Put back messages whose sender died before finishing them"""
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.outbox_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.endswith(".sending"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > CLAIM_TIMEOUT:
+                    original = entry.name.split(".json.", 1)[0] + ".json"
+                    os.rename(entry.path, os.path.join(self.outbox_dir, original))
+            except OSError:
+                continue
+
+    def _claim(self, path):
+        """Rename the message to this worker's own name; None if another process got it first"""
+        claimed = path + self._claim_suffix
+        try:
+            os.rename(path, claimed)
+            os.utime(claimed)  # the claim's age counts from now
+            with open(claimed, 'r') as f:
+                return claimed, json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            self._remove(claimed)
+            return None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            self.log(f"\n⚠ Could not remove {path}: {str(e)}\n")
+
+    def _deliver(self, name):
+        path = os.path.join(self.outbox_dir, name)
+        claim = self._claim(path)
+        if claim is None:
+            return
+        claimed, record = claim
+        if record.get('next_attempt', 0) > time.time():
+            # Another process failed it meanwhile and scheduled a retry
+            os.replace(claimed, path)
+            return
+        try:
+            self._send(record)
+        except Exception as e:
+            self._close()
+            record['attempts'] += 1
+            record['last_error'] = str(e)
+            if record['attempts'] >= self.max_attempts:
+                os.makedirs(self.failed_dir, exist_ok=True)
+                self._write(os.path.join(self.failed_dir, name), record)
+                self._remove(claimed)
+                self.log(f"\nFailed to send email after {record['attempts']} attempts: {str(e)}\n")
+                return
+            delay = min(self.base_delay * 2 ** (record['attempts'] - 1), self.max_delay)
+            record['next_attempt'] = time.time() + delay
+            self._write(path, record)
+            self._remove(claimed)
+            self.log(f"\nFailed to send email: {str(e)} (retrying in {delay:.0f}s)\n")
+            return
+
+        self._remove(claimed)
+        self.log(f"\nEmail notification sent to {record['to']}\n")
+
+    def _send(self, record):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        msg = MIMEMultipart()
+        msg['From'] = record['from']
+        msg['To'] = record['to']
+        msg['Subject'] = record['subject']
+        msg.attach(MIMEText(record['body'], 'plain'))
+        self._connection().send_message(msg)
+        self._last_used = time.time()
+
+    def _connection(self):
+        """Reuse the open SMTP connection if the server still answers"""
+        import smtplib
+
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close()
+
+        config = self.config
+        server = smtplib.SMTP(config['smtp_server'], int(config['smtp_port']), timeout=30)
+        try:
+            if config.get('smtp_starttls', True):
+                server.starttls()
+            if config.get('email_password'):
+                server.login(config['email_address'], config['email_password'])
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        return server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+
+    @staticmethod
+    def _write(path, record):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f, indent=4)
+        os.replace(tmp_path, path)
@@ -0,0 +1,143 @@
+import time
+import threading
+
+# Smoothing factor of the throughput average; higher follows changes faster
+RATE_SMOOTHING = 0.3
+
+# Least time between two throughput samples and between two transfer events
+SAMPLE_INTERVAL = 0.5
+
+
+def format_duration(seconds):
+    """Short human form of a duration: 45s, 3m 12s, 2h 05m"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+def format_transfer(transfer):
+    """One line describing a "transfer" event payload"""
+    line = (
+        f"{transfer['bytes_done'] / (1024 * 1024):.1f}/{transfer['total_bytes'] / (1024 * 1024):.1f} MB, "
+        f"{transfer['files_done']}/{transfer['total_files']} files"
+    )
+    if transfer['bytes_per_sec']:
+        line += f", {transfer['bytes_per_sec'] / (1024 * 1024):.1f} MB/s"
+    if transfer['eta_seconds'] is not None:
+        line += f", ETA {format_duration(transfer['eta_seconds'])}"
+    return line
+
+
+class TransferProgress:
+    """Byte-accurate progress of a run, fed by the archive engines.
+
+    Each job reports the source bytes it has read so far, the files it has
+    finished and the file it is on. The overall percentage is bytes done
+    over the bytes the run has to read. Throughput is an exponentially
+    weighted moving average sampled every SAMPLE_INTERVAL seconds, and the
+    ETA is the remaining bytes at that rate. Events go out at most once per
+    interval, besides the job_progress updates the GUI shows per folder.
+    """
+
+    def __init__(self, events, folders):
+        """folders: {folder: (file count, bytes)} still to be archived"""
+        self.events = events
+        self._totals = {folder: list(totals) for folder, totals in folders.items()}
+        self._parts = {}  # (folder, part) -> [bytes done, files done]
+        self._finished = set()
+        self._current = None
+        self._lock = threading.Lock()
+        self._rate = None
+        self._sample_time = time.monotonic()
+        self._sample_bytes = 0
+        self._emitted = 0.0
+
+    def set_folder(self, folder, files, size):
+        """Correct what a folder has to archive once its scan is done"""
+        with self._lock:
+            self._totals[folder] = [files, size]
+
+    def update(self, folder, done_bytes, files_done=None, current=None, part=None):
+        """A job's source bytes read so far, files finished and current file"""
+        with self._lock:
+            entry = self._parts.setdefault((folder, part), [0, 0])
+            entry[0] = done_bytes
+            if files_done is not None:
+                entry[1] = files_done
+            if current is not None:
+                self._current = current
+            fraction = self._folder_fraction(folder)
+            transfer = self._sample()
+        self.events.put(("job_progress", (folder, fraction)))
+        if transfer is not None:
+            self._emit(transfer)
+
+    def finish(self, folder):
+        """A folder is done (archived, unchanged, failed or finished before a resume)"""
+        with self._lock:
+            self._finished.add(folder)
+            transfer = self._sample(force=True)
+        self.events.put(("job_progress", (folder, 1.0)))
+        self._emit(transfer)
+
+    def _folder_fraction(self, folder):
+        size = self._totals.get(folder, (0, 0))[1]
+        done = sum(entry[0] for (name, _), entry in self._parts.items() if name == folder)
+        return min(done / size, 1.0) if size else 0.0
+
+    def _done(self):
+        """(bytes, files) done over the whole run; finished folders count in full"""
+        done_bytes, done_files = 0, 0
+        for folder, (files, size) in self._totals.items():
+            if folder in self._finished:
+                done_bytes += size
+                done_files += files
+        for (folder, _), (part_bytes, part_files) in self._parts.items():
+            if folder not in self._finished:
+                done_bytes += part_bytes
+                done_files += part_files
+        return done_bytes, done_files
+
+    def _sample(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._emitted < SAMPLE_INTERVAL:
+            return None
+        self._emitted = now
+        done_bytes, done_files = self._done()
+        elapsed = now - self._sample_time
+        if elapsed >= SAMPLE_INTERVAL:
+            rate = max(done_bytes - self._sample_bytes, 0) / elapsed
+            self._rate = rate if self._rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self._rate
+            self._sample_time = now
+            self._sample_bytes = done_bytes
+        total_bytes = sum(size for _, size in self._totals.values())
+        total_files = sum(files for files, _ in self._totals.values())
+        remaining = max(total_bytes - done_bytes, 0)
+        if not remaining:
+            eta = 0
+        elif self._rate:
+            eta = round(remaining / self._rate)
+        else:
+            eta = None
+        if total_bytes:
+            percent = done_bytes / total_bytes * 100
+        else:
+            # Nothing to read (e.g. only unchanged folders): go by folders
+            percent = len(self._finished & set(self._totals)) / max(len(self._totals), 1) * 100
+        return {
+            'percent': round(min(percent, 100.0), 2),
+            'bytes_done': done_bytes,
+            'total_bytes': total_bytes,
+            'files_done': done_files,
+            'total_files': total_files,
+            'current': self._current,
+            'bytes_per_sec': round(self._rate or 0.0),
+            'eta_seconds': eta,
+        }
+
+    def _emit(self, transfer):
+        self.events.put(("progress", transfer['percent']))
+        self.events.put(("transfer", transfer))
@@ -0,0 +1,512 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import importlib.util
+from urllib.parse import unquote, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from governor import TokenBucket
+from archivers import ARCHIVE_EXTENSIONS
+from shards import SHARDS_SUFFIX
+from archive_index import INDEX_SUFFIX
+from metrics import REPORT_NAME
+
+# Settings of the "replication" block in backup_config.json
+DEFAULT_REPLICATION = {
+    'target': '',                # "s3://bucket/prefix" or "sftp://user@host:22/path"; empty = off
+    'endpoint_url': '',          # S3-compatible endpoint, e.g. "http://localhost:9000" for MinIO
+    'region': '',
+    'access_key': '',            # S3 credentials; empty = boto3's own lookup (env, profile, role)
+    'secret_key': '',
+    'password': '',              # SFTP password, or the passphrase of key_file
+    'key_file': '',              # SFTP private key
+    'trust_unknown_hosts': False,  # SFTP: accept host keys that are not in known_hosts
+    'part_size': 32 * 1024 * 1024,  # bytes per upload part
+    'max_workers': 4,            # parts uploaded at the same time
+    'max_archives': 2,           # archives uploaded at the same time
+    'bytes_per_sec': 0,          # upload bandwidth cap, 0 = unlimited
+    'verify': True,              # compare part and object checksums with the target's
+}
+
+# Upload progress of every archive, kept in the backup folder for resuming
+STATE_NAME = "replication_state.json"
+
+# S3 rejects parts below 5 MB (except the last) and uploads of more than 10000 parts
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Attempts per part before the archive counts as failed, and the pause after the first
+PART_ATTEMPTS = 3
+RETRY_DELAY = 2.0
+
+# Backup metadata sent after the archives, so a replica can be restored and verified
+METADATA_FILES = ("backup_manifest.jsonl.gz", "backup_checksums.json.gz", REPORT_NAME)
+
+
+class ReplicationError(Exception):
+    """Raised when the replication target is misconfigured or an upload does not check out"""
+
+
+def parse_target(url):
+    """(scheme, host, port, user, path) of a target URL; raises ReplicationError"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("s3", "sftp") or not parts.hostname:
+        raise ReplicationError(f"Unsupported replication target {url!r}, expected s3://bucket/prefix or sftp://host/path")
+    # The SDKs take long to import, so they are only looked up here and
+    # imported when a target actually connects
+    if parts.scheme == "s3" and importlib.util.find_spec("boto3") is None:
+        raise ReplicationError("s3:// replication needs the 'boto3' package")
+    if parts.scheme == "sftp" and importlib.util.find_spec("paramiko") is None:
+        raise ReplicationError("sftp:// replication needs the 'paramiko' package")
+    user = unquote(parts.username) if parts.username else None
+    return parts.scheme, parts.hostname, parts.port, user, unquote(parts.path).strip("/")
+
+
+def replicable_files(backup_dir):
+    """Names in backup_dir a replica needs: the archives, then the shard lists, member indexes and metadata"""
+    names = sorted(os.listdir(backup_dir))
+    archives = [name for name in names if name.endswith(ARCHIVE_EXTENSIONS)]
+    metadata = [name for name in names if name in METADATA_FILES or name.endswith((SHARDS_SUFFIX, INDEX_SUFFIX))]
+    return archives + metadata
+
+
+class S3Target:
+    """Multipart uploads to S3 or an S3-compatible store such as MinIO.
+
+    Every part is sent with its MD5 so the store rejects corrupted data,
+    and the returned ETags are compared with the local MD5s. One boto3
+    client serves all threads; its connection pool is sized to them.
+    """
+
+    min_part_size = S3_MIN_PART_SIZE
+    url = ""
+
+    def __init__(self, bucket, prefix, client, verify=True):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+        self.verify = verify
+
+    @classmethod
+    def connect(cls, host, path, settings):
+        import boto3
+        from botocore.config import Config as BotoConfig
+
+        client = boto3.client(
+            "s3",
+            endpoint_url=settings['endpoint_url'] or None,
+            region_name=settings['region'] or None,
+            aws_access_key_id=settings['access_key'] or None,
+            aws_secret_access_key=settings['secret_key'] or None,
+            config=BotoConfig(
+                max_pool_connections=int(settings['max_workers']) + int(settings['max_archives']),
+                retries={'max_attempts': 5, 'mode': 'standard'}
+            )
+        )
+        return cls(host, path, client, settings['verify'])
+
+    def key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    @staticmethod
+    def part_token(data):
+        return hashlib.md5(data).hexdigest()
+
+    def _check_etag(self, response, expected, what):
+        etag = response["ETag"].strip('"')
+        if self.verify and etag != expected:
+            raise ReplicationError(f"Checksum mismatch on {what}: sent {expected}, stored {etag}")
+        return etag
+
+    def put(self, key, data):
+        digest = hashlib.md5(data)
+        response = self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=data, ContentMD5=base64.b64encode(digest.digest()).decode()
+        )
+        self._check_etag(response, digest.hexdigest(), key)
+
+    def start(self, key, size, resume=None):
+        """(upload id, {part number: token} already stored) for a new or resumed upload"""
+        if resume and resume.get('upload_id'):
+            try:
+                stored = {}
+                paginator = self.client.get_paginator("list_parts")
+                for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=resume['upload_id']):
+                    for part in page.get("Parts", []):
+                        stored[part["PartNumber"]] = part["ETag"].strip('"')
+                return resume['upload_id'], stored
+            except self.client.exceptions.ClientError:
+                pass  # expired or aborted: start over
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        return response["UploadId"], {}
+
+    def put_part(self, key, upload_id, number, offset, data):
+        digest = hashlib.md5(data)
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data,
+            ContentMD5=base64.b64encode(digest.digest()).decode()
+        )
+        return self._check_etag(response, digest.hexdigest(), f"{key} part {number}")
+
+    def finish(self, key, upload_id, tokens, size):
+        numbers = sorted(tokens)
+        response = self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': f'"{tokens[number]}"'} for number in numbers]}
+        )
+        # A multipart ETag is the MD5 of the part MD5s, followed by the part count
+        expected = hashlib.md5(b"".join(bytes.fromhex(tokens[number]) for number in numbers)).hexdigest()
+        self._check_etag(response, f"{expected}-{len(numbers)}", key)
+        stored = self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        if stored != size:
+            raise ReplicationError(f"{key} is {stored} bytes on the target, expected {size}")
+
+    def abort(self, key, upload_id):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+        except self.client.exceptions.ClientError:
+            pass
+
+    def close(self):
+        pass
+
+
+class SFTPTarget:
+    """Parallel writes into one remote file over a single SSH connection.
+
+    Each thread opens its own SFTP channel on the shared transport and
+    writes its parts at their offsets into <name>.partial, which is renamed
+    once every part is in place. With verify on, each part is read back and
+    compared with the local hash, since SFTP has no server-side checksums.
+    """
+
+    min_part_size = 1024 * 1024
+    url = ""
+
+    def __init__(self, root, client, verify=True):
+        self.root = root
+        self.client = client
+        self.verify = verify
+        self._local = threading.local()
+        self._channels = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, host, port, user, path, settings):
+        import paramiko
+
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        if settings['trust_unknown_hosts']:
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        else:
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+        client.connect(
+            host, port=port or 22, username=user,
+            password=settings['password'] or None,
+            passphrase=settings['password'] or None,
+            key_filename=settings['key_file'] or None
+        )
+        return cls("/" + path, client, settings['verify'])
+
+    def _sftp(self):
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None:
+            sftp = self._local.sftp = self.client.open_sftp()
+            with self._lock:
+                self._channels.append(sftp)
+        return sftp
+
+    def key(self, name):
+        return f"{self.root.rstrip('/')}/{name}"
+
+    @staticmethod
+    def part_token(data):
+        return hashlib.blake2b(data).hexdigest()
+
+    def _makedirs(self, path):
+        sftp = self._sftp()
+        current = ""
+        for part in path.strip("/").split("/")[:-1]:
+            current += "/" + part
+            try:
+                sftp.stat(current)
+            except IOError:
+                sftp.mkdir(current)
+
+    def _rename(self, source, target):
+        sftp = self._sftp()
+        try:
+            sftp.posix_rename(source, target)
+        except IOError:
+            # Servers without the posix-rename extension refuse to overwrite
+            try:
+                sftp.remove(target)
+            except IOError:
+                pass
+            sftp.rename(source, target)
+
+    def put(self, key, data):
+        upload_id, _ = self.start(key, len(data))
+        token = self.put_part(key, upload_id, 1, 0, data)
+        self.finish(key, upload_id, {1: token}, len(data))
+
+    def start(self, key, size, resume=None):
+        partial = f"{key}.partial"
+        if resume and resume.get('upload_id') == partial:
+            try:
+                self._sftp().stat(partial)
+                return partial, {int(number): token for number, token in resume['parts'].items()}
+            except IOError:
+                pass
+        self._makedirs(key)
+        with self._sftp().open(partial, "wb"):
+            pass
+        return partial, {}
+
+    def put_part(self, key, upload_id, number, offset, data):
+        with self._sftp().open(upload_id, "r+b") as f:
+            f.set_pipelined(True)
+            f.seek(offset)
+            f.write(data)
+        token = self.part_token(data)
+        if self.verify:
+            with self._sftp().open(upload_id, "rb") as f:
+                f.seek(offset)
+                stored = self.part_token(f.read(len(data)))
+            if stored != token:
+                raise ReplicationError(f"Checksum mismatch on {key} part {number}")
+        return token
+
+    def finish(self, key, upload_id, tokens, size):
+        stored = self._sftp().stat(upload_id).st_size
+        if stored != size:
+            raise ReplicationError(f"{key} is {stored} bytes on the target, expected {size}")
+        self._rename(upload_id, key)
+
+    def abort(self, key, upload_id):
+        try:
+            self._sftp().remove(upload_id)
+        except IOError:
+            pass
+
+    def close(self):
+        with self._lock:
+            for sftp in self._channels:
+                sftp.close()
+        self.client.close()
+
+
+def connect_target(settings):
+    """Open the target named by settings['target']"""
+    scheme, host, port, user, path = parse_target(settings['target'])
+    if scheme == "s3":
+        target = S3Target.connect(host, path, settings)
+    else:
+        target = SFTPTarget.connect(host, port, user, path, settings)
+    target.url = settings['target']
+    return target
+
+
+class Replicator:
+    """Copies a backup folder's archives to the off-site target as they are finished.
+
+    submit() queues one file of backup_dir; up to max_archives files are
+    uploaded at once, each in parts of part_size sent by a shared pool of
+    max_workers threads under one bandwidth cap. Finished parts are
+    recorded per target in replication_state.json, so an interrupted
+    upload (or a resumed backup run) continues with the parts that are
+    missing and files that were already replicated are skipped.
+    """
+
+    def __init__(self, target, backup_dir, part_size=DEFAULT_REPLICATION['part_size'], max_workers=4,
+                 max_archives=2, bytes_per_sec=0, log=None):
+        self.target = target
+        self.backup_dir = backup_dir
+        self.part_size = max(int(part_size), target.min_part_size)
+        self.log = log or (lambda text: None)
+        self._bucket = TokenBucket(bytes_per_sec) if bytes_per_sec else None
+        self._archives = ThreadPoolExecutor(max_workers=max(1, int(max_archives)), thread_name_prefix="replicate")
+        self._parts = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="replicate-part")
+        self._lock = threading.Lock()
+        self._futures = []
+        self._submitted = set()
+        self._state_path = os.path.join(backup_dir, STATE_NAME)
+        self._state = self._load_state()
+        self._started = None
+        self._ended = None
+        self.replicated = []
+        self.skipped = []
+        self.failed = []
+        self.bytes_sent = 0
+
+    @classmethod
+    def from_config(cls, config, backup_dir, log=None):
+        """Replicator for backup_dir, or None when no target is configured"""
+        settings = dict(DEFAULT_REPLICATION, **(config.get('replication') or {}))
+        if not settings['target']:
+            return None
+        target = connect_target(settings)
+        return cls(
+            target,
+            backup_dir,
+            settings['part_size'],
+            settings['max_workers'],
+            settings['max_archives'],
+            settings['bytes_per_sec'],
+            log
+        )
+
+    @property
+    def prefix(self):
+        return os.path.basename(os.path.normpath(self.backup_dir))
+
+    def _load_state(self):
+        """This target's entries of the state file; other targets keep theirs"""
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                self._all_state = json.load(f)
+        except (OSError, ValueError):
+            self._all_state = {}
+        return self._all_state.setdefault(self.target.url, {})
+
+    def _save_state(self):
+        tmp_path = f"{self._state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._all_state, f, indent=4)
+        os.replace(tmp_path, self._state_path)
+
+    def _update_state(self, name, **changes):
+        with self._lock:
+            self._state.setdefault(name, {}).update(changes)
+            self._save_state()
+
+    def submit(self, name):
+        """Queue backup_dir/name for upload; each name is sent once per run"""
+        with self._lock:
+            if name in self._submitted:
+                return
+            self._submitted.add(name)
+            if self._started is None:
+                self._started = time.monotonic()
+            self._futures.append(self._archives.submit(self._replicate, name))
+
+    def _throttle(self, count):
+        if self._bucket is not None:
+            self._bucket.consume(count)
+
+    def _read(self, path, offset, length):
+        with open(path, "rb", buffering=0) as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _replicate(self, name):
+        path = os.path.join(self.backup_dir, name)
+        key = self.target.key(f"{self.prefix}/{name}")
+        try:
+            st = os.stat(path)
+            with self._lock:
+                entry = dict(self._state.get(name) or {})
+            unchanged = entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns
+            if unchanged and entry.get('done'):
+                with self._lock:
+                    self.skipped.append(name)
+                return
+            if not unchanged:
+                if entry.get('upload_id'):
+                    # The archive was written again since; its old upload is of no use
+                    self.target.abort(key, entry['upload_id'])
+                entry = {}
+
+            if st.st_size <= self.part_size:
+                data = self._read(path, 0, st.st_size)
+                self._throttle(len(data))
+                self.target.put(key, data)
+                sent = len(data)
+            else:
+                sent = self._multipart(name, path, key, st, entry)
+            self._update_state(name, size=st.st_size, mtime_ns=st.st_mtime_ns, done=True, parts={})
+            with self._lock:
+                self.replicated.append(name)
+                self.bytes_sent += sent
+            self.log(f"↑ {name} replicated ({st.st_size / (1024 * 1024):.1f} MB)\n")
+        except Exception as e:
+            with self._lock:
+                self.failed.append(name)
+            self.log(f"⚠ Replication of {name} failed: {str(e)}\n")
+
+    def _multipart(self, name, path, key, st, entry):
+        """Upload path in parallel parts; returns the bytes actually sent"""
+        size = st.st_size
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        resume = entry if entry.get('part_size') == part_size else None
+        upload_id, stored = self.target.start(key, size, resume)
+        if resume is None or resume.get('upload_id') != upload_id:
+            self._update_state(
+                name, size=size, mtime_ns=st.st_mtime_ns, part_size=part_size, upload_id=upload_id,
+                parts={}, done=False
+            )
+
+        def upload(number):
+            offset = (number - 1) * part_size
+            data = self._read(path, offset, part_size)
+            token = self.target.part_token(data)
+            if stored.get(number) == token:
+                return token, 0  # sent before the interruption and intact
+            for attempt in range(PART_ATTEMPTS):
+                try:
+                    self._throttle(len(data))
+                    token = self.target.put_part(key, upload_id, number, offset, data)
+                    break
+                except Exception:
+                    if attempt == PART_ATTEMPTS - 1:
+                        raise
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+            with self._lock:
+                self._state[name]['parts'][str(number)] = token
+                self._save_state()
+            return token, len(data)
+
+        count = -(-size // part_size)
+        results = list(self._parts.map(upload, range(1, count + 1)))
+        self.target.finish(key, upload_id, {number: token for number, (token, _) in enumerate(results, 1)}, size)
+        return sum(sent for _, sent in results)
+
+    def close(self):
+        """Wait for every queued upload; returns the names that failed"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result()
+        self._archives.shutdown(wait=True)
+        self._parts.shutdown(wait=True)
+        self.target.close()
+        self._ended = time.monotonic()
+        return list(self.failed)
+
+    def to_dict(self):
+        with self._lock:
+            started = self._started or time.monotonic()
+            seconds = max((self._ended or time.monotonic()) - started, 1e-6)
+            return {
+                'replicated': len(self.replicated),
+                'skipped': len(self.skipped),
+                'failed': sorted(self.failed),
+                'bytes_sent': self.bytes_sent,
+                'mb_per_sec': round(self.bytes_sent / seconds / (1024 * 1024), 2),
+            }
+
+    def summary(self):
+        """One line for the result message"""
+        stats = self.to_dict()
+        line = (
+            f"Replication: {stats['replicated']} files ({stats['bytes_sent'] / (1024 * 1024):.1f} MB, "
+            f"{stats['mb_per_sec']:.1f} MB/s) to {self.target.url}"
+        )
+        if stats['skipped']:
+            line += f", {stats['skipped']} already there"
+        if stats['failed']:
+            line += f", {len(stats['failed'])} FAILED ({', '.join(stats['failed'])})"
+        return line
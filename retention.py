@@ -0,0 +1,260 @@
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from journal import BackupJournal
+from manifest import read_manifest_header
+
+BACKUP_NAME_FORMAT = "Backup_%Y-%m-%d_%H-%M-%S"
+
+# Settings of the "retention" block in backup_config.json
+DEFAULT_RETENTION = {
+    'enabled': False,        # prune automatically after every backup
+    'daily': 7,              # newest backup of each of the last N days
+    'weekly': 4,             # ... of each of the last N ISO weeks
+    'monthly': 12,           # ... of each of the last N months
+    'max_total_bytes': 0,    # 0 = no cap
+    'dry_run': False,        # only report what would be deleted
+}
+
+
+class BackupRun:
+    """One Backup_<timestamp> directory as retention sees it"""
+
+    def __init__(self, name, path, created, size, mode="full", base=None, finished=True):
+        self.name = name
+        self.path = path
+        self.created = created
+        self.size = size or 0
+        self.mode = mode
+        self.base = base
+        self.finished = finished
+
+
+def _catalog_runs(catalog_path, destination_path):
+    """Recorded metadata of the runs under destination_path, by directory name"""
+    if not catalog_path or not os.path.exists(catalog_path):
+        return {}
+    destination = os.path.abspath(destination_path)
+    runs = {}
+    try:
+        with closing(sqlite3.connect(catalog_path)) as connection:
+            rows = connection.execute(
+                "SELECT runs.backup_dir, runs.mode, runs.base, runs.finished, "
+                "SUM(archives.size), COUNT(archives.id), COUNT(archives.size) "
+                "FROM runs LEFT JOIN archives ON archives.run_id = runs.id GROUP BY runs.id"
+            ).fetchall()
+    except sqlite3.Error:
+        return {}
+    for backup_dir, mode, base, finished, size, archives, sized in rows:
+        # Runs recorded before archive sizes were kept fall back to the directory
+        if os.path.dirname(backup_dir) == destination and finished and sized == archives:
+            runs[os.path.basename(backup_dir)] = (mode, base, size)
+    return runs
+
+
+def _directory_run(name, path, created):
+    """Metadata of a run the catalog does not know, from its own files.
+
+    Backup directories are flat, so one scandir sizes them.
+    """
+    size = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                size += entry.stat(follow_symlinks=False).st_size
+    try:
+        header = read_manifest_header(path) or {}
+    except (OSError, ValueError, EOFError):
+        header = {}
+    try:
+        journal = BackupJournal.load(path)
+    except (OSError, ValueError):
+        journal = None
+    finished = journal is None or journal.finished
+    return BackupRun(name, path, created, size, header.get("mode", "full"), header.get("base"), finished)
+
+
+def list_runs(destination_path, catalog_path=None):
+    """Every Backup_<timestamp> directory under destination_path, newest first"""
+    recorded = _catalog_runs(catalog_path, destination_path)
+    runs = []
+    for name in os.listdir(destination_path):
+        path = os.path.join(destination_path, name)
+        try:
+            created = datetime.strptime(name, BACKUP_NAME_FORMAT)
+        except ValueError:
+            continue
+        if not os.path.isdir(path):
+            continue
+        if name in recorded:
+            mode, base, size = recorded[name]
+            runs.append(BackupRun(name, path, created, size, mode, base))
+        else:
+            try:
+                runs.append(_directory_run(name, path, created))
+            except OSError:
+                continue
+    runs.sort(key=lambda run: run.created, reverse=True)
+    return runs
+
+
+class RetentionPlan:
+    """Which runs to keep (with the reasons) and which to delete"""
+
+    def __init__(self, runs, keep):
+        self.runs = runs
+        self.keep = keep  # run name -> list of reasons
+        self.delete = [run for run in runs if run.name not in keep]
+
+    @property
+    def kept_bytes(self):
+        return sum(run.size for run in self.runs if run.name in self.keep)
+
+    @property
+    def freed_bytes(self):
+        return sum(run.size for run in self.delete)
+
+
+class RetentionPolicy:
+    """Grandfather-father-son retention with an optional total size cap.
+
+    The newest finished backup and every unfinished one are always kept,
+    and so is every backup an incremental or differential backup that is
+    kept was based on.
+    """
+
+    def __init__(self, daily=7, weekly=4, monthly=12, max_total_bytes=0):
+        self.daily = int(daily)
+        self.weekly = int(weekly)
+        self.monthly = int(monthly)
+        self.max_total_bytes = int(max_total_bytes or 0)
+
+    @classmethod
+    def from_config(cls, config):
+        settings = dict(DEFAULT_RETENTION, **(config.get('retention') or {}))
+        return cls(settings['daily'], settings['weekly'], settings['monthly'], settings['max_total_bytes'])
+
+    def plan(self, runs):
+        keep = {}
+        finished = [run for run in runs if run.finished]
+        by_name = {run.name: run for run in runs}
+
+        if finished:
+            keep[finished[0].name] = ["latest"]
+        # An unfinished run may still be going (the job queue runs several
+        # at once) or be resumed, so it is never deleted
+        for run in runs:
+            if not run.finished:
+                keep[run.name] = ["unfinished"]
+
+        buckets = (
+            ("daily", self.daily, lambda created: created.date()),
+            ("weekly", self.weekly, lambda created: created.isocalendar()[:2]),
+            ("monthly", self.monthly, lambda created: (created.year, created.month)),
+        )
+        for reason, count, bucket in buckets:
+            seen = set()
+            for run in finished:
+                key = bucket(run.created)
+                if key in seen:
+                    continue
+                if len(seen) >= count:
+                    break
+                seen.add(key)
+                keep.setdefault(run.name, []).append(reason)
+
+        self._keep_bases(keep, by_name)
+        if self.max_total_bytes:
+            self._apply_cap(keep, runs, by_name, finished[0].name if finished else None)
+        return RetentionPlan(runs, keep)
+
+    @staticmethod
+    def _keep_bases(keep, by_name):
+        pending = list(keep)
+        while pending:
+            run = by_name[pending.pop()]
+            if run.base and run.base in by_name:
+                if run.base not in keep:
+                    pending.append(run.base)
+                keep.setdefault(run.base, []).append(f"base of {run.name}")
+
+    def _apply_cap(self, keep, runs, by_name, latest):
+        """Drop the oldest kept runs until the cap is met; bases go last"""
+        total = sum(by_name[name].size for name in keep)
+        removed = True
+        while total > self.max_total_bytes and removed:
+            removed = False
+            needed = {by_name[name].base for name in keep}
+            for run in reversed(runs):
+                if run.name in keep and run.name != latest and run.name not in needed and run.finished:
+                    del keep[run.name]
+                    total -= run.size
+                    removed = True
+                    break
+
+
+def _forget_runs(catalog_path, paths):
+    with closing(sqlite3.connect(catalog_path, timeout=30)) as connection, connection:
+        for path in paths:
+            run = connection.execute("SELECT id FROM runs WHERE backup_dir = ?", (path,)).fetchone()
+            if run is None:
+                continue
+            connection.execute(
+                "DELETE FROM files WHERE archive_id IN (SELECT id FROM archives WHERE run_id = ?)", run
+            )
+            connection.execute("DELETE FROM archives WHERE run_id = ?", run)
+            connection.execute("DELETE FROM runs WHERE id = ?", run)
+
+
+def prune(destination_path, policy, catalog_path=None, dry_run=False, max_workers=4):
+    """Apply policy to destination_path; returns (plan, errors).
+
+    Directories are deleted in parallel and dropped from the catalog. With
+    dry_run nothing is touched and the plan is only reported.
+    """
+    plan = policy.plan(list_runs(destination_path, catalog_path))
+    errors = []
+    if dry_run or not plan.delete:
+        return plan, errors
+
+    def delete(run):
+        try:
+            shutil.rmtree(run.path)
+            return run, None
+        except OSError as e:
+            return run, str(e)
+
+    deleted = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for run, error in pool.map(delete, plan.delete):
+            if error:
+                errors.append(f"{run.name}: {error}")
+            else:
+                deleted.append(os.path.abspath(run.path))
+
+    if deleted and catalog_path and os.path.exists(catalog_path):
+        try:
+            _forget_runs(catalog_path, deleted)
+        except sqlite3.Error as e:
+            errors.append(f"catalog: {e}")
+    return plan, errors
+
+
+def format_plan(plan, dry_run=False):
+    """Text report of a plan, one line per run, newest first"""
+    lines = []
+    for run in plan.runs:
+        size = f"{run.size / (1024 ** 3):.2f} GB"
+        if run.name in plan.keep:
+            lines.append(f"  keep    {run.name}  {size}  ({', '.join(plan.keep[run.name])})")
+        else:
+            lines.append(f"  {'would delete' if dry_run else 'delete'}  {run.name}  {size}")
+    verb = "would free" if dry_run else "freed"
+    lines.append(
+        f"{len(plan.delete)} of {len(plan.runs)} backups, {verb} {plan.freed_bytes / (1024 ** 3):.2f} GB; "
+        f"{plan.kept_bytes / (1024 ** 3):.2f} GB kept"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+import os
+import heapq
+import threading
+from statistics import median
+from metrics import load_report
+
+# Newest earlier run reports that past throughput is taken from
+HISTORY_RUNS = 5
+
+# Rate assumed when no earlier run of the same archiver has a report
+DEFAULT_RATE = 50 * 1024 * 1024  # bytes per second
+
+# Fixed cost per file (open, header, metadata) on top of the bytes
+FILE_OVERHEAD_SECONDS = 0.0005
+
+# A job this far off its estimate counts as a re-plan of the remaining queue
+REPLAN_TOLERANCE = 0.25
+
+
+def throughput_history(destination_path, archiver, mode, exclude=None, runs=HISTORY_RUNS):
+    """Past archiving rates from the run reports under destination_path.
+
+    Rates are folder size (not just the changed bytes) per second, so they
+    predict runs of the same mode. Returns ({folder: bytes per second},
+    overall bytes per second or None), using the median over the newest
+    runs made with the same archiver and mode.
+    """
+    try:
+        names = sorted(
+            (name for name in os.listdir(destination_path) if name.startswith("Backup_") and name != exclude),
+            reverse=True
+        )
+    except OSError:
+        return {}, None
+
+    rates = {}
+    total_bytes, total_seconds, used = 0, 0.0, 0
+    for name in names:
+        if used >= runs:
+            break
+        try:
+            report = load_report(os.path.join(destination_path, name))
+        except (OSError, ValueError):
+            continue
+        if report is None or (report.get('archiver'), report.get('mode')) != (archiver, mode):
+            continue
+        used += 1
+        for entry in report.get('folders', []):
+            # Failed folders say nothing about the rate
+            if entry.get('success') and entry.get('size') and entry.get('seconds'):
+                rates.setdefault(entry['folder'], []).append(entry['size'] / entry['seconds'])
+                total_bytes += entry['size']
+                total_seconds += entry['seconds']
+    overall = total_bytes / total_seconds if total_seconds else None
+    return {folder: median(values) for folder, values in rates.items()}, overall
+
+
+class FolderScheduler:
+    """Longest-processing-time-first order of a run's folders.
+
+    Each folder's cost is estimated from its size and file count and the
+    rate it was archived at in earlier runs. next() always hands out the
+    most expensive remaining folder, so the big ones start early and no
+    giant folder is left for last. As jobs finish, the estimates are
+    corrected by how far this run is off the history, which may reorder
+    the rest of the queue.
+    """
+
+    def __init__(self, folders, workers, history=None, overall_rate=None):
+        """folders: {folder: (file count, bytes)}"""
+        self.folders = dict(folders)
+        self.workers = max(1, workers)
+        self.history = history or {}
+        self.default_rate = overall_rate or DEFAULT_RATE
+        self._pending = set(self.folders)
+        self._actual = {}
+        self._observed_bytes = 0
+        self._observed_seconds = 0.0
+        self._history_predicted = 0.0
+        self._history_actual = 0.0
+        self.replans = 0
+        self.order = []
+        self._lock = threading.Lock()
+        self._initial = {folder: self.estimate(folder) for folder in self.folders}
+        self.predicted_makespan = self._makespan(self._initial.values())
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _history_estimate(self, folder):
+        count, size = self.folders[folder]
+        return size / self.history[folder] + count * FILE_OVERHEAD_SECONDS
+
+    def estimate(self, folder):
+        """Estimated seconds to archive folder"""
+        if folder in self.history:
+            # Scaled by how much faster or slower this run is than the history so far
+            correction = self._history_actual / self._history_predicted if self._history_predicted else 1.0
+            return self._history_estimate(folder) * correction
+        # Folders without history go at this run's observed rate once there is one
+        rate = self._observed_bytes / self._observed_seconds if self._observed_seconds else self.default_rate
+        count, size = self.folders[folder]
+        return size / rate + count * FILE_OVERHEAD_SECONDS
+
+    def _makespan(self, costs):
+        """Makespan of greedy LPT list scheduling of costs on the workers"""
+        loads = [0.0] * self.workers
+        for cost in sorted(costs, reverse=True):
+            heapq.heappush(loads, heapq.heappop(loads) + cost)
+        return max(loads)
+
+    def next(self):
+        """The remaining folder with the largest estimate, or None"""
+        with self._lock:
+            if not self._pending:
+                return None
+            folder = max(self._pending, key=lambda name: (self.estimate(name), name))
+            self._pending.remove(folder)
+            self.order.append(folder)
+            return folder
+
+    def finished(self, folder, seconds):
+        """Feed back how long a folder's job took"""
+        with self._lock:
+            predicted = self.estimate(folder)
+            self._actual[folder] = seconds
+            if seconds <= 0:
+                return
+            if folder in self.history:
+                self._history_predicted += self._history_estimate(folder)
+                self._history_actual += seconds
+            self._observed_bytes += self.folders[folder][1]
+            self._observed_seconds += seconds
+            if self._pending and predicted and abs(seconds / predicted - 1) > REPLAN_TOLERANCE:
+                self.replans += 1
+
+    def report(self, actual_makespan):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'order': list(self.order),
+                'predicted_makespan': round(self.predicted_makespan, 3),
+                'actual_makespan': round(actual_makespan, 3),
+                'replans': self.replans,
+                'folders': {
+                    folder: {
+                        'predicted': round(self._initial[folder], 3),
+                        'actual': round(self._actual[folder], 3) if folder in self._actual else None,
+                    }
+                    for folder in self.folders
+                },
+            }
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import heapq
+import tarfile
+import zipfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from archivers import ARCHIVE_EXTENSIONS, open_tar_stream
+from archive_index import ArchiveIndex
+
+# Written next to the part archives of a sharded folder: <folder>.shards.json
+SHARDS_SUFFIX = ".shards.json"
+SHARDS_VERSION = 1
+
+
+def plan_shards(sizes, shard_size):
+    """Split a folder's files into balanced shards of about shard_size bytes.
+
+    sizes maps relative paths to file sizes. Top-level subdirectories stay
+    together where they fit; larger ones are cut into ranges of sorted
+    paths. The pieces are then dealt out largest first to the lightest
+    shard. Returns a list of sorted path lists, or None when the files fit
+    into one archive.
+    """
+    total = sum(sizes.values())
+    count = -(-total // shard_size) if shard_size else 1
+    if count < 2:
+        return None
+    target = total / count
+
+    groups = {}
+    for rel_path in sorted(sizes):
+        top = rel_path.split("/", 1)[0] if "/" in rel_path else ""
+        groups.setdefault(top, []).append(rel_path)
+
+    pieces = []
+    for paths in groups.values():
+        piece, piece_size = [], 0
+        for rel_path in paths:
+            if piece and piece_size + sizes[rel_path] > target:
+                pieces.append((piece_size, piece))
+                piece, piece_size = [], 0
+            piece.append(rel_path)
+            piece_size += sizes[rel_path]
+        pieces.append((piece_size, piece))
+
+    shards = [(0, index, []) for index in range(count)]
+    heapq.heapify(shards)
+    for piece_size, piece in sorted(pieces, key=lambda item: item[0], reverse=True):
+        load, index, paths = heapq.heappop(shards)
+        paths.extend(piece)
+        heapq.heappush(shards, (load + piece_size, index, paths))
+    return [sorted(paths) for _, _, paths in sorted(shards, key=lambda item: item[1]) if paths]
+
+
+def shard_archive_name(archiver, folder, index, count):
+    """<folder>.partNN<ext>, numbered from 1"""
+    return f"{folder}.part{index:0{max(2, len(str(count)))}d}{archiver.extension}"
+
+
+def shard_manifest_path(backup_dir, folder):
+    return os.path.join(backup_dir, f"{folder}{SHARDS_SUFFIX}")
+
+
+def save_shard_manifest(backup_dir, folder, shards):
+    """shards: one {'archive', 'files', 'bytes'} per part archive"""
+    path = shard_manifest_path(backup_dir, folder)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SHARDS_VERSION, "folder": folder, "archives": shards}, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def load_shard_manifest(backup_dir, folder):
+    """Part archives of folder in backup_dir, or None if it was not sharded"""
+    path = shard_manifest_path(backup_dir, folder)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["archives"] if data.get("version") == SHARDS_VERSION else None
+
+
+def remove_shards(backup_dir, folder):
+    """Delete the part archives and shard manifest an interrupted run left for folder"""
+    pattern = re.compile(re.escape(folder) + r"\.part\d+\..+$")
+    for name in os.listdir(backup_dir):
+        if pattern.match(name) or name == f"{folder}{SHARDS_SUFFIX}":
+            os.remove(os.path.join(backup_dir, name))
+
+
+def folder_archives(backup_dir, folder):
+    """Archive names that hold folder: its parts when sharded, else its one archive"""
+    shards = load_shard_manifest(backup_dir, folder)
+    if shards is not None:
+        return [shard["archive"] for shard in shards]
+    for extension in ARCHIVE_EXTENSIONS:
+        if os.path.exists(os.path.join(backup_dir, f"{folder}{extension}")):
+            return [f"{folder}{extension}"]
+    return []
+
+
+def extract_archive(archive_path, target_dir, winrar_path=None):
+    """Unpack one archive written by this tool into target_dir"""
+    if archive_path.endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as zf:
+            zf.extractall(target_dir)
+    elif archive_path.endswith(".rar"):
+        if not winrar_path or not os.path.exists(winrar_path):
+            raise OSError(f"WinRAR is needed to extract {os.path.basename(archive_path)}")
+        result = subprocess.run(
+            [winrar_path, "x", "-y", "-o+", archive_path, target_dir + os.sep],
+            stdout=subprocess.DEVNULL
+        )
+        if result.returncode != 0:
+            raise OSError(f"WinRAR failed on {os.path.basename(archive_path)} (Error code: {result.returncode})")
+    else:
+        with open_tar_stream(archive_path) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+            tar.extractall(target_dir, filter="data")
+
+
+def _member_directories(archive_path):
+    """Directories the members of an archive extract into, or None if only reading it would tell.
+
+    The member index lists them; a zip's central directory is cheap to read.
+    WinRAR copes with existing directories itself.
+    """
+    index = ArchiveIndex.load(archive_path)
+    if index is not None:
+        names = [member[0] for member in index.members]
+    elif archive_path.endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as zf:
+            names = zf.namelist()
+    elif archive_path.endswith(".rar"):
+        names = []
+    else:
+        return None
+    directories = set()
+    for name in names:
+        directory = name.rstrip("/") if name.endswith("/") else name.rpartition("/")[0]
+        if directory and not directory.startswith("/") and ".." not in directory.split("/"):
+            directories.add(directory)
+    return directories
+
+
+def restore_folder(backup_dir, folder, target_dir, winrar_path=None, max_workers=None):
+    """Extract every archive of folder into target_dir, parts in parallel.
+
+    Archives contain <folder>/..., so the folder is rebuilt as
+    target_dir/<folder>. The parts share directories, which tarfile and
+    zipfile would race to create, so they are created up front; tar parts
+    without a member index are extracted one after another instead.
+    Returns the number of archives extracted.
+    """
+    names = folder_archives(backup_dir, folder)
+    if not names:
+        raise FileNotFoundError(f"No archive of '{folder}' in {backup_dir}")
+    directories = {folder}
+    groups = []
+    unlisted = []
+    for name in names:
+        found = _member_directories(os.path.join(backup_dir, name))
+        if found is None:
+            unlisted.append(name)
+        else:
+            directories.update(found)
+            groups.append([name])
+    if unlisted:
+        groups.append(unlisted)
+    os.makedirs(target_dir, exist_ok=True)
+    for directory in sorted(directories):
+        os.makedirs(os.path.join(target_dir, *directory.split("/")), exist_ok=True)
+
+    def extract(group):
+        for name in group:
+            extract_archive(os.path.join(backup_dir, name), target_dir, winrar_path)
+
+    max_workers = max_workers or min(len(groups), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for _ in pool.map(extract, groups):
+            pass
+    return len(names)
@@ -0,0 +1,136 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Default location of the on-disk size cache (next to backup_config.json)
+INDEX_FILE = "backup_size_index.json"
+INDEX_VERSION = 1
+
+
+class FolderSizeIndex:
+    """File counts and byte totals per directory, cached on disk.
+
+    Every directory is stored with its own mtime, the number and size of the
+    files directly inside it and its subdirectories. A cached entry is reused
+    as long as the directory mtime has not changed, so a warm rescan costs one
+    stat per directory instead of one per file. Files rewritten in place do
+    not change their directory's mtime; that is acceptable for progress
+    estimates.
+    """
+
+    def __init__(self, cache_path=INDEX_FILE, max_workers=None):
+        self.cache_path = cache_path
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self._dirs = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load the cached index from disk, ignoring a missing or stale file"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self._dirs = data.get('dirs', {})
+        except (OSError, ValueError):
+            self._dirs = {}
+
+    def save(self):
+        """Write the index atomically if anything changed since loading"""
+        if not self.cache_path or not self._dirty:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with self._lock:
+            data = {'version': INDEX_VERSION, 'dirs': self._dirs}
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.cache_path)
+            self._dirty = False
+
+    def _scan_dir(self, path):
+        """Index the files directly inside path and return its subdirectories"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
+
+        cached = self._dirs.get(path)
+        if cached and cached[0] == mtime:
+            return cached[3]
+
+        files = 0
+        size = 0
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            files += 1
+                            size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+        with self._lock:
+            self._dirs[path] = [mtime, files, size, subdirs]
+            self._dirty = True
+        return subdirs
+
+    def scan(self, roots):
+        """Refresh the index for every root in parallel.
+
+        Returns a dict mapping each root to a (file_count, total_bytes) tuple.
+        """
+        roots = [os.path.abspath(root) for root in roots]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {pool.submit(self._scan_dir, root) for root in roots}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for subdir in future.result():
+                        pending.add(pool.submit(self._scan_dir, subdir))
+
+        totals = {}
+        for root in roots:
+            totals[root] = self.totals(root, prune=True)
+        return totals
+
+    def totals(self, root, prune=False):
+        """Sum file counts and bytes below root using the cached entries.
+
+        With prune=True, cached directories below root that are no longer
+        reachable (deleted or renamed) are dropped from the index.
+        """
+        root = os.path.abspath(root)
+        files = 0
+        size = 0
+        seen = set()
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            entry = self._dirs.get(path)
+            if not entry or path in seen:
+                continue
+            seen.add(path)
+            files += entry[1]
+            size += entry[2]
+            stack.extend(entry[3])
+
+        if prune:
+            prefix = root.rstrip(os.sep) + os.sep
+            with self._lock:
+                stale = [path for path in self._dirs
+                         if path.startswith(prefix) and path not in seen]
+                for path in stale:
+                    del self._dirs[path]
+                if stale:
+                    self._dirty = True
+        return files, size
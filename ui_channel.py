@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+
+# Message kinds where only the latest value matters. job_progress payloads
+# are (job, value) pairs and are coalesced per job; the others globally.
+STATE_KINDS = ("progress", "progress_text", "status", "job_progress", "transfer")
+
+
+class Frame:
+    """Everything the GUI has to apply in one refresh"""
+
+    def __init__(self, state, jobs, log, dropped, events):
+        self.state = state        # kind -> latest payload
+        self.jobs = jobs          # job -> latest progress value
+        self.log = log            # all pending log text, joined
+        self.dropped = dropped    # log messages discarded since the last frame
+        self.events = events      # other messages (e.g. messagebox), in order
+
+    def __bool__(self):
+        return bool(self.state or self.jobs or self.log or self.dropped or self.events)
+
+
+class UpdateChannel:
+    """Thread-safe, coalescing replacement for the GUI's message queue.
+
+    Worker threads call put((kind, payload)) exactly as they would on a
+    queue.Queue; put never blocks. The Tk main thread calls drain() once per
+    frame and applies the returned Frame, so:
+
+    - progress values are coalesced to the latest one per job,
+    - log messages are joined into a single insert,
+    - the log backlog is bounded; the oldest messages are dropped first.
+    """
+
+    def __init__(self, max_log_messages=5000):
+        self._lock = threading.Lock()
+        self._state = {}
+        self._jobs = {}
+        self._log = deque(maxlen=max_log_messages)
+        self._dropped = 0
+        self._events = []
+
+    def put(self, item, block=True, timeout=None):
+        kind, payload = item
+        with self._lock:
+            if kind == "log":
+                if len(self._log) == self._log.maxlen:
+                    self._dropped += 1
+                self._log.append(payload)
+            elif kind == "job_progress":
+                job, value = payload
+                self._jobs[job] = value
+            elif kind in STATE_KINDS:
+                self._state[kind] = payload
+            else:
+                self._events.append(item)
+
+    # queue.Queue compatibility for callers that do not care about blocking
+    put_nowait = put
+
+    def drain(self):
+        """Take everything queued since the last call as one Frame"""
+        with self._lock:
+            frame = Frame(
+                self._state,
+                self._jobs,
+                "".join(self._log),
+                self._dropped,
+                self._events
+            )
+            self._state = {}
+            self._jobs = {}
+            self._log.clear()
+            self._dropped = 0
+            self._events = []
+        return frame
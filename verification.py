@@ -0,0 +1,194 @@
+import os
+import gzip
+import json
+import hashlib
+import tarfile
+import zipfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from archivers import BUFFER_SIZE, WinRarArchiver, open_tar_stream
+from manifest import file_digest
+
+# Written next to the archives in every Backup_<timestamp> directory
+CHECKSUMS_NAME = "backup_checksums.json.gz"
+CHECKSUMS_VERSION = 1
+
+
+class FileChecksums:
+    """Hashes of the source files written into one archive, by member name.
+
+    Archivers fill it while they read the sources, so no extra pass over
+    the source folder is needed.
+    """
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def new(self):
+        return hashlib.new(self.algorithm)
+
+    def add(self, arcname, digest):
+        with self._lock:
+            self.files[arcname] = digest.hexdigest()
+
+
+class ChecksumManifest:
+    """Archive and member hashes of one backup, for later verification"""
+
+    def __init__(self, algorithm, created=None):
+        self.algorithm = algorithm
+        self.created = created or datetime.now().isoformat(timespec="seconds")
+        self.archives = {}  # archive name -> {'size', 'hash', 'files': {member: hash}}
+        self._lock = threading.Lock()
+
+    def set_archive(self, name, size, digest, files):
+        with self._lock:
+            self.archives[name] = {'size': size, 'hash': digest, 'files': files}
+
+    def save(self, backup_dir):
+        path = os.path.join(backup_dir, CHECKSUMS_NAME)
+        tmp_path = f"{path}.tmp"
+        data = {
+            "version": CHECKSUMS_VERSION,
+            "algorithm": self.algorithm,
+            "created": self.created,
+            "archives": self.archives,
+        }
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, backup_dir):
+        """Read the checksums of backup_dir; None if it has none"""
+        path = os.path.join(backup_dir, CHECKSUMS_NAME)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        checksums = cls(data["algorithm"], data.get("created"))
+        checksums.archives = data["archives"]
+        return checksums
+
+
+def _member_digests(archive_path, algorithm):
+    """Yield (member name, hex digest) for every regular file in the archive"""
+    if archive_path.endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                digest = hashlib.new(algorithm)
+                with zf.open(info) as member:
+                    for block in iter(lambda: member.read(BUFFER_SIZE), b""):
+                        digest.update(block)
+                yield info.filename, digest.hexdigest()
+    else:
+        # Sequential read: one pass through the compressed stream
+        with open_tar_stream(archive_path) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+            for info in tar:
+                if not info.isreg():
+                    continue
+                digest = hashlib.new(algorithm)
+                member = tar.extractfile(info)
+                for block in iter(lambda: member.read(BUFFER_SIZE), b""):
+                    digest.update(block)
+                yield info.name, digest.hexdigest()
+
+
+def verify_archive(archive_path, algorithm, files, expected_hash=None, archiver=None):
+    """Check one archive against the source hashes recorded for it.
+
+    Returns (archive hash, archive size, problems); problems is an empty
+    list when the archive is intact. RAR archives are tested with WinRAR
+    when archiver is a WinRarArchiver and otherwise only hashed.
+    """
+    problems = []
+    try:
+        size = os.path.getsize(archive_path)
+        archive_hash = file_digest(archive_path, algorithm)
+    except OSError as e:
+        return None, None, [f"cannot read archive: {e}"]
+    if expected_hash and archive_hash != expected_hash:
+        problems.append("archive hash mismatch")
+
+    if archive_path.endswith(".rar"):
+        if isinstance(archiver, WinRarArchiver):
+            try:
+                returncode = archiver.test(archive_path)
+            except OSError as e:
+                problems.append(f"cannot run WinRAR test: {e}")
+                return archive_hash, size, problems
+            if returncode != 0:
+                problems.append(f"WinRAR test failed (Error code: {returncode})")
+        return archive_hash, size, problems
+
+    seen = set()
+    try:
+        for name, digest in _member_digests(archive_path, algorithm):
+            seen.add(name)
+            expected = files.get(name)
+            if expected is None:
+                problems.append(f"unexpected member {name}")
+            elif digest != expected:
+                problems.append(f"checksum mismatch: {name}")
+    except Exception as e:  # any decoder error means a damaged archive
+        problems.append(f"cannot read archive: {e}")
+        return archive_hash, size, problems
+    problems.extend(f"missing member {name}" for name in sorted(set(files) - seen))
+    return archive_hash, size, problems
+
+
+class Verifier:
+    """Verifies finished archives on its own pool while others are written.
+
+    submit() is called from the archiving workers, once per archive of a
+    folder; results() waits for every verification and gives
+    folder -> [(archive name, checksums, archive hash, size, problems), ...].
+    initializer runs once in every pool thread, e.g. to lower its priority.
+    With metrics (a RunMetrics) every check is timed as the "verify" stage.
+    """
+
+    def __init__(self, algorithm, max_workers=1, archiver=None, initializer=None, metrics=None):
+        self.algorithm = algorithm
+        self.archiver = archiver
+        self.metrics = metrics
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="verify", initializer=initializer
+        )
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown(wait=True)
+
+    def submit(self, folder, archive_path, checksums, on_done=None):
+        """Queue an archive; on_done(archive hash, size, problems) runs on the pool"""
+        future = self._pool.submit(self._verify, folder, archive_path, checksums.files)
+        if on_done is not None:
+            future.add_done_callback(lambda finished: on_done(*finished.result()))
+        with self._lock:
+            self._futures.setdefault(folder, []).append((os.path.basename(archive_path), checksums, future))
+        return future
+
+    def _verify(self, folder, archive_path, files):
+        if self.metrics is None:
+            return verify_archive(archive_path, self.algorithm, files, archiver=self.archiver)
+        with self.metrics.stage("verify", folder):
+            return verify_archive(archive_path, self.algorithm, files, archiver=self.archiver)
+
+    def results(self):
+        with self._lock:
+            futures = {folder: list(parts) for folder, parts in self._futures.items()}
+        results = {}
+        for folder, parts in futures.items():
+            results[folder] = [
+                (archive_name, checksums) + tuple(future.result()) for archive_name, checksums, future in parts
+            ]
+        return results